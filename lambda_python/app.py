@@ -1,18 +1,33 @@
-import io
+from __future__ import annotations
+
 import os
 import json
-import requests
 import math
-import joblib
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import pandas as pd
-import geopandas as gpd
-import lightgbm as lgb
-
-from flask_cors import CORS
-from shapely.geometry import shape
-from flask import Flask, render_template_string, url_for, send_file, abort, request, jsonify, Response
+import curvature
+import heatmap
+import holiday_calendar
+import model_artifact
+import projection
+import responses
+import solar
+import startup
+import tracing
+import upstream
+from cache import make_cache, quantize, ttl_from_headers
+from feature_encoder import FeatureEncoder, fixed_curvature_bins, quantile_curvature_bins
+from prediction_cache import PredictionCache, artifact_signature
+from route_features import RouteFeatures
+from segments import DEFAULT_SEGMENT_LENGTH, RouteSegments
+from singleflight import SingleFlight
+
+# The heavy dependencies are imported lazily, the first time they're actually used (see startup.py).  On
+# Lambda, _init() loads everything the request path needs during the INIT phase.  Flask is only imported when
+# the web app is created, so the Lambda never pays for it.
+pd = startup.lazy_import('pandas')
+lgb = startup.lazy_import('lightgbm')
 
 # Whitelisted CORS origins
 ALLOWED_ORIGINS = [
@@ -31,116 +46,104 @@ def get_utm_crs(lat: float, lng: float) -> str:
     if abs(lng) > 180.0:
         print(f"Not a valid longitude: {lng}!")
 
-    zone_is_south = lat < 0.0
-    zone = math.ceil((lng + 180.0) / 6.0)
+    zone, south = projection.utm_zone(lat, lng)
+
+    return projection.utm_crs(zone, south)
+
+# Directions Cache
+# Users ask for the same corridors over and over, so the raw Directions responses are cached.  Origins and
+# destinations are rounded before being used as a key (4 decimal places is roughly 11 meters), and entries
+# expire after a day.  Setting DIRECTIONS_CACHE_PATH adds an on-disk SQLite store behind the in-process LRU.
+DIRECTIONS_CACHE_PRECISION = int(os.environ.get('DIRECTIONS_CACHE_PRECISION', '4'))
+DIRECTIONS_CACHE_TTL = float(os.environ.get('DIRECTIONS_CACHE_TTL', '86400'))
+DIRECTIONS_CACHE_SIZE = int(os.environ.get('DIRECTIONS_CACHE_SIZE', '256'))
+
+_directions_cache = make_cache(
+    maxsize=DIRECTIONS_CACHE_SIZE,
+    ttl=DIRECTIONS_CACHE_TTL,
+    path=os.environ.get('DIRECTIONS_CACHE_PATH')
+)
+
+def directions_cache_key(o_lat: float, o_lng: float, d_lat: float, d_lng: float, alternatives: bool = False) -> str:
+    prefix = "directions-alternatives:" if alternatives else "directions:"
+    return prefix + ",".join(quantize(v, DIRECTIONS_CACHE_PRECISION) for v in (o_lat, o_lng, d_lat, d_lng))
+
+# Get the raw Mapbox Directions response between two points, using the cache when possible.  With
+# alternatives, Mapbox may return up to two more routes after the recommended one.
+def fetch_mapbox_directions(o_lat: float, o_lng: float, d_lat: float, d_lng: float, alternatives: bool = False) -> dict:
+    key = directions_cache_key(o_lat, o_lng, d_lat, d_lng, alternatives)
+    mapbox_data = _directions_cache.get(key)
+    tracing.cache_lookup('directions', mapbox_data is not None)
+    if mapbox_data is not None:
+        return mapbox_data
 
-    crs = "+proj=utm +zone="
-    crs = crs + str(zone)
-    if lat < 0.0:
-        crs = crs + " +south"
+    mapbox_token = os.environ['MAPBOX_TOKEN']
+    url = f"https://api.mapbox.com/directions/v5/mapbox/driving/{o_lng}%2C{o_lat}%3B{d_lng}%2C{d_lat}?alternatives={'true' if alternatives else 'false'}&annotations=maxspeed&geometries=geojson&language=en&overview=full&steps=true&access_token={mapbox_token}"
 
-    crs = crs + " +datum=WGS84 +units=m +no_defs"
+    # Store the full Directions response for further processing later.
+    with tracing.stage('directions'):
+        response = upstream.get(url)
+        mapbox_data = response.json()
 
-    return crs
+    # Only keep good responses around.
+    if mapbox_data.get('code') == 'Ok' and mapbox_data.get('routes'):
+        _directions_cache.set(key, mapbox_data)
 
-# Next, define a function to get the directions between two points from Mapbox, and return the raw response as well as a GeoPandas representation of the route.
-def read_mapbox_directions(o_lat: float, o_lng: float, d_lat: float, d_lng: float) -> tuple[dict, gpd.GeoDataFrame]:
+    return mapbox_data
 
-    mapbox_token = os.environ['MAPBOX_TOKEN']
-    url = f"https://api.mapbox.com/directions/v5/mapbox/driving/{o_lng}%2C{o_lat}%3B{d_lng}%2C{d_lat}?alternatives=false&annotations=maxspeed&geometries=geojson&language=en&overview=full&steps=true&access_token={mapbox_token}"
-
-    # Store the full Directions response for further processing later.
-    response = requests.get(url)
-    mapbox_data = response.json()
+# Everything below looks at the first route of a Directions response.  To work with another route, hand it
+# a copy of the response with only that route in it.
+def single_route(mapbox_data: dict, index: int) -> dict:
+    return {**mapbox_data, 'routes': [mapbox_data['routes'][index]]}
 
+# Project the first route in a Directions response into the local UTM zone, as an (N, 2) array of meters.
+def directions_route_xy(mapbox_data: dict, o_lat: float, o_lng: float) -> np.ndarray:
     # Retrieve the GEOJSON portion of the directions, which describes every geographic point along the route.
-    # Then, create a GeoDataFrame of the route, which will enable measuring changes in heading, or curviness.
+    # Projecting it will enable measuring changes in heading, or curviness.
     subdata = mapbox_data['routes'][0]['geometry']
 
-    crs = get_utm_crs(o_lat, o_lng)
-    geom = shape(subdata)
-    geo_df = gpd.GeoDataFrame([1], geometry=[geom], crs="EPSG:4326")
-
     # Convert coordinates into local UTM so latitude isn't distorted
-    geo_df = geo_df.to_crs(crs)
+    with tracing.stage('projection'):
+        return projection.project_to_utm(subdata['coordinates'], o_lat, o_lng)
+
+# Next, define a function to get the directions between two points from Mapbox, and return the raw response as well as the projected route.
+def read_mapbox_directions(o_lat: float, o_lng: float, d_lat: float, d_lng: float) -> tuple[dict, np.ndarray]:
+    mapbox_data = fetch_mapbox_directions(o_lat, o_lng, d_lat, d_lng)
 
-    return mapbox_data, geo_df
+    return mapbox_data, directions_route_xy(mapbox_data, o_lat, o_lng)
+
+# Route-derived features
+# All of the route features come from one walk over the Directions response (see route_features.py).  The
+# functions below are kept as thin wrappers for anything that only needs a single feature.
 
 # Find the maximum speed along a route
 def max_speed(mapbox_data: dict) -> float:
-    
-    speeds = (
-        ms["speed"]
-        for route in mapbox_data.get("routes", [])
-        for leg in route.get("legs", [])
-        for ms in leg.get("annotation", {}).get("maxspeed", [])
-        if isinstance(ms, dict) and "speed" in ms and isinstance(ms["speed"], (int, float))
-    )
-
-    max_speed = max(speeds, default=16.0934) / 1.60934  # If no max speed, use 10 MPH.
-    
-    return max_speed
+    return RouteFeatures(mapbox_data).max_speed
 
 # Road type is a bit complicated.  There are three categories: rural, urban, and highway.
 # 
 # First, look for a marker that appears when a route has some urban elements
 def any_is_urban_true(mapbox_data: dict) -> bool:
-    return any(
-        "is_urban" in intersection
-        for route in mapbox_data.get("routes", [])
-        for leg in route.get("legs", [])
-        for step in leg.get("steps", [])
-        for intersection in step.get("intersections", [])
-    )
+    return RouteFeatures(mapbox_data).is_urban
 
 # Now, see if it is a highway or not
 def any_is_highway_true(mapbox_data: dict) -> bool:
-    return any(
-        (cls := intersection.get("mapbox_streets_v8", {}).get("class")) in {"primary", "secondary", "motoway"}
-        for route in mapbox_data.get("routes", [])
-        for leg in route.get("legs", [])
-        for step in leg.get("steps", [])
-        for intersection in step.get("intersections", [])
-    )    
+    return RouteFeatures(mapbox_data).is_highway
 
 # Now we have enough to derive the type of road.  One question remains: should urban trump highway, or the other way around?
 def get_road_type(mapbox_data: dict) -> bool:
-    if any_is_highway_true(mapbox_data):
-        return "highway"
-
-    if any_is_urban_true(mapbox_data):
-        return "urban"
-
-    return "rural"
+    return RouteFeatures(mapbox_data).road_type
 
 # Determine If Road Signs Present.  This is kind of lazy, but using 'is_urban' seems to be a good proxy.  I'm doing it.
 def has_road_signs(mapbox_data: dict) -> bool:
-    return any_is_urban_true(mapbox_data)
+    return RouteFeatures(mapbox_data).has_road_signs
 
 # Determine Lane Count
 # Unfortunately, there isn't a good way I can find to reliably determine lane count.  For a proxy, let's look 
 # at 'mapbox_streets_v8'.  A value of 'motorway' will be considered a three lane road, 'primary' or 'secondary' 
 # will be two lanes, and all else will be 1.
 def get_lane_count(mapbox_data: dict) -> bool:
-    if any(
-        (cls := intersection.get("mapbox_streets_v8", {}).get("class")) in {"motorway"}
-        for route in mapbox_data.get("routes", [])
-        for leg in route.get("legs", [])
-        for step in leg.get("steps", [])
-        for intersection in step.get("intersections", [])
-    ):
-        return 3
-        
-    if any(
-        (cls := intersection.get("mapbox_streets_v8", {}).get("class")) in {"primary", "secondary"}
-        for route in mapbox_data.get("routes", [])
-        for leg in route.get("legs", [])
-        for step in leg.get("steps", [])
-        for intersection in step.get("intersections", [])
-    ):
-        return 2
-
-    return 1
+    return RouteFeatures(mapbox_data).lane_count
 
 # Determine Curviness
 # One way to measure curviness is to look at the angle (if any) desribed by three points.  To figure out the angle 
@@ -164,71 +167,45 @@ def angle_p1p2p3(p1: float, p2: float, p3: float) -> float:
 # Next, let's define a function that iterates through all of a LineString's points, and calculates the angles to 
 # the successive points.  We'll use this to determine overall curviness.
 
-def calculate_linestring_curvature(linestring: dict) -> list[float]:
+def calculate_linestring_curvature(linestring) -> list[float]:
     """
-    Calculates the curvature for each vertex of a Shapely LineString.
+    Calculates the curvature for each vertex of a LineString (anything with .coords) or coordinate array.
     Returns a list of curvature values. The first and last points
     have a curvature of 180 as they cannot form a triplet.
     """
-    coords = np.array(linestring.coords)
-    if len(coords) < 3:
-        return [180] * len(coords)
-
-    curvatures = [180]
-    for i in range(1, len(coords) - 1):
-        p1 = coords[i - 1]
-        p2 = coords[i]
-        p3 = coords[i + 1]
-
-        ang = angle_p1p2p3(p1, p2, p3)
+    # The per-vertex angle_p1p2p3() loop is done in one batched pass by the curvature module.
+    return curvature.turn_angles(getattr(linestring, 'coords', linestring)).tolist()
 
-        curvatures.append(ang)
-
-    curvatures.append(180)
-    
-    return curvatures
+MAX_CURVY = curvature.MAX_CURVY
 
-MAX_CURVY = 170.0
+# Curviness of a projected route, as returned by read_mapbox_directions().
+def calculate_curviness(route_xy: np.ndarray) -> float:
+    return curvature.curviness(route_xy)
 
-def calculate_curviness(geo_df: gpd.GeoDataFrame) -> float:
-    geo_curvs = geo_df['geometry'].apply(calculate_linestring_curvature)
-    geo_curvs_ser = pd.Series(geo_curvs[0])
-    raw_curviness = geo_curvs_ser.mean()
-
-    raw_curviness = max(raw_curviness, MAX_CURVY)
-    curviness = (180.0 - raw_curviness) / (180.0 - MAX_CURVY)
-
-    return curviness
+# A variant of calculate_curviness() where each vertex counts in proportion to the distance it covers.
+def calculate_distance_weighted_curviness(route_xy: np.ndarray) -> float:
+    return curvature.distance_weighted_curviness(route_xy)
 
 # Time-Dependent Variables
 # Some of the variables fed into the model are dependent on the time of day, holiday, and other features.  To facilitate testing, let's define a datetime picker.
 
 from zoneinfo import ZoneInfo
-from timezonefinder import TimezoneFinder
 
-tf = TimezoneFinder()
+# One TimezoneFinder (and its polygon data) is shared by everything through the solar context (see solar.py).
+def timezone_finder():
+    return solar.context.finder
+
 def tz_from_coords(lat: float, lon: float) -> ZoneInfo:
-    name = tf.timezone_at(lat=lat, lng=lon)
-    if name is None:
-        # fall back to nearest match (useful near borders or sparse areas)
-        name = tf.closest_timezone_at(lat=lat, lng=lon)
-    return ZoneInfo(name) if name else ZoneInfo("UTC")
+    return solar.zone_info(solar.context.timezone_name(lat, lon))
 
 import datetime as dt
 
 # Determine if the selected day is a holiday.
-from pandas.tseries.holiday import USFederalHolidayCalendar
 import datetime
 
-def is_holiday(dt: datetime.datetime) -> bool:
-    cal = USFederalHolidayCalendar()
-    start_date = str(dt.year) + '-01-01'
-    end_date = str(dt.year) + '-12-31'
-    holidays = cal.holidays(start=start_date, end=end_date).to_pydatetime()
-    if datetime.datetime(dt.year, dt.month, dt.day) in holidays:
-        return True
-
-    return False
+# The holiday dates are worked out once and kept in a set (see holiday_calendar.py).
+def is_holiday(dt: datetime.datetime, region: str = holiday_calendar.DEFAULT_REGION) -> bool:
+    return holiday_calendar.holidays.is_holiday(dt, region)
 
 def is_holiday_during_drive(mapbox_data, dt_start: datetime.datetime) -> bool:
     # Determine the time of the end of the trip
@@ -262,42 +239,15 @@ def get_time_of_day_during_drive(mapbox_data: dict, dt_start: datetime.datetime)
 
 # Determine Lighting
 # The lighting variable has three values: 'dim', 'daylight'. and 'night'.  In order to determine this, we need to get the sunrise and sunset times.
-from suntimes import SunTimes
-from timezonefinder import TimezoneFinder
-from zoneinfo import ZoneInfo
-
 def get_lighting(mapbox_data: bool, dt: datetime.datetime) -> str:
     # Get the starting position
     lng = mapbox_data['routes'][0]['geometry']['coordinates'][0][0]
     lat = mapbox_data['routes'][0]['geometry']['coordinates'][0][1]
 
-    # Get the time zone for this location
-    tf = TimezoneFinder()
-    tzname = tf.timezone_at(lat=lat, lng=lng)
-
-    # Update the time so that it is in the correct timezone.
-    dt = datetime.datetime(dt.year, dt.month, dt.day, hour=dt.hour, minute=dt.minute, second=dt.second, tzinfo=ZoneInfo(tzname))
-    
-    # Initialize the suntime object, and calculate the periods when light is dim.
-    sun = SunTimes(longitude=lng, latitude=lat, altitude=0)
-    first_light_start = sun.risewhere(dt, tzname) - datetime.timedelta(minutes=30)
-    first_light_end = sun.risewhere(dt, tzname) + datetime.timedelta(minutes=60)
-    last_light_start = sun.setwhere(dt, tzname) - datetime.timedelta(minutes=60)
-    last_light_end = sun.setwhere(dt, tzname) + datetime.timedelta(minutes=30)
-
-    # If the provided time is between either of the above periods, lighting is dim.
-    if dt > first_light_start and dt < first_light_end:
-        return "dim"
-
-    if dt > last_light_start and dt < last_light_end:
-        return "dim"
-
-    # The time between the dim periods is daylight
-    if dt > first_light_end and dt < last_light_start:
-        return 'daylight'
-
-    # It must be night.
-    return 'night'
+    # Dim is from 30 minutes before to 60 minutes after sunrise, and from 60 minutes before to 30 minutes after
+    # sunset.  Daylight is in between, and the rest is night.  The timezone and sunrise/sunset times for the
+    # location and date are cached, so this is cheap to call for many times along a route.
+    return solar.context.lighting(lat, lng, dt)
 
 def get_lighting_during_drive(mapbox_data: dict, dt_start: datetime.datetime) -> str:
     # Determine the time of the end of the trip
@@ -328,27 +278,62 @@ def is_school_season_during_drive(mapbox_data: dict, dt_start: datetime.datetime
     return is_school_season(dt_start) & is_school_season(dt_end)
 
 # Determine the weather
-# We can get the current weather from the National Weather Service.
-def get_current_weather(mapbox_data: dict) -> dict:
-    # Get the starting position
-    lng = mapbox_data['routes'][0]['geometry']['coordinates'][0][0]
-    lat = mapbox_data['routes'][0]['geometry']['coordinates'][0][1]
-
-    # Get the NWS grid coordinate for the starting position.
-    url = f"https://api.weather.gov/points/{lat},{lng}"
-    response = requests.get(url)
+# We can get the current weather from the National Weather Service.  That takes two calls: one to map the
+# location onto an NWS forecast grid cell, and one to get the forecast for that cell.  Both are cached.  The
+# location -> grid cell mapping never changes, so it never expires.  Locations are rounded first (2 decimal
+# places is about 1.1 km, finer than the 2.5 km NWS grid), and the rounded point is what gets looked up, so
+# the cached mapping is exact for its key.  Forecasts are kept for as long as NWS says they are good for.
+NWS_POINTS_PRECISION = int(os.environ.get('NWS_POINTS_PRECISION', '2'))
+NWS_FORECAST_DEFAULT_TTL = float(os.environ.get('NWS_FORECAST_DEFAULT_TTL', '3600'))
+
+_nws_gridpoint_cache = make_cache(maxsize=4096, ttl=None, path=os.environ.get('NWS_CACHE_PATH'))
+_nws_forecast_cache = make_cache(maxsize=1024, ttl=NWS_FORECAST_DEFAULT_TTL)
+
+# Get the NWS grid cell (gridId, gridX, gridY) for a location.
+def get_nws_gridpoint(lat: float, lng: float) -> tuple[str, int, int]:
+    lat_q = quantize(lat, NWS_POINTS_PRECISION)
+    lng_q = quantize(lng, NWS_POINTS_PRECISION)
+    key = f"points:{lat_q},{lng_q}"
+    grid = _nws_gridpoint_cache.get(key)
+    tracing.cache_lookup('nws_points', grid is not None)
+    if grid is not None:
+        return tuple(grid)
+
+    url = f"https://api.weather.gov/points/{lat_q},{lng_q}"
+    response = upstream.get(url)
     location_data = response.json()
 
     # Save the location to create the forcast url
-    gridId = location_data['properties']['gridId']
-    gridX = location_data['properties']['gridX']
-    gridY = location_data['properties']['gridY']
+    grid = (
+        location_data['properties']['gridId'],
+        location_data['properties']['gridX'],
+        location_data['properties']['gridY']
+    )
+    _nws_gridpoint_cache.set(key, list(grid))
+
+    return grid
+
+# Get the forecast periods for an NWS grid cell.
+def get_nws_forecast(gridId: str, gridX: int, gridY: int) -> list[dict]:
+    key = f"forecast:{gridId}/{gridX},{gridY}"
+    periods = _nws_forecast_cache.get(key)
+    tracing.cache_lookup('nws_forecast', periods is not None)
+    if periods is not None:
+        return periods
 
     url = f"https://api.weather.gov/gridpoints/{gridId}/{gridX},{gridY}/forecast?units=us"
-    response = requests.get(url)
+    response = upstream.get(url)
     forecast_data = response.json()
 
-    current_wx = forecast_data['properties']['periods'][0]['shortForecast']
+    periods = forecast_data['properties']['periods']
+    ttl = ttl_from_headers(response.headers, default=NWS_FORECAST_DEFAULT_TTL)
+    if ttl:
+        _nws_forecast_cache.set(key, periods, ttl)
+
+    return periods
+
+# Map the NWS short forecast onto the model's weather categories.
+def classify_weather(current_wx: str) -> str:
     if current_wx in {'Fog', 'fog'}:
         return 'foggy'
 
@@ -357,6 +342,22 @@ def get_current_weather(mapbox_data: dict) -> dict:
         
     return 'clear'
 
+# Used when NWS can't be reached in time
+DEFAULT_WEATHER = 'clear'
+
+def get_current_weather_at(lat: float, lng: float) -> str:
+    with tracing.stage('weather'):
+        periods = get_nws_forecast(*get_nws_gridpoint(lat, lng))
+
+    return classify_weather(periods[0]['shortForecast'])
+
+def get_current_weather(mapbox_data: dict) -> dict:
+    # Get the starting position
+    lng = mapbox_data['routes'][0]['geometry']['coordinates'][0][0]
+    lat = mapbox_data['routes'][0]['geometry']['coordinates'][0][1]
+
+    return get_current_weather_at(lat, lng)
+
 def safe_quantile_bins(s: pd.Series, bins, labels):
     s = s.astype(float)
     # Fallback if no variation or too few rows
@@ -370,6 +371,18 @@ def safe_quantile_bins(s: pd.Series, bins, labels):
         mid = labels[len(labels)//2]
         return pd.Series([mid] * len(s), index=s.index, dtype="object")
 
+# Curvature bins and category vocabularies learned from the training data (features.json, see
+# model_artifact.py), set by _init().  Without them, curvature is binned by the quantiles of whatever frame is
+# being engineered, which is how the model was trained but puts a lone live row in 'medium'.
+_curvature_bins = None
+_vocabularies = {}
+
+def curvature_bins(s: pd.Series) -> pd.Series:
+    if _curvature_bins is None:
+        return safe_quantile_bins(s, list(model_artifact.CURVATURE_BIN_QUANTILES), list(model_artifact.CURVATURE_BIN_LABELS))
+
+    return pd.Series(_curvature_bins(s.to_numpy(dtype=float)), index=s.index, dtype="object")
+
 # Identify Feature Types
 # Instead of one-hot encoding, we'll tell LightGBM which columns are categorical.
 categorical_features = [
@@ -416,11 +429,7 @@ def feature_engineer(df: pd.DataFrame, target: str = TARGET, drop_duplicates:boo
     # Binning Curvature
     # Create categorical bins for the curvature feature.
     # The quantiles are chosen to split the data into meaningful groups.
-    df_engineered['curvature_bin'] = safe_quantile_bins(
-        df_engineered['curvature'],
-        [0, 0.25, 0.75, 1.0],
-        ['low', 'medium', 'high']
-    ).astype(str)
+    df_engineered['curvature_bin'] = curvature_bins(df_engineered['curvature']).astype(str)
 
     # Create Polynomial Features
     # Squaring the most correlated features to capture non-linear relationships
@@ -439,101 +448,730 @@ def feature_engineer(df: pd.DataFrame, target: str = TARGET, drop_duplicates:boo
     bool_cols = df_engineered.select_dtypes(include='bool').columns
     df_engineered[bool_cols] = df_engineered[bool_cols].astype(int)
 
-    # Convert categorical columns to the 'category' dtype for LightGBM
+    # Convert categorical columns to the 'category' dtype for LightGBM, with the training vocabularies when
+    # the export has them
     for col in categorical_features:
-        df_engineered[col] = df_engineered[col].astype('category')
+        if col in _vocabularies:
+            df_engineered[col] = pd.Categorical(df_engineered[col], categories=_vocabularies[col])
+        else:
+            df_engineered[col] = df_engineered[col].astype('category')
 
     return df_engineered
 
 ### INITIALIZATION ###
 _model = None
 
+EXPORT_DIR = model_artifact.EXPORT_DIR
+META_PATH = os.path.join(EXPORT_DIR, model_artifact.META_FILE)
+_model_path = None
+
+# Predictions memoized on their (quantized) model inputs; see prediction_cache.py
+prediction_cache = PredictionCache()
+
+# (mtime, size) of the artifacts when they were loaded, so a warm process notices when they change
+_artifact_stats = None
+
+def _stat_artifacts(model_path: str):
+  paths = [META_PATH, model_path, model_artifact.features_path(EXPORT_DIR)]
+  return tuple((st.st_mtime_ns, st.st_size) for st in (os.stat(p) for p in paths if p))
+
+# Modules the request path needs.  _init() imports them up front so the first request doesn't pay for them.
+REQUEST_PATH_DEPENDENCIES = ('pandas', 'lightgbm', 'pyproj', 'timezonefinder', 'suntimes')
+
 def _init():
-  global _model, _meta
-  if _model: 
-    print(f"Model 'ml_model/export/model.pkl' already loaded; skipping loading.")
-    return
-    
-  with open('ml_model/export/meta.json', 'r') as f:
-    _meta = json.loads(f.read())
+  global _model, _meta, _booster, _encoder, _model_path, _artifact_stats, _curvature_bins, _vocabularies
+  if _model:
+    # Warm: nothing to do unless the artifacts were replaced.
+    if _stat_artifacts(_model_path) == _artifact_stats:
+      return
+    print("Model artifacts changed on disk; reloading.")
+
+  for name in REQUEST_PATH_DEPENDENCIES:
+    startup.timed_import(name)
+
+  with startup.timed('meta'), open(META_PATH, 'rb') as f:
+    meta_bytes = f.read()
+    _meta = json.loads(meta_bytes)
+
+  model_artifact.check_version(_meta, lgb.__version__)
+
+  # The native LightGBM export when there is one (see model_artifact.py), otherwise the pickle
+  _model_path = model_artifact.model_path(EXPORT_DIR, _meta)
+  _artifact_stats = _stat_artifacts(_model_path)
+
+  with startup.timed('model'), open(_model_path, 'rb') as f:
+    model_bytes = f.read()
+    _model = model_artifact.load_booster(_model_path, model_bytes)
+
+  # The training curvature edges and vocabularies, when the export has them
+  features_bytes = b''
+  features = {}
+  features_path = model_artifact.features_path(EXPORT_DIR)
+  if features_path:
+    with open(features_path, 'rb') as f:
+      features_bytes = f.read()
+      features = json.loads(features_bytes)
+  else:
+    print(f"No {model_artifact.FEATURES_FILE} in {EXPORT_DIR}; curvature is binned per batch.")
+
+  # Cached predictions only stand while the artifacts are the same.
+  prediction_cache.bind(artifact_signature(meta_bytes, model_bytes, features_bytes))
+
+  # Predictions go straight to the booster, with features encoded by the compiled FeatureEncoder, and a
+  # fixed thread count suited to the vCPUs available.
+  with startup.timed('encoder'):
+    _booster = _model
+    if 'curvature_bin' in features:
+      _curvature_bins = fixed_curvature_bins(features['curvature_bin']['edges'], features['curvature_bin']['labels'])
+    else:
+      _curvature_bins = None
+    _vocabularies = features.get('vocabularies', {})
+    _encoder = FeatureEncoder.from_model(_meta, _booster, curvature_bins=_curvature_bins or quantile_curvature_bins)
+
+  with startup.timed('timezonefinder'):
+    timezone_finder()
 
-  with open('ml_model/export/model.pkl', 'rb') as f:
-    _model = joblib.load(io.BytesIO(f.read()))
+  with startup.timed('holidays'):
+    holiday_calendar.holidays.preload()
 
-  print(f"Model 'ml_model/export/model.pkl' loaded.")
+  print(f"Model '{_model_path}' loaded (LightGBM {lgb.__version__}, {model_artifact.LIGHTGBM_NUM_THREADS} threads).")
 
 ### Start the application ###
-app = Flask(__name__)
+def create_app():
+    flask = startup.timed_import('flask')
+    flask_cors = startup.timed_import('flask_cors')
+
+    flask_app = flask.Flask(__name__)
+
+    # Initialize CORS, passing in allowed origins
+    flask_cors.CORS(flask_app, origins=ALLOWED_ORIGINS)
+
+    flask_app.add_url_rule("/drive-risk", view_func=drive_risk_query, methods=["GET", "POST"])
+    flask_app.add_url_rule("/drive-risk/batch", view_func=drive_risk_batch_query, methods=["POST"])
+    flask_app.add_url_rule("/drive-risk/sweep", view_func=drive_risk_sweep_query, methods=["GET", "POST"])
+    flask_app.add_url_rule("/drive-risk/alternatives", view_func=drive_risk_alternatives_query, methods=["GET", "POST"])
+    flask_app.add_url_rule("/drive-risk/segments", view_func=drive_risk_segments_query, methods=["GET", "POST"])
+    flask_app.add_url_rule("/heatmap/<slice_name>", view_func=heatmap_manifest_query, methods=["GET"])
+    flask_app.add_url_rule("/heatmap/<slice_name>/point", view_func=heatmap_point_query, methods=["GET"])
+    flask_app.add_url_rule("/heatmap/<slice_name>/<int:z>/<int:x>/<int:y>", view_func=heatmap_tile_query, methods=["GET"])
+    flask_app.add_url_rule("/health", view_func=health_query, methods=["GET"])
+
+    # Trace every request (see tracing.py).  Flask runs after_request hooks last-registered first, so the
+    # compression is timed in the trace.
+    flask_app.before_request(_start_trace)
+    flask_app.after_request(_finish_trace)
+    flask_app.after_request(_compress_response)
+
+    return flask_app
+
+def _start_trace():
+    from flask import request
+
+    # Health probes aren't worth a log line
+    if request.endpoint != 'health_query':
+        tracing.start()
+
+def _finish_trace(response):
+    tracing.annotate('status', response.status_code)
+    trace = tracing.finish()
+    if trace is not None and tracing.SERVER_TIMING:
+        response.headers['Server-Timing'] = trace.server_timing()
 
-# Initialize CORS, passing in allowed origins
-CORS(app, origins=ALLOWED_ORIGINS)
+    return response
 
-def calc_drive_risk(o_lat: float, o_lng: float, d_lat: float, d_lng: float, date_str: str):
+def _compress_response(response):
+    from flask import request
 
-    # Load the model
-    _init()
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    with tracing.stage('compress'):
+        body, encoding = responses.compress(response.get_data(), request.headers.get('Accept-Encoding'))
+    if encoding is not None:
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
 
-    # If the datetime string was supplied, convert it.  If not present, use current time.
+    return response
+
+# The Flask app is only built when something asks for `app.app` (a WSGI server, or __main__ below).
+def __getattr__(name):
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Score a list of model-inputs dicts.  This is the same as running feature_engineer() on a DataFrame of them
+# and calling the model, without the pandas overhead.  Inputs seen before are answered from the prediction
+# cache.  Curvature bins can be passed in for rows that shouldn't be binned as one batch.  (_init() must have
+# been called.)
+def predict_model_inputs(rows: list[dict], bins: list[str] | None = None) -> np.ndarray:
+    return prediction_cache.predict(rows, _encoder, _predict, bins)
+
+def _predict(X: np.ndarray) -> np.ndarray:
+    with tracing.stage('predict'):
+        return _booster.predict(X, num_threads=model_artifact.LIGHTGBM_NUM_THREADS)
+
+# If the datetime string was supplied, convert it.  If not present, use current time.
+def parse_date_str(date_str: str | None) -> datetime.datetime:
     if date_str:
-        dt = datetime.datetime.fromisoformat(date_str)
-    else:
-        dt = datetime.datetime.now()
-
-    # Get the Mapbox Directions and GeoDataframe for the requested trip.
-    mapbox_data, geo_df = read_mapbox_directions(o_lat, o_lng, d_lat, d_lng)
-    print(f"Mapbox Directions obtained for route between {o_lat:.6f}, {o_lng:.6f}, and {d_lat:.6f}, {d_lng:.6f}")
-
-    # Use the current time for all time-based
-    road_type = get_road_type(mapbox_data)
-    num_lanes = get_lane_count(mapbox_data)
-    curvature = calculate_curviness(geo_df)
-    speed_limit = max_speed(mapbox_data)
-    lighting = get_lighting(mapbox_data, dt)
-    weather = get_current_weather(mapbox_data)
-    road_signs_present = has_road_signs(mapbox_data)
-    public_road = True
-    time_of_day = get_time_of_day_during_drive(mapbox_data, dt)
-    holiday = is_holiday_during_drive(mapbox_data, dt)
-    school_season = is_school_season(dt)
-
-    model_inputs = {
-        'road_type': road_type,
-        'num_lanes': num_lanes,
-        'curvature': curvature,
-        'speed_limit': speed_limit,
-        'lighting': lighting,
+        return datetime.datetime.fromisoformat(date_str)
+
+    return datetime.datetime.now()
+
+# Fetch what a trip's route needs (directions and weather), and work out the inputs that don't depend on
+# the departure time.  Returns the Directions response, the projected route, and those inputs.
+def _trip_route(o_lat: float, o_lng: float, d_lat: float, d_lng: float) -> tuple[dict, np.ndarray, dict]:
+    # The weather only needs the origin, so look it up at the same time as the directions.
+    weather_future = upstream.submit('nws', get_current_weather_at, o_lat, o_lng)
+    directions_future = upstream.submit('mapbox', read_mapbox_directions, o_lat, o_lng, d_lat, d_lng)
+
+    # Get the Mapbox Directions and projected route for the requested trip.
+    mapbox_data, route_xy = upstream.result('mapbox', directions_future)
+    tracing.debug(f"Mapbox Directions obtained for route between {o_lat:.6f}, {o_lng:.6f}, and {d_lat:.6f}, {d_lng:.6f}")
+
+    weather = upstream.result('nws', weather_future, default=DEFAULT_WEATHER)
+
+    return mapbox_data, route_xy, directions_route_inputs(mapbox_data, route_xy, weather)
+
+# The inputs that don't depend on the departure time, for the first route of a Directions response.
+def directions_route_inputs(mapbox_data: dict, route_xy: np.ndarray, weather: str) -> dict:
+    # Walk the Directions response once for all of the route-derived inputs
+    with tracing.stage('route_features'):
+        route = RouteFeatures(mapbox_data, route_index=0)
+
+    with tracing.stage('curvature'):
+        curviness = calculate_curviness(route_xy)
+
+    return {
+        'road_type': route.road_type,
+        'num_lanes': route.lane_count,
+        'curvature': curviness,
+        'speed_limit': route.max_speed,
         'weather': weather,
-        'road_signs_present': road_signs_present,
-        'public_road': public_road,
-        'time_of_day': time_of_day,
-        'holiday': holiday,
-        'school_season': school_season
+        'road_signs_present': route.has_road_signs,
+        'public_road': True,
     }
 
-    model_inputs_df = pd.DataFrame([model_inputs])
+def trip_route_inputs(o_lat: float, o_lng: float, d_lat: float, d_lng: float) -> tuple[dict, dict]:
+    mapbox_data, _, route_inputs = _trip_route(o_lat, o_lng, d_lat, d_lng)
 
-    print(f"Model inputs dataframe before FE: {model_inputs_df}")
+    return mapbox_data, route_inputs
 
-    model_inputs_df = feature_engineer(model_inputs_df, drop_duplicates = False)
-    
-    print(f"Model inputs dataframe after FE: {model_inputs_df}")
+# The inputs that depend on when the trip starts.
+def trip_time_inputs(mapbox_data: dict, dt: datetime.datetime) -> dict:
+    with tracing.stage('lighting'):
+        lighting = get_lighting(mapbox_data, dt)
+
+    return {
+        'lighting': lighting,
+        'time_of_day': get_time_of_day_during_drive(mapbox_data, dt),
+        'holiday': is_holiday_during_drive(mapbox_data, dt),
+        'school_season': is_school_season(dt),
+    }
+
+# Put route and time inputs together in the order the model (and the front end) expect.
+MODEL_INPUT_KEYS = (
+    'road_type', 'num_lanes', 'curvature', 'speed_limit', 'lighting', 'weather',
+    'road_signs_present', 'public_road', 'time_of_day', 'holiday', 'school_season'
+)
+
+def combine_model_inputs(route_inputs: dict, time_inputs: dict) -> dict:
+    both = {**route_inputs, **time_inputs}
+
+    return {k: both[k] for k in MODEL_INPUT_KEYS}
+
+# Fetch everything a trip needs and work out its model inputs.  Returns the Directions response and the inputs.
+def trip_model_inputs(o_lat: float, o_lng: float, d_lat: float, d_lng: float, dt: datetime.datetime) -> tuple[dict, dict]:
+    mapbox_data, route_inputs = trip_route_inputs(o_lat, o_lng, d_lat, d_lng)
+
+    return mapbox_data, combine_model_inputs(route_inputs, trip_time_inputs(mapbox_data, dt))
+
+# Response Shapes
+# The front end only draws the route line, so by default the response carries just the (simplified) route
+# geometry, the model inputs and the prediction.  response='full' adds the raw Directions response as well.
+# The geometry comes back as a GeoJSON LineString, or as a precision 6 encoded polyline with
+# geometry='polyline'.
+RESPONSE_MODES = ('compact', 'full')
+GEOMETRY_FORMATS = ('geojson', 'polyline')
+
+def parse_response_options(payload: dict) -> dict:
+    response = str(payload.get("response", 'compact'))
+    if response not in RESPONSE_MODES:
+        raise ValueError(f"Unknown response: {response!r} (expected one of {', '.join(RESPONSE_MODES)})")
+
+    geometry_format = str(payload.get("geometry", 'geojson'))
+    if geometry_format not in GEOMETRY_FORMATS:
+        raise ValueError(f"Unknown geometry: {geometry_format!r} (expected one of {', '.join(GEOMETRY_FORMATS)})")
+
+    return {'response': response, 'geometry_format': geometry_format}
+
+def route_geometry(route: dict, geometry_format: str = 'geojson') -> dict:
+    coordinates = route['geometry']['coordinates']
+    if geometry_format == 'polyline':
+        kept = responses.simplify(coordinates)
+        return {'polyline': responses.encode_polyline([coordinates[i] for i in kept], precision=6)}
+
+    return {'geometry': {'type': 'LineString', 'coordinates': responses.compact_coordinates(coordinates)}}
+
+# Coalescing
+# Identical trips requested at the same time (origin and destination at the directions cache precision,
+# departure time to the COALESCE_TIME_SECONDS, and the same response shape) share one computation; see
+# singleflight.py.  Each request that got another's result counts as drive_risk_coalesced in its trace.
+COALESCE_TIME_SECONDS = int(os.environ.get('COALESCE_TIME_SECONDS', '60'))
+
+drive_risk_flights = SingleFlight()
+
+def drive_risk_key(o_lat: float, o_lng: float, d_lat: float, d_lng: float, dt: datetime.datetime,
+                   response: str, geometry_format: str) -> tuple:
+    coords = tuple(quantize(v, DIRECTIONS_CACHE_PRECISION) for v in (o_lat, o_lng, d_lat, d_lng))
+
+    return (*coords, int(dt.timestamp() // max(COALESCE_TIME_SECONDS, 1)), response, geometry_format)
+
+def calc_drive_risk(o_lat: float, o_lng: float, d_lat: float, d_lng: float, date_str: str,
+                    response: str = 'compact', geometry_format: str = 'geojson'):
+
+    # Load the model
+    _init()
+    tracing.set_operation('drive-risk')
+
+    dt = parse_date_str(date_str)
+
+    key = drive_risk_key(o_lat, o_lng, d_lat, d_lng, dt, response, geometry_format)
+    result, coalesced = drive_risk_flights.do(key, _calc_drive_risk, o_lat, o_lng, d_lat, d_lng, dt, response, geometry_format)
+    if coalesced:
+        tracing.count('drive_risk_coalesced')
+        tracing.debug(f"Coalesced with an in-flight request for {key}")
+
+    return result
+
+def _calc_drive_risk(o_lat: float, o_lng: float, d_lat: float, d_lng: float, dt: datetime.datetime,
+                     response: str, geometry_format: str) -> dict:
+
+    mapbox_data, model_inputs = trip_model_inputs(o_lat, o_lng, d_lat, d_lng, dt)
+
+    tracing.debug(f"Model inputs: {model_inputs}")
 
     # Now, call the ML model
-    prediction = _model.predict(model_inputs_df)
+    prediction = predict_model_inputs([model_inputs])
 
-    print(f"Received prediction: {prediction}")
+    tracing.debug(f"Received prediction: {prediction}")
 
     # Create a record with everything to send back
-    response = {
-        'mapbox_data': mapbox_data,
+    route = mapbox_data['routes'][0]
+    with tracing.stage('shape'):
+        result = {
+            **route_geometry(route, geometry_format),
+            'model_inputs': model_inputs,
+            'prediction': float(prediction[0]),
+            'duration': route.get('duration'),
+            'distance': route.get('distance'),
+        }
+    if response == 'full':
+        result['mapbox_data'] = mapbox_data
+
+    return result
+
+# Alternative Routes
+# Mapbox can return alternatives to its recommended route in the same response.  Each returned route gets
+# its own model inputs (they share the weather at the origin), they're all scored in one model call, and
+# they come back ranked from least to most risky.
+def calc_drive_risk_alternatives(o_lat: float, o_lng: float, d_lat: float, d_lng: float, date_str: str) -> dict:
+    _init()
+    tracing.set_operation('alternatives')
+
+    dt = parse_date_str(date_str)
+
+    weather_future = upstream.submit('nws', get_current_weather_at, o_lat, o_lng)
+    directions_future = upstream.submit('mapbox', fetch_mapbox_directions, o_lat, o_lng, d_lat, d_lng, True)
+
+    mapbox_data = upstream.result('mapbox', directions_future)
+    routes = mapbox_data.get('routes') or []
+    if not routes:
+        raise ValueError(f"No route found: {mapbox_data.get('message') or mapbox_data.get('code')}")
+    tracing.debug(f"Mapbox Directions obtained {len(routes)} routes between {o_lat:.6f}, {o_lng:.6f}, and {d_lat:.6f}, {d_lng:.6f}")
+
+    weather = upstream.result('nws', weather_future, default=DEFAULT_WEATHER)
+
+    rows = []
+    for i in range(len(routes)):
+        route_data = single_route(mapbox_data, i)
+        route_xy = directions_route_xy(route_data, o_lat, o_lng)
+        route_inputs = directions_route_inputs(route_data, route_xy, weather)
+        rows.append(combine_model_inputs(route_inputs, trip_time_inputs(route_data, dt)))
+
+    predictions = predict_model_inputs(rows)
+
+    ranked = sorted(range(len(routes)), key=lambda i: predictions[i])
+    results = [
+        {
+            'route_index': i,
+            'rank': rank,
+            'model_inputs': rows[i],
+            'prediction': float(predictions[i]),
+            'duration': routes[i].get('duration'),
+            'distance': routes[i].get('distance'),
+            'geometry': routes[i].get('geometry'),
+        }
+        for rank, i in enumerate(ranked)
+    ]
+
+    tracing.debug(f"Ranked {len(results)} routes; safest is route {ranked[0]} at {results[0]['prediction']:.4f}")
+
+    return {
+        'routes': results,
+        'safest_route_index': ranked[0],
+    }
+
+# Batch Scoring
+# Fleet customers send many trips at once.  Each trip's upstream lookups run on a bounded pool (sharing the
+# directions and weather caches), then every trip that made it through is scored in one model call.  Each
+# trip's curvature is binned the way it would be on its own, so it gets the same risk as from /drive-risk
+# whatever else is in the batch.  A trip that fails gets an error in its own result instead of failing the
+# batch.
+BATCH_MAX_TRIPS = int(os.environ.get('BATCH_MAX_TRIPS', '500'))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', '8'))
+
+_batch_executor = None
+
+def _batch_pool() -> ThreadPoolExecutor:
+    # Separate from the upstream pool: trip workers wait on upstream futures, so sharing could deadlock.
+    global _batch_executor
+    if _batch_executor is None:
+        _batch_executor = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix="batch")
+    return _batch_executor
+
+TRIP_KEYS = ("o_lat", "o_lng", "d_lat", "d_lng", "date_str")
+
+def parse_trip(trip: dict) -> tuple[float, float, float, float, datetime.datetime]:
+    if not isinstance(trip, dict):
+        raise ValueError("Trip must be a JSON object")
+
+    missing = [k for k in TRIP_KEYS if k not in trip]
+    if missing:
+        raise ValueError(f"Missing keys: {', '.join(missing)}")
+
+    try:
+        coords = tuple(float(trip[k]) for k in TRIP_KEYS[:4])
+    except (TypeError, ValueError):
+        raise ValueError("Invalid types in trip")
+
+    return (*coords, parse_date_str(trip["date_str"]))
+
+def _batch_trip(trip: dict) -> dict:
+    o_lat, o_lng, d_lat, d_lng, dt = parse_trip(trip)
+    mapbox_data, model_inputs = trip_model_inputs(o_lat, o_lng, d_lat, d_lng, dt)
+    route = mapbox_data['routes'][0]
+
+    return {
         'model_inputs': model_inputs,
-        'prediction': prediction[0]
+        'duration': route.get('duration'),
+        'distance': route.get('distance'),
     }
 
-    return response
+def calc_drive_risk_batch(trips: list[dict]) -> list[dict]:
+    """
+    Scores many trips.  Returns one result per trip, in order: either its model inputs, duration, distance
+    and prediction, or an 'error'.
+    """
+    _init()
+    tracing.set_operation('batch')
+
+    if len(trips) > BATCH_MAX_TRIPS:
+        raise ValueError(f"Too many trips: {len(trips)} (limit {BATCH_MAX_TRIPS})")
+
+    futures = [tracing.submit(_batch_pool(), _batch_trip, trip) for trip in trips]
+
+    results = []
+    for i, future in enumerate(futures):
+        try:
+            results.append({'index': i, **future.result()})
+        except Exception as e:
+            results.append({'index': i, 'error': str(e) or type(e).__name__})
+
+    scored = [r for r in results if 'error' not in r]
+    if scored:
+        rows = [r['model_inputs'] for r in scored]
+        predictions = predict_model_inputs(rows, _encoder.bin_curvature_each(rows))
+        for r, prediction in zip(scored, predictions):
+            r['prediction'] = float(prediction)
+
+    tracing.debug(f"Scored {len(scored)} of {len(trips)} trips in batch")
+
+    return results
+
+# Departure-Time Sweep
+# Only lighting, time of day, holiday and school season depend on when a trip starts.  So for a window of
+# candidate departure times, the directions are fetched (and the route inputs worked out) once, the time
+# inputs are computed for every departure at once, and everything is scored in a single model call.
+SWEEP_DEFAULT_STEP_MINUTES = 15
+SWEEP_MAX_STEPS = int(os.environ.get('SWEEP_MAX_STEPS', '672'))  # A week at 15 minute steps
+
+def sweep_departures(start: datetime.datetime, end: datetime.datetime, step_minutes: float) -> list[datetime.datetime]:
+    if step_minutes <= 0:
+        raise ValueError("step_minutes must be positive")
+
+    # Everything works on local wall-clock time, like the single-trip path.  Any UTC offset is dropped from
+    # both ends, so a window with an offset on only one of them still compares.
+    start, end = start.replace(tzinfo=None), end.replace(tzinfo=None)
+    if end < start:
+        raise ValueError("The window ends before it starts")
+
+    step = datetime.timedelta(minutes=step_minutes)
+    count = int((end - start) / step) + 1
+    if count > SWEEP_MAX_STEPS:
+        raise ValueError(f"Too many departures: {count} (limit {SWEEP_MAX_STEPS})")
+
+    return [start + i * step for i in range(count)]
+
+def _hours(times: np.ndarray) -> np.ndarray:
+    # Hour of the day of datetime64 values
+    return (times.astype('datetime64[h]') - times.astype('datetime64[D]')).astype(int)
+
+def _times_of_day(hours: np.ndarray) -> np.ndarray:
+    # Vectorized get_time_of_day()
+    return np.where((hours >= 4) & (hours < 12), 'morning', np.where((hours >= 12) & (hours < 20), 'afternoon', 'evening'))
+
+def trip_window_inputs(starts: np.ndarray, ends: np.ndarray) -> dict:
+    """
+    The time of day and holiday inputs for trips from starts to ends (datetime64 arrays of local wall-clock
+    time), as trip_time_inputs() works them out for one trip.  Returns a dict of arrays.
+    """
+    # Time of day over the trip: 'evening' if either end is in the evening, otherwise the start's.
+    start_tod = _times_of_day(_hours(starts))
+    end_tod = _times_of_day(_hours(ends))
+    time_of_day = np.where((start_tod == 'evening') | (end_tod == 'evening'), 'evening', start_tod)
+
+    # A holiday at either end of the trip
+    holiday = holiday_calendar.holidays.is_holiday_many(starts) | holiday_calendar.holidays.is_holiday_many(ends)
+
+    return {
+        'time_of_day': time_of_day,
+        'holiday': holiday,
+    }
+
+def sweep_time_inputs(mapbox_data: dict, departures: list[datetime.datetime]) -> dict:
+    """
+    trip_time_inputs() for many departures at once.  Returns a dict of arrays.
+    """
+    duration = np.timedelta64(int(round(mapbox_data['routes'][0]['duration'] * 1e6)), 'us')
+    starts = np.array(departures, dtype='datetime64[us]')
+    ends = starts + duration
+
+    # Lighting at the start of the trip
+    lng, lat = mapbox_data['routes'][0]['geometry']['coordinates'][0][:2]
+    with tracing.stage('lighting'):
+        lighting = solar.context.lighting_many(lat, lng, departures)
+
+    # School season from the start
+    months = starts.astype('datetime64[M]').astype(int) % 12 + 1
+    school_season = (months <= 5) | (months >= 9)
+
+    window = trip_window_inputs(starts, ends)
+    return {
+        'lighting': lighting,
+        'time_of_day': window['time_of_day'],
+        'holiday': window['holiday'],
+        'school_season': school_season,
+    }
+
+def calc_drive_risk_sweep(o_lat: float, o_lng: float, d_lat: float, d_lng: float,
+                          start_str: str, end_str: str, step_minutes: float = SWEEP_DEFAULT_STEP_MINUTES) -> dict:
+    """
+    Risk for every departure time from start_str to end_str (inclusive) at step_minutes intervals.
+    """
+    _init()
+    tracing.set_operation('sweep')
+
+    departures = sweep_departures(parse_date_str(start_str), parse_date_str(end_str), step_minutes)
+
+    mapbox_data, route_inputs = trip_route_inputs(o_lat, o_lng, d_lat, d_lng)
+    time_inputs = sweep_time_inputs(mapbox_data, departures)
+
+    rows = [
+        combine_model_inputs(route_inputs, {k: v[i].item() for k, v in time_inputs.items()})
+        for i in range(len(departures))
+    ]
+    predictions = predict_model_inputs(rows)
+
+    series = [
+        {
+            'departure': departure.isoformat(),
+            'prediction': float(prediction),
+            **{k: row[k] for k in time_inputs},
+        }
+        for departure, prediction, row in zip(departures, predictions, rows)
+    ]
+    best = min(series, key=lambda s: s['prediction'])
+
+    tracing.debug(f"Swept {len(series)} departures; lowest risk {best['prediction']:.4f} at {best['departure']}")
+
+    route = mapbox_data['routes'][0]
+    return {
+        'route_inputs': route_inputs,
+        'duration': route.get('duration'),
+        'distance': route.get('distance'),
+        'series': series,
+        'best': best,
+    }
+
+SWEEP_KEYS = ("o_lat", "o_lng", "d_lat", "d_lng", "start", "end")
+
+def parse_sweep(payload: dict) -> dict:
+    missing = [k for k in SWEEP_KEYS if k not in payload]
+    if missing:
+        raise ValueError(f"Missing keys: {', '.join(missing)}")
+
+    try:
+        return {
+            'o_lat': float(payload["o_lat"]),
+            'o_lng': float(payload["o_lng"]),
+            'd_lat': float(payload["d_lat"]),
+            'd_lng': float(payload["d_lng"]),
+            'start_str': str(payload["start"]),
+            'end_str': str(payload["end"]),
+            'step_minutes': float(payload.get("step_minutes", SWEEP_DEFAULT_STEP_MINUTES)),
+        }
+    except (TypeError, ValueError):
+        raise ValueError("Invalid types in JSON payload")
+
+# Segmented Scoring
+# One row per trip hides a short curvy stretch inside a long straight interstate.  Here the route is cut into
+# segments (one per Mapbox step, or every segment_length meters, see segments.py), each segment gets its own
+# road and curvature inputs plus the lighting, time of day and holiday at the time it is reached, and all of
+# the segments are scored in one model call.  Each segment's curvature is binned the way a whole route would
+# be on its own: against the training edges in features.json, or for an older export, in the single-row
+# 'medium' fallback.  (Binning by the quantiles of the segments themselves would always call a quarter of any
+# route 'high', and the segment risks couldn't be compared with the route's.)  The result is a GeoJSON
+# FeatureCollection with a risk per segment, and a distance-weighted aggregate for the whole trip.
+SEGMENT_MAX_COUNT = int(os.environ.get('SEGMENT_MAX_COUNT', '5000'))
+
+def segment_time_inputs(mapbox_data: dict, segments: RouteSegments, dt: datetime.datetime) -> dict:
+    """
+    The time inputs for each segment, at the time it is reached.  Returns a dict of arrays.
+    """
+    # Wall-clock times along the route, in the origin's timezone like the single-trip path
+    offsets = (segments.offset * 1e6).round().astype('timedelta64[us]')
+    arrivals = np.datetime64(dt.replace(tzinfo=None), 'us') + offsets
+
+    lng, lat = mapbox_data['routes'][0]['geometry']['coordinates'][0][:2]
+    tzname = solar.context.timezone_name(lat, lng)
+    departure = solar.context.localize(dt, tzname).timestamp()
+    lats, lngs = segments.start_points()
+    with tracing.stage('lighting'):
+        lighting = solar.context.lighting_along(lats, lngs, departure + segments.offset, tzname)
+
+    return {
+        'lighting': lighting,
+        'time_of_day': _times_of_day(_hours(arrivals)),
+        'holiday': holiday_calendar.holidays.is_holiday_many(arrivals),
+        'school_season': np.full(len(segments), is_school_season(dt)),
+    }
+
+def calc_drive_risk_segments(o_lat: float, o_lng: float, d_lat: float, d_lng: float, date_str: str,
+                             segment_by: str = 'step', segment_length: float = DEFAULT_SEGMENT_LENGTH) -> dict:
+    _init()
+    tracing.set_operation('segments')
+
+    dt = parse_date_str(date_str)
+
+    mapbox_data, route_xy, route_inputs = _trip_route(o_lat, o_lng, d_lat, d_lng)
+    segments = RouteSegments(mapbox_data, route_xy, mode=segment_by, segment_length=segment_length)
+    if len(segments) > SEGMENT_MAX_COUNT:
+        raise ValueError(f"Too many segments: {len(segments)} (limit {SEGMENT_MAX_COUNT})")
+
+    segment_inputs = {
+        'road_type': segments.road_type,
+        'num_lanes': segments.num_lanes,
+        'curvature': segments.curvature,
+        'speed_limit': segments.speed_limit,
+        'road_signs_present': segments.road_signs_present,
+        **segment_time_inputs(mapbox_data, segments, dt),
+    }
+
+    columns = {k: v.tolist() for k, v in segment_inputs.items()}
+    rows = [
+        combine_model_inputs(route_inputs, {k: v[i] for k, v in columns.items()})
+        for i in range(len(segments))
+    ]
+    predictions = predict_model_inputs(rows, _encoder.bin_curvature_each(rows))
+
+    features = [
+        {
+            'type': 'Feature',
+            'geometry': {'type': 'LineString', 'coordinates': segments.segment_coordinates(i)},
+            'properties': {
+                'index': i,
+                'distance': float(segments.distance[i]),
+                'duration': float(segments.duration[i]),
+                'offset': float(segments.offset[i]),
+                'model_inputs': row,
+                'prediction': float(prediction),
+            },
+        }
+        for i, (row, prediction) in enumerate(zip(rows, predictions))
+    ]
+
+    weights = segments.distance if segments.distance.sum() > 0.0 else None
+    riskiest = int(np.argmax(predictions))
+    aggregate = {
+        'prediction': float(np.average(predictions, weights=weights)),
+        'max_prediction': float(predictions[riskiest]),
+        'riskiest_segment': riskiest,
+    }
+
+    tracing.debug(f"Scored {len(segments)} segments; distance-weighted risk {aggregate['prediction']:.4f}")
+
+    route = mapbox_data['routes'][0]
+    return {
+        'segments': {'type': 'FeatureCollection', 'features': features},
+        'aggregate': aggregate,
+        'route_inputs': route_inputs,
+        'duration': route.get('duration'),
+        'distance': route.get('distance'),
+    }
+
+def parse_segments(payload: dict) -> dict:
+    missing = [k for k in TRIP_KEYS if k not in payload]
+    if missing:
+        raise ValueError(f"Missing keys: {', '.join(missing)}")
+
+    try:
+        return {
+            'o_lat': float(payload["o_lat"]),
+            'o_lng': float(payload["o_lng"]),
+            'd_lat': float(payload["d_lat"]),
+            'd_lng': float(payload["d_lng"]),
+            'date_str': str(payload["date_str"]),
+            'segment_by': str(payload.get("segment_by", 'step')),
+            'segment_length': float(payload.get("segment_length", DEFAULT_SEGMENT_LENGTH)),
+        }
+    except (TypeError, ValueError):
+        raise ValueError("Invalid types in JSON payload")
+
+def drive_risk_alternatives_query():
+    from flask import request, jsonify
+
+    if request.method == "POST":
+        if not request.is_json:
+            return jsonify(error="Content-Type must be application/json"), 400
+        payload = request.get_json(silent=False)
+    else:  # GET
+        payload = request.args.to_dict()
+
+    try:
+        o_lat, o_lng, d_lat, d_lng, _ = parse_trip(payload)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    return jsonify(calc_drive_risk_alternatives(o_lat, o_lng, d_lat, d_lng, payload["date_str"])), 200
 
-@app.route("/drive-risk", methods=["GET", "POST"])
 def drive_risk_query():
+    from flask import request, jsonify
+
     if request.method == "POST":
         if not request.is_json:
             return jsonify(error="Content-Type must be application/json"), 400
@@ -562,12 +1200,151 @@ def drive_risk_query():
         date_str = request.args.get("date_str", type=str)
         if None in (o_lat, o_lng, d_lat, d_lng) or date_str is None:
             return jsonify(error="Missing one or more required query parameters"), 400
+        payload = request.args
 
-    result = calc_drive_risk(o_lat, o_lng, d_lat, d_lng, date_str)
+    try:
+        options = parse_response_options(payload)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    result = calc_drive_risk(o_lat, o_lng, d_lat, d_lng, date_str, **options)
 
     return jsonify(result), 200
 
+def drive_risk_sweep_query():
+    from flask import request, jsonify
+
+    if request.method == "POST":
+        if not request.is_json:
+            return jsonify(error="Content-Type must be application/json"), 400
+        payload = request.get_json(silent=False)
+    else:  # GET
+        payload = request.args.to_dict()
+
+    # Check the window up front so a bad one is a 400
+    try:
+        args = parse_sweep(payload)
+        sweep_departures(parse_date_str(args['start_str']), parse_date_str(args['end_str']), args['step_minutes'])
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    return jsonify(calc_drive_risk_sweep(**args)), 200
+
+def drive_risk_segments_query():
+    from flask import request, jsonify
+
+    if request.method == "POST":
+        if not request.is_json:
+            return jsonify(error="Content-Type must be application/json"), 400
+        payload = request.get_json(silent=False)
+    else:  # GET
+        payload = request.args.to_dict()
+
+    try:
+        return jsonify(calc_drive_risk_segments(**parse_segments(payload))), 200
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+# Heatmap tiles, built ahead of time by heatmap.py
+def heatmap_manifest_query(slice_name: str):
+    from flask import jsonify
+
+    try:
+        manifest = heatmap.load_manifest(slice_name)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    if manifest is None:
+        return jsonify(error=f"No heatmap for {slice_name}"), 404
+
+    return jsonify(manifest), 200
+
+def heatmap_tile_query(slice_name: str, z: int, x: int, y: int):
+    from flask import jsonify
+
+    try:
+        risk = heatmap.load_tile(slice_name, z, x, y)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    if risk is None:
+        return jsonify(error=f"No tile {z}/{x}/{y} for {slice_name}"), 404
+
+    return jsonify(slice=slice_name, z=z, x=x, y=y, risk=heatmap.tile_json(risk)), 200
+
+def heatmap_point_query(slice_name: str):
+    from flask import request, jsonify
+
+    lat = request.args.get("lat", type=float)
+    lng = request.args.get("lng", type=float)
+    if lat is None or lng is None:
+        return jsonify(error="Missing lat or lng"), 400
+
+    try:
+        result = heatmap.risk_at(slice_name, lat, lng)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    if result is None:
+        return jsonify(error=f"The {slice_name} heatmap doesn't cover {lat}, {lng}"), 404
+
+    return jsonify(result), 200
+
+def drive_risk_batch_query():
+    from flask import request, jsonify
+
+    if not request.is_json:
+        return jsonify(error="Content-Type must be application/json"), 400
+
+    payload = request.get_json(silent=False)
+    trips = payload.get("trips") if isinstance(payload, dict) else None
+    if not isinstance(trips, list):
+        return jsonify(error="Expected a JSON object with a 'trips' list"), 400
+
+    if len(trips) > BATCH_MAX_TRIPS:
+        return jsonify(error=f"Too many trips: {len(trips)} (limit {BATCH_MAX_TRIPS})"), 400
+
+    return jsonify(results=calc_drive_risk_batch(trips)), 200
+
+# Readiness: 200 once the model is loaded, with what's loaded and how the caches are doing.
+def service_status() -> dict:
+    caches = {
+        'directions': _directions_cache,
+        'nws_points': _nws_gridpoint_cache,
+        'nws_forecast': _nws_forecast_cache,
+    }
+
+    return {
+        'ready': _model is not None,
+        'pid': os.getpid(),
+        'model': {
+            'path': _model_path,
+            'lightgbm_version': lgb.__version__ if _model is not None else None,
+            'num_threads': model_artifact.LIGHTGBM_NUM_THREADS,
+            'features': _curvature_bins is not None,
+        },
+        'caches': {
+            **{name: {**cache.stats.as_dict(), 'size': len(cache)} for name, cache in caches.items()},
+            'prediction': prediction_cache.stats(),
+        },
+        'coalescing': drive_risk_flights.stats(),
+        'upstreams': upstream.stats(),
+        'connections': upstream.client.stats(),
+    }
+
+def health_query():
+    from flask import jsonify
+
+    status = service_status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+# For a pre-fork server (see wsgi.py): each worker process needs its own SQLite connections.
+def after_fork():
+    for cache in (_directions_cache, _nws_gridpoint_cache, _nws_forecast_cache):
+        cache.reopen()
+
+# Flask's development server, one request at a time.  In a container, serve with gunicorn instead:
+#   gunicorn -c gunicorn.conf.py wsgi:application
 if __name__ == "__main__":
+    _init()
+    app = create_app()
     app.run(host="0.0.0.0", port=9400, debug=False)
 
 # A few helpers for the lambda_handler
@@ -596,7 +1373,54 @@ def _method(event):
     # REST API v1
     return (event.get("httpMethod") or "").upper()
 
+def _path(event):
+    # HTTP API v2 / Function URL, then REST API v1
+    return event.get("rawPath") or event.get("path") or ""
+
+def _accept_encoding(headers):
+    if not headers:
+        return ""
+    h = {k.lower(): v for k,v in headers.items()}
+
+    return h.get("accept-encoding", "")
+
+def _json_body(value) -> str:
+    with tracing.stage('serialize'):
+        return json.dumps(value, separators=(',', ':'))
+
+def _compress_event_response(response, headers):
+    # API Gateway and function URLs pass binary bodies through as base64
+    body = response.get("body")
+    if response.get("statusCode") != 200 or not isinstance(body, str):
+        return response
+
+    with tracing.stage('compress'):
+        compressed, encoding = responses.compress(body.encode("utf-8"), _accept_encoding(headers))
+    if encoding is None:
+        return response
+
+    import base64
+    response["headers"] = {**response.get("headers", {}), "Content-Encoding": encoding, "Vary": "Accept-Encoding"}
+    response["body"] = base64.b64encode(compressed).decode("ascii")
+    response["isBase64Encoded"] = True
+
+    return response
+
 def lambda_handler(event, context):
+    # CORS preflights aren't worth a log line
+    if _method(event) == "OPTIONS":
+        return _handle_event(event, context)
+
+    tracing.start()
+    response = _compress_event_response(_handle_event(event, context), event.get("headers"))
+    tracing.annotate('status', response['statusCode'])
+    trace = tracing.finish()
+    if tracing.SERVER_TIMING:
+        response['headers']['Server-Timing'] = trace.server_timing()
+
+    return response
+
+def _handle_event(event, context):
     headers = event.get("headers") or {}
     cors = _cors(_origin(headers))
     method = _method(event)
@@ -622,8 +1446,51 @@ def lambda_handler(event, context):
                 import base64
                 raw = base64.b64decode(raw).decode("utf-8")
             body = json.loads(raw)
-        # Get the request payload from the request body
-        body = json.loads(event["body"])
+
+        # Batch mode: a list of trips, either posted to .../batch or sent as {"trips": [...]}
+        if "trips" in body or _path(event).endswith("/batch"):
+            trips = body.get("trips")
+            if not isinstance(trips, list):
+                raise ValueError("Expected a 'trips' list")
+
+            return {
+                "statusCode": 200,
+                'headers': {
+                    'Content-Type': 'application/json'
+                },
+                "body": _json_body({'results': calc_drive_risk_batch(trips)})
+            }
+
+        # Departure-time sweep: a time window for one trip, posted to .../sweep or sent with "start"/"end"
+        if ("start" in body and "end" in body) or _path(event).endswith("/sweep"):
+            return {
+                "statusCode": 200,
+                'headers': {
+                    'Content-Type': 'application/json'
+                },
+                "body": _json_body(calc_drive_risk_sweep(**parse_sweep(body)))
+            }
+
+        # Alternative routes: posted to .../alternatives or sent with "alternatives": true
+        if body.get("alternatives") in (True, "true") or _path(event).endswith("/alternatives"):
+            o_lat, o_lng, d_lat, d_lng, _ = parse_trip(body)
+            return {
+                "statusCode": 200,
+                'headers': {
+                    'Content-Type': 'application/json'
+                },
+                "body": _json_body(calc_drive_risk_alternatives(o_lat, o_lng, d_lat, d_lng, body["date_str"]))
+            }
+
+        # Segmented scoring: posted to .../segments or sent with "segment_by"
+        if "segment_by" in body or _path(event).endswith("/segments"):
+            return {
+                "statusCode": 200,
+                'headers': {
+                    'Content-Type': 'application/json'
+                },
+                "body": _json_body(calc_drive_risk_segments(**parse_segments(body)))
+            }
 
         o_lat = float(body["o_lat"])
         o_lng = float(body["o_lng"])
@@ -631,14 +1498,14 @@ def lambda_handler(event, context):
         d_lng = float(body["d_lng"])
         date_str = body["date_str"]
 
-        response = calc_drive_risk(o_lat, o_lng, d_lat, d_lng, date_str)
+        response = calc_drive_risk(o_lat, o_lng, d_lat, d_lng, date_str, **parse_response_options(body))
 
         return {
             "statusCode": 200,
             'headers': {
                 'Content-Type': 'application/json'
             },
-            "body": json.dumps(response)
+            "body": _json_body(response)
         }
 
     except Exception as e:
@@ -652,3 +1519,6 @@ def lambda_handler(event, context):
             "body": err
         }
 
+# On Lambda, load the model and the request-path dependencies during the INIT phase.
+if os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
+    _init()
@@ -0,0 +1,448 @@
+import copy
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+# Offline Benchmarks
+# Every call to calc_drive_risk() normally goes out to Mapbox and the NWS, so timings swing with the network
+# and nothing can be compared run to run.  This harness serves Directions and weather responses from
+# fixtures instead, through a stand-in for the upstream HTTP client, and times each stage of the request
+# path as well as the whole lambda_handler (driven by test_event.json).
+#
+# Fixtures come from the scenarios below.  Each has a synthetic Directions response generated from a fixed
+# seed (so every run sees exactly the same data), and a recorded response can be dropped in alongside:
+#
+#   MAPBOX_TOKEN=... python benchmark.py --record            # save live responses into BENCH_FIXTURES_DIR
+#   python benchmark.py --save-baseline bench_baseline.json  # run and store the percentiles
+#   python benchmark.py --baseline bench_baseline.json       # run and compare against them
+#
+# Comparing exits non-zero when any stage's median is more than --max-regression times its baseline, so it
+# can gate a build like startup.py's cold-start budget.
+
+BENCH_FIXTURES_DIR = os.environ.get('BENCH_FIXTURES_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_fixtures'))
+
+# Scenarios: a route between two points, how detailed its geometry is, and the road it's on.
+SCENARIOS = {
+    # Downtown Fort Worth, street grid
+    'short_urban': dict(o=(32.7555, -97.3308), d=(32.7357, -97.3400), points=300, steps=25,
+                        classes=('street', 'secondary', 'street'), urban=True, wiggle=0.002, weather='Sunny'),
+    # The trip in test_event.json, west Fort Worth to DFW airport
+    'test_event': dict(o=(32.759295, -97.503393), d=(32.903862, -96.973375), points=2500, steps=60,
+                       classes=('primary', 'motorway', 'secondary'), urban=True, wiggle=0.01, weather='Rain'),
+    # Dallas to Houston on I-45
+    'long_interstate': dict(o=(32.7767, -96.7970), d=(29.7604, -95.3698), points=6000, steps=120,
+                            classes=('motorway',), urban=False, wiggle=0.03, weather='Patchy Fog'),
+    # Los Angeles to New York with overview=full: tens of thousands of points and across many UTM zones
+    'very_long_full': dict(o=(34.0522, -118.2437), d=(40.7128, -74.0060), points=60000, steps=1500,
+                           classes=('motorway', 'primary', 'motorway', 'trunk'), urban=False, wiggle=0.5, weather='Sunny'),
+    # Across the UTM zone 13/14 boundary (102 W) near Amarillo
+    'utm_boundary': dict(o=(35.2220, -102.3000), d=(35.1500, -101.7000), points=800, steps=12,
+                         classes=('motorway',), urban=False, wiggle=0.005, weather='Snow'),
+    # Sydney to Canberra: southern and eastern hemispheres, and outside NWS coverage
+    'southern_hemisphere': dict(o=(-33.8688, 151.2093), d=(-35.2809, 149.1300), points=3000, steps=40,
+                                classes=('motorway', 'primary'), urban=False, wiggle=0.02, weather=None),
+}
+
+# Typical speeds (km/h) for the synthetic maxspeed annotations
+CLASS_SPEEDS = {'motorway': 110, 'trunk': 100, 'primary': 90, 'secondary': 70, 'street': 40}
+
+EARTH_RADIUS = 6371008.8
+
+def _haversine(lnglat: np.ndarray) -> np.ndarray:
+    lng, lat = np.radians(lnglat[:, 0]), np.radians(lnglat[:, 1])
+    a = np.sin(np.diff(lat) / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lng) / 2) ** 2
+
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+def synthesize_route(spec: dict, seed: int = 0) -> dict:
+    """
+    A Directions route in the shape Mapbox returns for steps=true, geometries=geojson, annotations=maxspeed.
+    """
+    rng = np.random.default_rng(seed)
+    (o_lat, o_lng), (d_lat, d_lng) = spec['o'], spec['d']
+    n = spec['points']
+
+    # A straight line with a meander that goes to zero at both ends, plus a little jitter
+    t = np.linspace(0.0, 1.0, n)
+    envelope = 4.0 * t * (1.0 - t)
+    phase = rng.uniform(0, 2 * np.pi)
+    lat = o_lat + (d_lat - o_lat) * t + spec['wiggle'] * envelope * np.sin(t * 37.0 + phase)
+    lng = o_lng + (d_lng - o_lng) * t + spec['wiggle'] * envelope * np.cos(t * 23.0 + phase)
+    jitter = rng.normal(0.0, spec['wiggle'] * 1e-3, (n, 2)) * envelope[:, None]
+    lnglat = np.round(np.c_[lng, lat] + jitter, 6)
+    coords = lnglat.tolist()
+    edge_length = _haversine(lnglat)
+
+    classes = spec['classes']
+    bounds = np.linspace(0, n - 1, spec['steps'] + 1).astype(int)
+    steps = []
+    maxspeed = []
+    for i, (a, b) in enumerate(zip(bounds[:-1], bounds[1:])):
+        road_class = classes[i % len(classes)]
+        speed = CLASS_SPEEDS.get(road_class, 50)
+        distance = float(edge_length[a:b].sum())
+        intersections = []
+        for k in range(a, b, max((b - a) // 4, 1)):
+            intersection = {'location': coords[k], 'geometry_index': int(k), 'mapbox_streets_v8': {'class': road_class}}
+            if spec['urban']:
+                intersection['is_urban'] = True
+            intersections.append(intersection)
+        steps.append({
+            'geometry': {'type': 'LineString', 'coordinates': coords[a:b + 1]},
+            'distance': distance,
+            'duration': distance / (speed / 3.6),
+            'name': f"Road {i}",
+            'maneuver': {'type': 'depart' if i == 0 else 'turn', 'location': coords[a]},
+            'intersections': intersections,
+        })
+        for _ in range(a, b):
+            maxspeed.append({'unknown': True} if rng.random() < 0.05 else {'speed': speed, 'unit': 'km/h'})
+
+    steps.append({
+        'geometry': {'type': 'LineString', 'coordinates': [coords[-1], coords[-1]]},
+        'distance': 0.0, 'duration': 0.0, 'name': '',
+        'maneuver': {'type': 'arrive', 'location': coords[-1]},
+        'intersections': [{'location': coords[-1], 'geometry_index': n - 1}],
+    })
+
+    distance = float(edge_length.sum())
+    duration = float(sum(s['duration'] for s in steps))
+    return {
+        'geometry': {'type': 'LineString', 'coordinates': coords},
+        'legs': [{'steps': steps, 'annotation': {'maxspeed': maxspeed}, 'distance': distance, 'duration': duration, 'summary': ''}],
+        'distance': distance,
+        'duration': duration,
+        'weight_name': 'auto',
+        'weight': duration,
+    }
+
+def synthesize_directions(spec: dict, alternatives: bool = False) -> dict:
+    routes = [synthesize_route(spec, seed) for seed in (range(3) if alternatives else range(1))]
+    (o_lat, o_lng), (d_lat, d_lng) = spec['o'], spec['d']
+
+    return {
+        'code': 'Ok',
+        'routes': routes,
+        'waypoints': [{'location': [o_lng, o_lat], 'name': ''}, {'location': [d_lng, d_lat], 'name': ''}],
+        'uuid': 'benchmark',
+    }
+
+def _fixture_path(name: str, kind: str) -> str:
+    return os.path.join(BENCH_FIXTURES_DIR, f"{name}.{kind}.json")
+
+# Upstream Stand-In
+class FixtureResponse:
+    """
+    Enough of requests.Response for the app: status_code, headers, json() and raise_for_status().  The body
+    is kept as text, so json() costs what it does on a real response.
+    """
+
+    def __init__(self, body, status_code: int = 200, headers: dict | None = None):
+        self.text = body if isinstance(body, str) else json.dumps(body)
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.ok = status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self) -> None:
+        if not self.ok:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+class FixtureClient:
+    """
+    Stands in for upstream.UpstreamClient and answers from the scenario fixtures, so no request leaves the
+    machine.  Directions for coordinates that don't belong to a scenario are synthesized on the spot.
+    """
+
+    DIRECTIONS = re.compile(r"/directions/v5/mapbox/driving/([-\d.]+)%2C([-\d.]+)%3B([-\d.]+)%2C([-\d.]+)")
+    POINTS = re.compile(r"/points/([-\d.]+),([-\d.]+)")
+    GRIDPOINTS = re.compile(r"/gridpoints/(\w+)/(\d+),(\d+)/forecast")
+
+    def __init__(self, scenarios: dict = SCENARIOS):
+        self.scenarios = scenarios
+        self.requests = 0
+        self._bodies = {}
+
+    def _scenario(self, lat: float, lng: float, end: str = 'o') -> str | None:
+        for name, spec in self.scenarios.items():
+            if abs(spec[end][0] - lat) < 0.01 and abs(spec[end][1] - lng) < 0.01:
+                return name
+        return None
+
+    def _directions(self, name: str, spec: dict, alternatives: bool) -> str:
+        key = (name, alternatives)
+        if key not in self._bodies:
+            path = _fixture_path(name, 'directions-alternatives' if alternatives else 'directions')
+            if name and os.path.exists(path):
+                with open(path, 'r') as f:
+                    self._bodies[key] = f.read()
+            else:
+                self._bodies[key] = json.dumps(synthesize_directions(spec, alternatives))
+        return self._bodies[key]
+
+    def get(self, url: str, timeout=None, **kwargs) -> FixtureResponse:
+        self.requests += 1
+
+        match = self.DIRECTIONS.search(url)
+        if match:
+            o_lng, o_lat, d_lng, d_lat = map(float, match.groups())
+            name = self._scenario(o_lat, o_lng)
+            spec = self.scenarios[name] if name else dict(
+                o=(o_lat, o_lng), d=(d_lat, d_lng), points=1000, steps=20,
+                classes=('primary',), urban=True, wiggle=0.01, weather='Sunny'
+            )
+            return FixtureResponse(self._directions(name, spec, 'alternatives=true' in url))
+
+        match = self.POINTS.search(url)
+        if match:
+            lat, lng = map(float, match.groups())
+            name = self._scenario(lat, lng)
+            if name and os.path.exists(_fixture_path(name, 'points')):
+                with open(_fixture_path(name, 'points'), 'r') as f:
+                    return FixtureResponse(f.read())
+            if name is None or self.scenarios[name]['weather'] is None:
+                # Like the NWS outside the US
+                return FixtureResponse({'status': 404, 'title': 'Data Unavailable For Requested Point'}, 404)
+            return FixtureResponse({'properties': {'gridId': 'BNC', 'gridX': list(self.scenarios).index(name), 'gridY': 1}})
+
+        match = self.GRIDPOINTS.search(url)
+        if match:
+            name = list(self.scenarios)[int(match.group(2))]
+            if os.path.exists(_fixture_path(name, 'forecast')):
+                with open(_fixture_path(name, 'forecast'), 'r') as f:
+                    return FixtureResponse(f.read(), headers={'Cache-Control': 'max-age=3600'})
+            periods = [{'number': 1, 'name': 'Today', 'shortForecast': self.scenarios[name]['weather']}]
+            return FixtureResponse({'properties': {'periods': periods}}, headers={'Cache-Control': 'max-age=3600'})
+
+        return FixtureResponse({'message': 'Not Found'}, 404)
+
+    def stats(self) -> dict:
+        return {'fixtures': {'requests': self.requests}}
+
+    def close(self) -> None:
+        pass
+
+def install_fixtures(scenarios: dict = SCENARIOS) -> FixtureClient:
+    """
+    Routes all upstream HTTP to the fixtures.
+    """
+    import upstream
+
+    os.environ.setdefault('MAPBOX_TOKEN', 'benchmark')
+    upstream.client = FixtureClient(scenarios)
+
+    return upstream.client
+
+def record(names=None) -> list[str]:
+    """
+    Fetches live Directions (with and without alternatives) and NWS responses for the scenarios and saves
+    them as fixtures.  Needs MAPBOX_TOKEN.
+    """
+    import upstream
+
+    token = os.environ['MAPBOX_TOKEN']
+    os.makedirs(BENCH_FIXTURES_DIR, exist_ok=True)
+
+    written = []
+    for name in names or SCENARIOS:
+        (o_lat, o_lng), (d_lat, d_lng) = SCENARIOS[name]['o'], SCENARIOS[name]['d']
+        urls = {
+            'directions': f"https://api.mapbox.com/directions/v5/mapbox/driving/{o_lng}%2C{o_lat}%3B{d_lng}%2C{d_lat}?alternatives=false&annotations=maxspeed&geometries=geojson&language=en&overview=full&steps=true&access_token={token}",
+            'directions-alternatives': f"https://api.mapbox.com/directions/v5/mapbox/driving/{o_lng}%2C{o_lat}%3B{d_lng}%2C{d_lat}?alternatives=true&annotations=maxspeed&geometries=geojson&language=en&overview=full&steps=true&access_token={token}",
+            'points': f"https://api.weather.gov/points/{o_lat:.2f},{o_lng:.2f}",
+        }
+        bodies = {kind: upstream.get(url).text for kind, url in urls.items()}
+
+        points = json.loads(bodies['points']).get('properties')
+        if points:
+            url = f"https://api.weather.gov/gridpoints/{points['gridId']}/{points['gridX']},{points['gridY']}/forecast?units=us"
+            bodies['forecast'] = upstream.get(url).text
+            # Point the fixture at this scenario's forecast
+            bodies['points'] = json.dumps({'properties': {'gridId': points['gridId'], 'gridX': list(SCENARIOS).index(name), 'gridY': 1}})
+
+        for kind, body in bodies.items():
+            with open(_fixture_path(name, kind), 'w') as f:
+                f.write(body)
+            written.append(_fixture_path(name, kind))
+
+    return written
+
+# Timing
+def percentiles(samples) -> dict:
+    s = np.asarray(samples, dtype=float) * 1000.0
+    return {
+        'n': int(len(s)),
+        'mean_ms': float(s.mean()),
+        'p50_ms': float(np.percentile(s, 50)),
+        'p90_ms': float(np.percentile(s, 90)),
+        'p99_ms': float(np.percentile(s, 99)),
+    }
+
+def time_call(fn, repeat: int, warmup: int = 1, setup=None) -> dict:
+    """
+    Runs fn() warmup + repeat times (calling setup() untimed before each run) and returns its percentiles.
+    """
+    samples = []
+    for i in range(warmup + repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        if i >= warmup:
+            samples.append(elapsed)
+
+    return percentiles(samples)
+
+def _clear_caches(app) -> None:
+    app._directions_cache.clear()
+    app._nws_gridpoint_cache.clear()
+    app._nws_forecast_cache.clear()
+    app.prediction_cache.cache.clear()
+
+def bench_scenario(app, name: str, repeat: int) -> dict:
+    """
+    Times each stage of the request path on one scenario.
+    """
+    import datetime
+
+    from route_features import RouteFeatures
+
+    spec = SCENARIOS[name]
+    (o_lat, o_lng), (d_lat, d_lng) = spec['o'], spec['d']
+    dt = datetime.datetime(2025, 10, 24, 16, 20)
+
+    mapbox_data = app.fetch_mapbox_directions(o_lat, o_lng, d_lat, d_lng)
+    route_xy = app.directions_route_xy(mapbox_data, o_lat, o_lng)
+    _, model_inputs = app.trip_model_inputs(o_lat, o_lng, d_lat, d_lng, dt)
+    rows = [model_inputs]
+    X = app._encoder.encode_many(rows)
+    result = app.calc_drive_risk(o_lat, o_lng, d_lat, d_lng, dt.isoformat())
+
+    # A copy of the response body as it arrives, for the parse stage
+    body = json.dumps(mapbox_data)
+
+    stages = {
+        'parse_directions': lambda: json.loads(body),
+        'project_route': lambda: app.directions_route_xy(mapbox_data, o_lat, o_lng),
+        'calculate_curviness': lambda: app.calculate_curviness(route_xy),
+        'intersection_scan': lambda: RouteFeatures(mapbox_data, route_index=0),
+        'get_lighting': lambda: app.get_lighting(mapbox_data, dt),
+        'time_inputs': lambda: app.trip_time_inputs(mapbox_data, dt),
+        'feature_engineer': lambda: app.feature_engineer(app.pd.DataFrame(rows)),
+        'encode': lambda: app._encoder.encode_many(rows),
+        'model_predict': lambda: app._predict(X),
+        'response_json': lambda: json.dumps(result),
+        'calc_drive_risk': lambda: app.calc_drive_risk(o_lat, o_lng, d_lat, d_lng, dt.isoformat()),
+    }
+
+    report = {stage: time_call(fn, repeat) for stage, fn in stages.items()}
+    report['calc_drive_risk_cold_cache'] = time_call(
+        stages['calc_drive_risk'], repeat, setup=lambda: _clear_caches(app)
+    )
+
+    return report
+
+def bench_handler(app, repeat: int, event_path: str = 'test_event.json') -> dict:
+    with open(event_path, 'r') as f:
+        event = json.load(f)
+
+    def invoke():
+        response = app.lambda_handler(copy.deepcopy(event), None)
+        if response['statusCode'] != 200:
+            raise RuntimeError(f"lambda_handler failed: {response['body']}")
+
+    return {
+        'lambda_handler': time_call(invoke, repeat),
+        'lambda_handler_cold_cache': time_call(invoke, repeat, setup=lambda: _clear_caches(app)),
+    }
+
+def run(names=None, repeat: int = 30) -> dict:
+    install_fixtures()
+
+    import contextlib
+    import io
+
+    import app
+
+    # The app prints as it goes; keep that out of the report.
+    with contextlib.redirect_stdout(io.StringIO()):
+        app._init()
+        results = {name: bench_scenario(app, name, repeat) for name in names or SCENARIOS}
+        results['handler'] = bench_handler(app, repeat)
+
+    return results
+
+def compare(results: dict, baseline: dict, max_regression: float) -> list[str]:
+    """
+    Lists every stage whose median is more than max_regression times the baseline's.
+    """
+    regressions = []
+    for group, stages in results.items():
+        for stage, r in stages.items():
+            base = baseline.get(group, {}).get(stage)
+            if base and base['p50_ms'] > 0 and r['p50_ms'] > base['p50_ms'] * max_regression:
+                regressions.append(f"{group}/{stage}: p50 {r['p50_ms']:.3f} ms vs {base['p50_ms']:.3f} ms baseline")
+
+    return regressions
+
+def _print_report(results: dict, baseline: dict | None = None) -> None:
+    print(f"{'stage':<34}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'vs base':>10}")
+    for group, stages in results.items():
+        print(group)
+        for stage, r in stages.items():
+            base = (baseline or {}).get(group, {}).get(stage)
+            ratio = f"{r['p50_ms'] / base['p50_ms']:>9.2f}x" if base and base['p50_ms'] > 0 else f"{'':>10}"
+            print(f"  {stage:<32}{r['p50_ms']:>10.3f}{r['p90_ms']:>10.3f}{r['p99_ms']:>10.3f}{ratio}")
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the request path against recorded/synthetic upstream fixtures.")
+    parser.add_argument("scenarios", nargs="*", help=f"Scenarios to run (default: all): {', '.join(SCENARIOS)}")
+    parser.add_argument("--repeat", type=int, default=30, help="Timed runs per stage.")
+    parser.add_argument("--record", action="store_true", help="Save live responses as fixtures (needs MAPBOX_TOKEN) and exit.")
+    parser.add_argument("--baseline", help="Compare against percentiles saved with --save-baseline.")
+    parser.add_argument("--save-baseline", help="Write the percentiles to this file.")
+    parser.add_argument("--max-regression", type=float, default=1.25,
+                        help="Fail when a stage's p50 is more than this times its baseline.")
+    parser.add_argument("--json", action="store_true", help="Print the raw results as JSON.")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+
+    if args.record:
+        for path in record(args.scenarios or None):
+            print(f"Wrote {path}")
+        sys.exit(0)
+
+    results = run(args.scenarios or None, args.repeat)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        _print_report(results, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if baseline:
+        regressions = compare(results, baseline, args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,235 @@
+import collections
+import os
+import sys
+import time
+
+import numpy as np
+
+import model_artifact
+from feature_encoder import fixed_curvature_bins
+
+# Bulk Scoring
+# Re-scores files of trips whose model inputs have already been worked out, in the same schema as
+# ml_model/original_data/synthetic_road_accidents_10k.csv (road_type, num_lanes, curvature, ... ; any other
+# columns, like accident_risk, are carried through untouched).  The input is read in fixed-size chunks, each
+# chunk goes through feature_engineer() and the model, and its rows are written out with a 'prediction'
+# column straight away, so memory stays at a few chunks however long the file is.
+#
+#   python bulk_score.py trips.csv scored.csv
+#   python bulk_score.py trips.parquet scored.parquet --chunk-size 200000 --workers 4
+#
+# Parquet needs pyarrow, which isn't part of the Lambda requirements.
+#
+# Curvature is binned against the training edges in the export's features.json, so every chunk is binned the
+# same way.  For an export without features.json (where feature_engineer() bins by the quantiles of whatever
+# it's given) the edges are taken from the whole file first, with one pass over the curvature column only,
+# which gives the same bins as scoring the file in one go.  --curvature-bins file forces that pass.
+
+BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', '100000'))
+
+# Report throughput after this many chunks
+BULK_REPORT_EVERY = 10
+
+FORMATS = ('csv', 'parquet')
+CURVATURE_BIN_MODES = ('model', 'file')
+
+def _format(path: str, fmt: str | None) -> str:
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    if fmt == 'pq':
+        fmt = 'parquet'
+    if fmt not in FORMATS:
+        raise ValueError(f"Can't tell the format of {path!r} (expected one of {', '.join(FORMATS)})")
+
+    return fmt
+
+def _parquet():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Reading or writing Parquet needs pyarrow (pip install pyarrow).")
+    return pyarrow
+
+def read_chunks(path: str, chunk_size: int = BULK_CHUNK_SIZE, fmt: str | None = None, columns: list[str] | None = None):
+    """
+    Yields the file as DataFrames of at most chunk_size rows.
+    """
+    import pandas as pd
+
+    if _format(path, fmt) == 'csv':
+        for chunk in pd.read_csv(path, chunksize=chunk_size, usecols=columns):
+            yield chunk.reset_index(drop=True)
+        return
+
+    pa = _parquet()
+    for batch in pa.parquet.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+        yield batch.to_pandas()
+
+class ChunkWriter:
+    """
+    Appends DataFrames to a CSV or Parquet file.
+    """
+
+    def __init__(self, path: str, fmt: str | None = None):
+        self.path = path
+        self.format = _format(path, fmt)
+        self._parquet_writer = None
+        self._started = False
+
+    def write(self, df) -> None:
+        if self.format == 'csv':
+            df.to_csv(self.path, mode='a' if self._started else 'w', header=not self._started, index=False)
+        else:
+            pa = _parquet()
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pa.parquet.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table)
+        self._started = True
+
+    def close(self) -> None:
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def file_curvature_edges(path: str, chunk_size: int = BULK_CHUNK_SIZE, fmt: str | None = None) -> list[float] | None:
+    """
+    The curvature bin edges for the whole file, as safe_quantile_bins() would find them.  None when the file
+    gets the fallback (everything 'medium').
+    """
+    values = np.concatenate([
+        chunk['curvature'].to_numpy(dtype=float) for chunk in read_chunks(path, chunk_size, fmt, columns=['curvature'])
+    ] or [np.empty(0)])
+
+    return model_artifact.curvature_edges(values)
+
+def _rebin_curvature(engineered, edges: list[float] | None):
+    bins = fixed_curvature_bins(edges)(engineered['curvature'].to_numpy(dtype=float)).astype(str)
+
+    engineered['curvature_bin'] = bins
+    engineered['speed_x_curvature_bin'] = engineered['speed_limit'].astype(str) + '_' + bins
+    for col in ('curvature_bin', 'speed_x_curvature_bin'):
+        engineered[col] = engineered[col].astype('category')
+
+_num_threads = None
+
+def _init_worker(num_threads: int) -> None:
+    global _num_threads
+    import app
+
+    app._init()
+    _num_threads = num_threads
+
+def score_chunk(chunk, curvature_bins: str = 'model', edges: list[float] | None = None) -> np.ndarray:
+    """
+    Predictions for one chunk of model inputs.  With curvature_bins='file', curvature is binned against the
+    given edges instead of the model's.
+    """
+    import app
+
+    engineered = app.feature_engineer(chunk, drop_duplicates=False)
+    if curvature_bins == 'file':
+        _rebin_curvature(engineered, edges)
+
+    X = engineered[app._meta['feature_names']]
+    return app._booster.predict(X, num_threads=_num_threads or app.model_artifact.LIGHTGBM_NUM_THREADS)
+
+def score_file(input_path: str, output_path: str, chunk_size: int = BULK_CHUNK_SIZE, workers: int = 1,
+               curvature_bins: str | None = None, input_format: str | None = None, output_format: str | None = None) -> dict:
+    """
+    Scores input_path chunk by chunk and writes it to output_path with a 'prediction' column.  With more than
+    one worker, chunks are scored in a process pool, with at most two chunks per worker in flight.  Returns
+    the row count, elapsed seconds and rows/sec.
+    """
+    import app
+
+    has_features = model_artifact.features_path(app.EXPORT_DIR) is not None
+    if curvature_bins is None:
+        curvature_bins = 'model' if has_features else 'file'
+    if curvature_bins not in CURVATURE_BIN_MODES:
+        raise ValueError(f"Unknown curvature_bins: {curvature_bins!r} (expected one of {', '.join(CURVATURE_BIN_MODES)})")
+    if curvature_bins == 'model' and not has_features:
+        raise ValueError(f"The export has no {model_artifact.FEATURES_FILE}; use curvature_bins='file'.")
+    if chunk_size < 1 or workers < 1:
+        raise ValueError("chunk_size and workers must be positive")
+
+    started = time.perf_counter()
+    edges = file_curvature_edges(input_path, chunk_size, input_format) if curvature_bins == 'file' else None
+
+    # Split the machine's threads between the workers
+    num_threads = max(app.model_artifact.LIGHTGBM_NUM_THREADS // workers, 1)
+
+    rows = 0
+    chunks = 0
+
+    def written(chunk, predictions) -> None:
+        nonlocal rows, chunks
+        writer.write(chunk.assign(prediction=predictions))
+        rows += len(chunk)
+        chunks += 1
+        if chunks % BULK_REPORT_EVERY == 0:
+            elapsed = time.perf_counter() - started
+            print(f"{rows:,} rows in {elapsed:.1f} s ({rows / elapsed:,.0f} rows/sec)")
+
+    with ChunkWriter(output_path, output_format) as writer:
+        source = read_chunks(input_path, chunk_size, input_format)
+        if workers == 1:
+            _init_worker(num_threads)
+            for chunk in source:
+                written(chunk, score_chunk(chunk, curvature_bins, edges))
+        else:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            # spawn rather than fork: LightGBM's OpenMP runtime doesn't survive a fork
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=(num_threads,)) as pool:
+                pending = collections.deque()
+                for chunk in source:
+                    pending.append((chunk, pool.submit(score_chunk, chunk, curvature_bins, edges)))
+                    if len(pending) >= 2 * workers:
+                        chunk, future = pending.popleft()
+                        written(chunk, future.result())
+                while pending:
+                    chunk, future = pending.popleft()
+                    written(chunk, future.result())
+
+    elapsed = time.perf_counter() - started
+    return {
+        'rows': rows,
+        'seconds': elapsed,
+        'rows_per_sec': rows / elapsed if elapsed > 0 else 0.0,
+    }
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Score a CSV or Parquet file of model inputs, chunk by chunk.")
+    parser.add_argument("input", help="Trips with model inputs (.csv or .parquet).")
+    parser.add_argument("output", help="Where to write the trips with a 'prediction' column (.csv or .parquet).")
+    parser.add_argument("--chunk-size", type=int, default=BULK_CHUNK_SIZE, help="Rows per chunk.")
+    parser.add_argument("--workers", type=int, default=1, help="Processes scoring chunks in parallel.")
+    parser.add_argument("--curvature-bins",
+                        help="'model' to bin curvature against the export's features.json (the default when it has one), "
+                             "or 'file' to bin by the quantiles of the whole file (an extra pass).")
+    parser.add_argument("--input-format", help="csv or parquet (default: from the file extension).")
+    parser.add_argument("--output-format", help="csv or parquet (default: from the file extension).")
+    args = parser.parse_args()
+
+    if args.curvature_bins is not None and args.curvature_bins not in CURVATURE_BIN_MODES:
+        parser.error(f"--curvature-bins must be one of {', '.join(CURVATURE_BIN_MODES)}")
+
+    try:
+        stats = score_file(args.input, args.output, args.chunk_size, args.workers, args.curvature_bins,
+                           args.input_format, args.output_format)
+    except (ValueError, RuntimeError) as e:
+        print(e)
+        sys.exit(1)
+
+    print(f"Scored {stats['rows']:,} rows in {stats['seconds']:.1f} s ({stats['rows_per_sec']:,.0f} rows/sec)")
@@ -0,0 +1,263 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+# Caching
+# Small, dependency-free caches shared by the upstream lookups.  Every cache has the same interface
+# (get/set/clear/stats), so the in-process LRU and the on-disk SQLite store can be swapped or stacked.
+# Entries may carry a time-to-live; expired entries are evicted when they are next touched.  reopen() is for
+# a forked worker: a SQLite connection mustn't be shared with the process it was opened in.
+
+_MISSING = object()
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def as_dict(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+def _expires_at(ttl: float | None) -> float | None:
+    if ttl is None:
+        return None
+
+    return time.time() + ttl
+
+class LRUCache:
+    """
+    A thread-safe, in-process LRU cache with optional per-entry TTL.
+
+    Args:
+        maxsize (int): Maximum number of entries kept before the least recently used one is evicted.
+        ttl (float | None): Default time-to-live in seconds.  None means entries never expire.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.stats.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.stats.hits += 1
+            return value
+
+    def set(self, key, value, ttl: float | None = _MISSING) -> None:
+        expires_at = _expires_at(self.ttl if ttl is _MISSING else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats.evictions += 1
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            return entry is not _MISSING and (entry[1] is None or entry[1] > time.time())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def reopen(self) -> None:
+        pass
+
+class SQLiteCache:
+    """
+    An on-disk cache backed by SQLite, so entries survive process restarts (and, on Lambda, live in /tmp
+    for the life of the execution environment).  Values must be JSON serializable.
+
+    Args:
+        path (str): The database file.  It is created if needed.
+        ttl (float | None): Default time-to-live in seconds.  None means entries never expire.
+    """
+
+    def __init__(self, path: str, ttl: float | None = None):
+        self.path = path
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._connect()
+
+    def _connect(self) -> None:
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+
+    def get_entry(self, key):
+        """
+        Returns (value, expires_at), or None when the key is missing or expired.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats.misses += 1
+                return None
+
+            value, expires_at = row
+            if expires_at is not None and expires_at <= time.time():
+                with self._conn:
+                    self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return None
+
+            self.stats.hits += 1
+            return json.loads(value), expires_at
+
+    def get(self, key, default=None):
+        entry = self.get_entry(key)
+        if entry is None:
+            return default
+
+        return entry[0]
+
+    def set(self, key, value, ttl: float | None = _MISSING) -> None:
+        expires_at = _expires_at(self.ttl if ttl is _MISSING else ttl)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at)
+            )
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            return row is not None and (row[0] is None or row[0] > time.time())
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def purge_expired(self) -> int:
+        with self._lock, self._conn:
+            cur = self._conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+            self.stats.expirations += cur.rowcount
+            return cur.rowcount
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache")
+
+    def reopen(self) -> None:
+        # A connection can't be carried across fork(); this process opens its own.
+        self._lock = threading.Lock()
+        self._connect()
+
+class TieredCache:
+    """
+    An in-process LRU in front of a slower backing cache.  Hits in the backing cache are promoted into the
+    LRU.  Counters reflect the tiered cache as a whole; each tier keeps its own as well.
+    """
+
+    def __init__(self, memory: LRUCache, backing):
+        self.memory = memory
+        self.backing = backing
+        self.stats = CacheStats()
+
+    def get(self, key, default=None):
+        value = self.memory.get(key, _MISSING)
+        if value is _MISSING:
+            entry = self.backing.get_entry(key)
+            if entry is None:
+                self.stats.misses += 1
+                return default
+
+            # Don't let the promoted copy outlive the backing entry
+            value, expires_at = entry
+            self.memory.set(key, value, None if expires_at is None else max(expires_at - time.time(), 0.0))
+
+        self.stats.hits += 1
+        return value
+
+    def set(self, key, value, ttl: float | None = _MISSING) -> None:
+        self.memory.set(key, value, ttl)
+        self.backing.set(key, value, ttl)
+
+    def __contains__(self, key) -> bool:
+        return key in self.memory or key in self.backing
+
+    def __len__(self) -> int:
+        return len(self.backing)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        self.backing.clear()
+
+    def reopen(self) -> None:
+        self.memory.reopen()
+        self.backing.reopen()
+
+def make_cache(maxsize: int = 256, ttl: float | None = None, path: str | None = None):
+    """
+    Builds the standard cache: an in-process LRU, optionally backed by SQLite when a path is given.
+    """
+    memory = LRUCache(maxsize=maxsize, ttl=ttl)
+    if not path:
+        return memory
+
+    return TieredCache(memory, SQLiteCache(path, ttl=ttl))
+
+def quantize(value: float, precision: int) -> str:
+    # Round a coordinate to a fixed number of decimal places and give it a stable text form for keys.
+    # (Adding 0.0 turns -0.0 into 0.0.)
+    return f"{round(value, precision) + 0.0:.{precision}f}"
+
+def ttl_from_headers(headers, default: float | None = None) -> float | None:
+    """
+    Works out how long an upstream response may be cached from its Cache-Control (max-age/s-maxage) or
+    Expires headers.  Returns the default when neither says anything useful, and 0 for no-store/no-cache.
+    """
+    h = {k.lower(): v for k, v in (headers or {}).items()}
+
+    cache_control = h.get("cache-control", "").lower()
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        return 0.0
+
+    match = re.search(r"(?:s-maxage|max-age)\s*=\s*(\d+)", cache_control)
+    if match:
+        return float(match.group(1))
+
+    if "expires" in h:
+        try:
+            expires = parsedate_to_datetime(h["expires"])
+        except (TypeError, ValueError):
+            return 0.0
+        return max(expires.timestamp() - time.time(), 0.0)
+
+    return default
@@ -0,0 +1,101 @@
+import numpy as np
+
+# Curvature Engine
+# Measures how curvy a route is by looking at the angle formed at every vertex of its (projected) LineString.
+# A perfectly straight run of points forms a 180 degree angle; the sharper the turn, the smaller the angle.
+# All vertices are handled in a single batched NumPy pass, which matters for long 'overview=full' routes
+# that can have tens of thousands of points.
+
+# Angle assigned to the first and last vertex, which can't form a triplet.
+ENDPOINT_ANGLE = 180.0
+
+# Any mean angle straighter than this is treated as perfectly straight.
+MAX_CURVY = 170.0
+
+def _as_xy(coords) -> np.ndarray:
+    xy = np.asarray(coords, dtype=float)
+    if xy.ndim != 2 or len(xy) == 0:
+        return np.empty((0, 2), dtype=float)
+
+    # Ignore any Z values
+    return xy[:, :2]
+
+def turn_angles(coords) -> np.ndarray:
+    """
+    Calculates the angle (in degrees) formed at each vertex of a coordinate array.
+
+    Args:
+        coords: An (N, 2) array-like of projected x/y coordinates.
+
+    Returns:
+        np.ndarray: N angles.  The first and last points get ENDPOINT_ANGLE, and any vertex next to a
+        zero-length segment gets 0.0, matching angle_p1p2p3().
+    """
+    xy = _as_xy(coords)
+    angles = np.full(len(xy), ENDPOINT_ANGLE, dtype=float)
+    if len(xy) < 3:
+        return angles
+
+    # Two arrows from each middle point: one back to the previous point, one forward to the next.
+    v1 = xy[:-2] - xy[1:-1]
+    v2 = xy[2:] - xy[1:-1]
+
+    # Robust atan2 using the 2D cross product and the dot product
+    cross = v1[:, 0] * v2[:, 1] - v1[:, 1] * v2[:, 0]
+    dot = np.einsum("ij,ij->i", v1, v2)
+    theta = np.degrees(np.arctan2(np.abs(cross), dot))
+
+    # The angle is undefined when either arrow has no length (repeated points).
+    degenerate = (np.einsum("ij,ij->i", v1, v1) == 0.0) | (np.einsum("ij,ij->i", v2, v2) == 0.0)
+    theta[degenerate] = 0.0
+
+    angles[1:-1] = theta
+
+    return angles
+
+def segment_lengths(coords) -> np.ndarray:
+    xy = _as_xy(coords)
+    if len(xy) < 2:
+        return np.empty(0, dtype=float)
+
+    return np.hypot(*np.diff(xy, axis=0).T)
+
+def vertex_weights(coords) -> np.ndarray:
+    """
+    Weights each vertex by half the length of the segments touching it, so the weights sum to the
+    length of the route.
+    """
+    lengths = segment_lengths(coords)
+    weights = np.zeros(len(lengths) + 1, dtype=float)
+    weights[:-1] += lengths / 2.0
+    weights[1:] += lengths / 2.0
+
+    return weights
+
+def normalize_curviness(mean_angle: float) -> float:
+    # Map the mean angle onto 0 (straight) .. 1 (as curvy as we measure).
+    raw_curviness = max(mean_angle, MAX_CURVY)
+
+    return (180.0 - raw_curviness) / (180.0 - MAX_CURVY)
+
+def curviness(coords) -> float:
+    """
+    The curviness used by the model: the plain mean of the vertex angles, normalized.
+    """
+    angles = turn_angles(coords)
+    if len(angles) == 0:
+        return float("nan")
+
+    return normalize_curviness(float(angles.mean()))
+
+def distance_weighted_curviness(coords) -> float:
+    """
+    Like curviness(), but each vertex counts in proportion to the distance it represents.  Dense clusters
+    of points (common in towns and interchanges) no longer outweigh long straight stretches.
+    """
+    angles = turn_angles(coords)
+    weights = vertex_weights(coords)
+    if len(angles) == 0 or weights.sum() == 0.0:
+        return curviness(coords)
+
+    return normalize_curviness(float(np.average(angles, weights=weights)))
@@ -1,5 +1,16 @@
 #!/usr/bin/env bash
 
+# The image ships whatever is in ml_model/export, so check it was exported for this code first.  The repo only
+# tracks meta.json; re-export from the trained model and its training data with:
+#   python model_artifact.py ml_model/export --training-data data/train.csv
+# Without features.json, a live trip's curvature always lands in the 'medium' bin.
+for artifact in model.txt features.json; do
+  if [ ! -f "ml_model/export/$artifact" ]; then
+    echo "ml_model/export/$artifact is missing; re-export the model before deploying (see model_artifact.py)." >&2
+    exit 1
+  fi
+done
+
 # Ensure authorization token is active
 aws ecr get-login-password | docker login --username AWS --password-stdin   $(aws sts get-caller-identity --query 'Account' --output text).dkr.ecr.$(aws configure get region).amazonaws.com
 
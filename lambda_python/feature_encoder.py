@@ -0,0 +1,126 @@
+import numpy as np
+
+from model_artifact import CURVATURE_BIN_LABELS, curvature_edges
+
+# Feature Encoder
+# For live predictions, building a DataFrame and running feature_engineer() costs more than the model call.  The
+# FeatureEncoder does the same feature engineering on plain dicts, and writes the result straight into a
+# float64 NumPy matrix laid out the way LightGBM sees a DataFrame: columns in meta.json 'feature_names' order,
+# booleans as 0/1, and categorical columns as their code in the model's category list (NaN when unseen).
+# That matrix goes directly to Booster.predict().
+
+def fixed_curvature_bins(edges, labels=CURVATURE_BIN_LABELS):
+    """
+    A curvature_bins function that bins against fixed edges (the training quantiles in features.json) with
+    one searchsorted, so a row gets the same bin whatever batch it's in.  Curvatures outside the training
+    range go in the lowest or highest bin.  Without edges, everything is 'medium'.
+    """
+    labels = list(labels)
+    names = np.array(labels + ['nan'], dtype=object)
+    inner = None if edges is None else np.asarray(edges, dtype=float)[1:-1]
+
+    def curvature_bins(curvatures: np.ndarray) -> np.ndarray:
+        values = np.asarray(curvatures, dtype=float)
+        if inner is None:
+            return names[np.full(len(values), len(labels) // 2)]
+
+        # Bins are closed on the right: (e0, e1], (e1, e2], (e2, e3]
+        idx = np.searchsorted(inner, values, side='left')
+        idx[np.isnan(values)] = len(labels)
+        return names[idx]
+
+    return curvature_bins
+
+def quantile_curvature_bins(curvatures: np.ndarray) -> np.ndarray:
+    """
+    Bins curvature by the quantiles of the batch itself, exactly as safe_quantile_bins() does: batches with
+    fewer than 6 rows, no variation, or repeated edges all get 'medium'.  This is what the model was trained
+    with, and what's used when the export has no features.json.
+    """
+    return fixed_curvature_bins(curvature_edges(curvatures))(curvatures)
+
+class FeatureEncoder:
+    """
+    Turns model-inputs dicts into a feature matrix for the model.
+
+    Args:
+        feature_names (list[str]): Column order the model was trained with (meta.json 'feature_names').
+        categorical_features (list[str]): Which of those columns are categorical.
+        pandas_categorical (list[list]): The category lists the model was trained with, in the order the
+            categorical columns appear in feature_names (Booster.pandas_categorical).
+        curvature_bins: Function mapping an array of curvatures to bin labels.
+    """
+
+    def __init__(self, feature_names, categorical_features, pandas_categorical, curvature_bins=quantile_curvature_bins):
+        self.feature_names = list(feature_names)
+        self.categorical_features = set(categorical_features)
+        self.curvature_bins = curvature_bins
+
+        categorical_columns = [name for name in self.feature_names if name in self.categorical_features]
+        if len(categorical_columns) != len(pandas_categorical or []):
+            raise ValueError("The model's category lists don't match meta.json's categorical_features.")
+
+        # value -> code for each categorical column
+        self.codes = {
+            name: {str(value): float(code) for code, value in enumerate(categories)}
+            for name, categories in zip(categorical_columns, pandas_categorical)
+        }
+
+    @classmethod
+    def from_model(cls, meta: dict, model, **kwargs) -> "FeatureEncoder":
+        booster = getattr(model, 'booster_', model)
+        if list(booster.feature_name()) != list(meta['feature_names']):
+            raise ValueError("meta.json feature_names don't match the model's features.")
+
+        return cls(meta['feature_names'], meta['categorical_features'], booster.pandas_categorical, **kwargs)
+
+    def bin_curvature(self, rows: list[dict]) -> list[str]:
+        return self.curvature_bins(np.array([float(r['curvature']) for r in rows], dtype=float))
+
+    def bin_curvature_each(self, rows: list[dict]) -> list[str]:
+        """
+        The bin each row gets when it's scored by itself, so it doesn't depend on what else is in the batch.
+        Against fixed edges that's what bin_curvature() gives; with quantile bins, it's the 'medium' fallback.
+        """
+        return [self.curvature_bins(np.array([float(r['curvature'])], dtype=float))[0] for r in rows]
+
+    def engineer(self, rows: list[dict], bins: list[str] | None = None) -> list[dict]:
+        """
+        The feature_engineer() steps for a list of model-inputs dicts.  Returns new dicts with every feature.
+        The curvature bins can be passed in when they were worked out over a larger batch.
+        """
+        if bins is None:
+            bins = self.bin_curvature(rows)
+
+        engineered = []
+        for r, curvature_bin in zip(rows, bins):
+            e = dict(r)
+            # Underivable in production; the model gets a zero.
+            e['num_reported_accidents'] = 0.0
+            e['speed_curvature_ratio'] = r['speed_limit'] / (r['curvature'] + 1e-6)
+            e['weather_lighting'] = f"{r['weather']}_{r['lighting']}"
+            e['curvature_bin'] = curvature_bin
+            e['curvature_sq'] = r['curvature'] ** 2
+            e['speed_limit_sq'] = r['speed_limit'] ** 2
+            e['speed_x_curvature_bin'] = f"{r['speed_limit']}_{curvature_bin}"
+            e['holiday_x_lighting'] = f"{r['holiday']}_{r['lighting']}"
+            engineered.append(e)
+
+        return engineered
+
+    def encode_many(self, rows: list[dict], bins: list[str] | None = None) -> np.ndarray:
+        X = np.empty((len(rows), len(self.feature_names)), dtype=np.float64)
+
+        for i, e in enumerate(self.engineer(rows, bins)):
+            for j, name in enumerate(self.feature_names):
+                value = e[name]
+                codes = self.codes.get(name)
+                if codes is not None:
+                    X[i, j] = codes.get(str(value), np.nan)
+                else:
+                    X[i, j] = float(value)
+
+        return X
+
+    def encode(self, row: dict) -> np.ndarray:
+        return self.encode_many([row])
@@ -0,0 +1,33 @@
+import os
+
+# Gunicorn Settings
+# Pre-fork serving for the container deployment (the Lambda doesn't use this):
+#
+#   gunicorn -c gunicorn.conf.py wsgi:application
+#
+# The app is preloaded in the master (see wsgi.py) and forked into WEB_CONCURRENCY workers, each with
+# GUNICORN_THREADS threads.  The upstream calls are I/O bound, so a few threads per worker keep a core busy.
+
+def _cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '9400')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', str(_cpus())))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+worker_class = 'gthread'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+preload_app = True
+accesslog = '-'
+
+# Split the cores between the workers, so LightGBM's OpenMP threads don't oversubscribe them.  These have to
+# be set before the app (and so LightGBM) is loaded, which preload_app does right after reading this file.
+os.environ.setdefault('LIGHTGBM_NUM_THREADS', str(max(_cpus() // workers, 1)))
+os.environ.setdefault('OMP_NUM_THREADS', os.environ['LIGHTGBM_NUM_THREADS'])
+
+def post_fork(server, worker):
+    import app
+
+    app.after_fork()
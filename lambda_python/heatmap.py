@@ -0,0 +1,403 @@
+import datetime
+import json
+import math
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import model_artifact
+from cache import LRUCache
+from feature_encoder import fixed_curvature_bins
+
+# Risk Heatmap Tiles
+# A regional risk overlay, worked out ahead of time.  The area is covered with web-mercator tiles (the z/x/y
+# scheme map libraries use), each tile is split into a grid of cells, and every cell gets a short trip across
+# its center.  Directions for all of the trips are fetched through the directions cache with bounded
+# concurrency, their route inputs are worked out, the time inputs for the time slice are worked out for the
+# whole grid at once, and the trips are scored in large batches.  Curvature is binned against one set of edges
+# for the whole grid (the training edges in features.json, or else the quantiles of every cell's curvature),
+# so neighbouring tiles scored in different batches don't show seams.
+#
+# Each tile is written as a small float16 NumPy array (HEATMAP_CELLS x HEATMAP_CELLS, NaN where no trip could
+# be scored) under <HEATMAP_DIR>/<slice>/<z>/<x>/<y>.npy, next to a manifest.json for the slice.  Serving a
+# tile or a point is then a file lookup and some index arithmetic (see app.py's /heatmap routes).
+#
+#   python heatmap.py --bbox 32.65,-97.45,32.85,-97.2 --date 2025-10-24T16:30
+#   python heatmap.py --bbox 32.65,-97.45,32.85,-97.2 --date 2025-10-24T16:30 --fixtures   # no network
+#
+# With --fixtures, Directions are synthesized from each trip's coordinates (see benchmark.py), so the whole
+# pipeline runs offline.  For real runs over a large area, set DIRECTIONS_CACHE_PATH so the directions
+# survive between time slices.
+
+HEATMAP_DIR = os.environ.get('HEATMAP_DIR', 'heatmap_tiles')
+HEATMAP_ZOOM = int(os.environ.get('HEATMAP_ZOOM', '12'))
+
+# Cells along each side of a tile (a zoom 12 tile is about 9.8 km across at the equator)
+HEATMAP_CELLS = int(os.environ.get('HEATMAP_CELLS', '16'))
+
+# Length of the east-west trip across each cell, in meters
+HEATMAP_TRIP_METERS = float(os.environ.get('HEATMAP_TRIP_METERS', '800'))
+
+# Directions requests in flight at once, and trips per model call
+HEATMAP_CONCURRENCY = int(os.environ.get('HEATMAP_CONCURRENCY', '8'))
+HEATMAP_BATCH_SIZE = int(os.environ.get('HEATMAP_BATCH_SIZE', '4096'))
+
+# Tiles kept in memory by the server
+HEATMAP_TILE_CACHE_SIZE = int(os.environ.get('HEATMAP_TILE_CACHE_SIZE', '1024'))
+HEATMAP_TILE_CACHE_TTL = float(os.environ.get('HEATMAP_TILE_CACHE_TTL', '300'))
+
+MANIFEST_FILE = 'manifest.json'
+METERS_PER_DEGREE = 111320.0
+
+_SLICE_NAME = re.compile(r'^[\w.-]+$')
+
+# Tile Geometry
+def tile_coordinates(lat, lng, zoom: int):
+    """
+    Fractional web-mercator tile coordinates (x, y) of a location.
+    """
+    n = 2.0 ** zoom
+    lat_rad = np.radians(np.clip(lat, -85.05112878, 85.05112878))
+    x = (np.asarray(lng, dtype=float) + 180.0) / 360.0 * n
+    y = (1.0 - np.arcsinh(np.tan(lat_rad)) / math.pi) / 2.0 * n
+
+    return x, y
+
+def tile_location(x, y, zoom: int):
+    """
+    (lat, lng) of fractional tile coordinates.
+    """
+    n = 2.0 ** zoom
+    lng = np.asarray(x, dtype=float) / n * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(math.pi * (1.0 - 2.0 * np.asarray(y, dtype=float) / n))))
+
+    return lat, lng
+
+def tiles_covering(south: float, west: float, north: float, east: float, zoom: int) -> list[tuple[int, int]]:
+    if south >= north or west >= east:
+        raise ValueError("The bounding box must be south < north and west < east")
+
+    x0, y0 = tile_coordinates(north, west, zoom)
+    x1, y1 = tile_coordinates(south, east, zoom)
+
+    return [(x, y) for y in range(int(y0), int(y1) + 1) for x in range(int(x0), int(x1) + 1)]
+
+def cell_centers(x: int, y: int, zoom: int, cells: int = HEATMAP_CELLS) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (lats, lngs) of the cell centers of a tile, each (cells, cells) with row 0 at the tile's north edge.
+    """
+    offsets = (np.arange(cells) + 0.5) / cells
+    fx, fy = np.meshgrid(x + offsets, y + offsets)
+
+    return tile_location(fx, fy, zoom)
+
+def cell_index(lat: float, lng: float, zoom: int, cells: int = HEATMAP_CELLS) -> tuple[int, int, int, int]:
+    """
+    The tile (x, y) and the cell (row, column) in it that contain a location.
+    """
+    fx, fy = tile_coordinates(lat, lng, zoom)
+    x, y = int(fx), int(fy)
+
+    return x, y, min(int((fy - y) * cells), cells - 1), min(int((fx - x) * cells), cells - 1)
+
+def cell_trips(lats: np.ndarray, lngs: np.ndarray, trip_meters: float = HEATMAP_TRIP_METERS) -> np.ndarray:
+    """
+    An east-west trip across each cell center, as an (N, 4) array of o_lat, o_lng, d_lat, d_lng.
+    """
+    lats, lngs = np.ravel(lats), np.ravel(lngs)
+    half = trip_meters / 2.0 / (METERS_PER_DEGREE * np.cos(np.radians(lats)))
+
+    return np.c_[lats, lngs - half, lats, lngs + half]
+
+# Building
+def slice_name_for(dt: datetime.datetime) -> str:
+    return dt.strftime('%Y-%m-%dT%H%M')
+
+def _check_slice_name(slice_name: str) -> str:
+    if not _SLICE_NAME.match(slice_name) or slice_name.strip('.') == '':
+        raise ValueError(f"Invalid slice name: {slice_name!r}")
+
+    return slice_name
+
+def tile_path(out_dir: str, slice_name: str, zoom: int, x: int, y: int) -> str:
+    return os.path.join(out_dir, _check_slice_name(slice_name), str(zoom), str(x), f"{y}.npy")
+
+def _trip_route_inputs(trip: np.ndarray, weather: str):
+    import app
+
+    o_lat, o_lng, d_lat, d_lng = (float(v) for v in trip)
+    try:
+        mapbox_data, route_xy = app.read_mapbox_directions(o_lat, o_lng, d_lat, d_lng)
+        if mapbox_data.get('code') != 'Ok' or not mapbox_data.get('routes'):
+            return None
+        return mapbox_data['routes'][0]['duration'], app.directions_route_inputs(mapbox_data, route_xy, weather)
+    except Exception as e:
+        print(f"No route for the cell at {(o_lat + d_lat) / 2:.5f}, {(o_lng + d_lng) / 2:.5f}: {e}")
+        return None
+
+def grid_time_inputs(lats: np.ndarray, lngs: np.ndarray, durations: np.ndarray, dt: datetime.datetime) -> dict:
+    """
+    trip_time_inputs() for a trip from each location, all leaving at dt.  Returns a dict of arrays.
+    """
+    import app
+    import solar
+
+    starts = np.full(len(lats), np.datetime64(dt.replace(tzinfo=None), 'us'))
+    ends = starts + (durations * 1e6).round().astype('timedelta64[us]')
+
+    # Lighting at the start of each trip.  A metro area is in one timezone: use the one at its center.
+    tzname = solar.context.timezone_name(float(np.mean(lats)), float(np.mean(lngs)))
+    departure = solar.context.localize(dt, tzname).timestamp()
+    lighting = solar.context.lighting_along(lats, lngs, np.full(len(lats), departure), tzname)
+
+    return {
+        'lighting': lighting,
+        **app.trip_window_inputs(starts, ends),
+        'school_season': np.full(len(lats), app.is_school_season(dt)),
+    }
+
+def regional_weather(lat: float, lng: float) -> str:
+    import app
+
+    try:
+        return app.get_current_weather_at(lat, lng)
+    except Exception as e:
+        print(f"No forecast for {lat:.4f}, {lng:.4f} ({e}); using '{app.DEFAULT_WEATHER}'.")
+        return app.DEFAULT_WEATHER
+
+def grid_curvature_bins(curvatures: np.ndarray):
+    """
+    The curvature_bins function for a whole grid: the model's training edges when the export has them,
+    otherwise the quantile edges of every cell's curvature (as bulk_score.file_curvature_edges() does for a
+    file).
+    """
+    import app
+
+    if app._curvature_bins is not None:
+        return app._curvature_bins
+
+    return fixed_curvature_bins(model_artifact.curvature_edges(np.asarray(curvatures, dtype=float)))
+
+def _write_tile(path: str, risk: np.ndarray) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        np.save(f, risk.astype(np.float16))
+    os.replace(tmp, path)
+
+def build(bbox: tuple[float, float, float, float], dt: datetime.datetime, slice_name: str | None = None,
+          weather: str | None = None, zoom: int = HEATMAP_ZOOM, cells: int = HEATMAP_CELLS,
+          out_dir: str = HEATMAP_DIR, trip_meters: float = HEATMAP_TRIP_METERS,
+          concurrency: int = HEATMAP_CONCURRENCY, batch_size: int = HEATMAP_BATCH_SIZE) -> dict:
+    """
+    Builds the tiles covering bbox (south, west, north, east) for trips leaving at dt.  The route inputs for
+    every cell are fetched first, in groups of about batch_size cells, so the curvature edges can be taken
+    from the whole grid.  Then each group is scored in one model call and its tiles are written.  Returns a
+    summary.
+    """
+    import app
+
+    app._init()
+
+    south, west, north, east = bbox
+    slice_name = _check_slice_name(slice_name or slice_name_for(dt))
+    tiles = tiles_covering(south, west, north, east, zoom)
+    if weather is None:
+        weather = regional_weather((south + north) / 2.0, (west + east) / 2.0)
+
+    started = time.perf_counter()
+    scored = 0
+    failed = 0
+    tiles_per_group = max(batch_size // (cells * cells), 1)
+
+    groups = []
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1), thread_name_prefix="heatmap") as pool:
+        for g in range(0, len(tiles), tiles_per_group):
+            group = tiles[g:g + tiles_per_group]
+            centers = [cell_centers(x, y, zoom, cells) for x, y in group]
+            lats = np.concatenate([lat.ravel() for lat, _ in centers])
+            lngs = np.concatenate([lng.ravel() for _, lng in centers])
+
+            routes = list(pool.map(lambda trip: _trip_route_inputs(trip, weather), cell_trips(lats, lngs, trip_meters)))
+            groups.append((group, lats, lngs, routes))
+
+            elapsed = time.perf_counter() - started
+            fetched = sum(len(routes) for _, _, _, routes in groups)
+            print(f"Fetched {min(g + tiles_per_group, len(tiles))}/{len(tiles)} tiles, {fetched:,} cells "
+                  f"in {elapsed:.1f} s ({fetched / elapsed:,.0f} cells/sec)")
+
+    # One set of curvature edges for every group
+    curvature_bins = grid_curvature_bins([r[1]['curvature'] for _, _, _, routes in groups for r in routes if r is not None])
+
+    for group, lats, lngs, routes in groups:
+        ok = np.array([r is not None for r in routes], dtype=bool)
+
+        risk = np.full(len(routes), np.nan)
+        if ok.any():
+            durations = np.array([r[0] for r in routes if r is not None], dtype=float)
+            time_inputs = {k: v.tolist() for k, v in grid_time_inputs(lats[ok], lngs[ok], durations, dt).items()}
+            rows = [
+                app.combine_model_inputs(route_inputs, {k: v[i] for k, v in time_inputs.items()})
+                for i, (_, route_inputs) in enumerate(r for r in routes if r is not None)
+            ]
+            bins = curvature_bins(np.array([row['curvature'] for row in rows], dtype=float))
+            risk[ok] = app.predict_model_inputs(rows, list(bins))
+
+        scored += int(ok.sum())
+        failed += int((~ok).sum())
+        for i, (x, y) in enumerate(group):
+            tile_risk = risk[i * cells * cells:(i + 1) * cells * cells].reshape(cells, cells)
+            _write_tile(tile_path(out_dir, slice_name, zoom, x, y), tile_risk)
+
+    elapsed = time.perf_counter() - started
+    print(f"Scored {scored + failed:,} cells in {elapsed:.1f} s ({(scored + failed) / elapsed:,.0f} cells/sec)")
+
+    manifest = {
+        'slice': slice_name,
+        'departure': dt.isoformat(),
+        'weather': weather,
+        'bbox': [south, west, north, east],
+        'zoom': zoom,
+        'cells': cells,
+        'trip_meters': trip_meters,
+        'tiles': [[x, y] for x, y in tiles],
+        'scored': scored,
+        'failed': failed,
+        'seconds': elapsed,
+        'built': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+    with open(os.path.join(out_dir, slice_name, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+# Serving
+_tiles = LRUCache(maxsize=HEATMAP_TILE_CACHE_SIZE, ttl=HEATMAP_TILE_CACHE_TTL)
+_manifests = LRUCache(maxsize=64, ttl=HEATMAP_TILE_CACHE_TTL)
+
+def load_manifest(slice_name: str, out_dir: str = HEATMAP_DIR) -> dict | None:
+    path = os.path.join(out_dir, _check_slice_name(slice_name), MANIFEST_FILE)
+    manifest = _manifests.get(path)
+    if manifest is None:
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+        _manifests.set(path, manifest)
+
+    return manifest
+
+def load_tile(slice_name: str, zoom: int, x: int, y: int, out_dir: str = HEATMAP_DIR) -> np.ndarray | None:
+    path = tile_path(out_dir, slice_name, zoom, x, y)
+    risk = _tiles.get(path)
+    if risk is None:
+        if not os.path.exists(path):
+            return None
+        risk = np.load(path)
+        _tiles.set(path, risk)
+
+    return risk
+
+def tile_json(risk: np.ndarray) -> list:
+    # Three decimals is plenty for an overlay; cells without a score are null
+    return [[None if np.isnan(v) else round(float(v), 3) for v in row] for row in risk]
+
+def risk_at(slice_name: str, lat: float, lng: float, out_dir: str = HEATMAP_DIR) -> dict | None:
+    """
+    The risk of the cell containing a location, or None when the slice doesn't cover it.
+    """
+    manifest = load_manifest(slice_name, out_dir)
+    if manifest is None:
+        return None
+
+    zoom, cells = manifest['zoom'], manifest['cells']
+    x, y, row, col = cell_index(lat, lng, zoom, cells)
+    risk = load_tile(slice_name, zoom, x, y, out_dir)
+    if risk is None:
+        return None
+
+    value = float(risk[row, col])
+    return {
+        'slice': slice_name,
+        'tile': [zoom, x, y],
+        'cell': [row, col],
+        'prediction': None if math.isnan(value) else value,
+    }
+
+# Offline Directions
+def install_fixtures():
+    """
+    Routes upstream HTTP to a stand-in that synthesizes a short route for any trip (see benchmark.py), with
+    the road class, urban markers and meander picked from the trip's coordinates, so the grid has some
+    variety and every run sees the same data.
+    """
+    import hashlib
+    import upstream
+    from benchmark import FixtureClient, FixtureResponse, synthesize_directions
+
+    class GridFixtureClient(FixtureClient):
+        CLASSES = (('street',), ('secondary', 'street'), ('primary',), ('motorway',), ('trunk', 'primary'))
+
+        def get(self, url: str, timeout=None, **kwargs):
+            match = self.DIRECTIONS.search(url)
+            if match is None:
+                return super().get(url, timeout=timeout, **kwargs)
+
+            self.requests += 1
+            o_lng, o_lat, d_lng, d_lat = map(float, match.groups())
+            seed = int.from_bytes(hashlib.sha256(match.group(0).encode()).digest()[:4], 'little')
+            rng = np.random.default_rng(seed)
+            spec = dict(
+                o=(o_lat, o_lng), d=(d_lat, d_lng), points=40, steps=4,
+                classes=self.CLASSES[rng.integers(len(self.CLASSES))], urban=bool(rng.random() < 0.6),
+                wiggle=float(rng.uniform(0.0002, 0.003)), weather='Sunny',
+            )
+            return FixtureResponse(synthesize_directions(spec))
+
+    os.environ.setdefault('MAPBOX_TOKEN', 'fixtures')
+    upstream.client = GridFixtureClient()
+
+    return upstream.client
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build risk heatmap tiles for an area and a departure time.")
+    parser.add_argument("--bbox", required=True, help="south,west,north,east in degrees.")
+    parser.add_argument("--date", required=True, help="Departure time (local), e.g. 2025-10-24T16:30.")
+    parser.add_argument("--slice", help="Name of the time slice (default: from the date).")
+    parser.add_argument("--weather", help="Weather for the whole area (default: the NWS forecast at its center).")
+    parser.add_argument("--zoom", type=int, default=HEATMAP_ZOOM, help="Tile zoom level.")
+    parser.add_argument("--cells", type=int, default=HEATMAP_CELLS, help="Cells along each side of a tile.")
+    parser.add_argument("--out", default=HEATMAP_DIR, help="Where to write the tiles.")
+    parser.add_argument("--concurrency", type=int, default=HEATMAP_CONCURRENCY, help="Directions requests in flight.")
+    parser.add_argument("--fixtures", action="store_true", help="Synthesize Directions offline instead of calling Mapbox.")
+    args = parser.parse_args()
+
+    try:
+        bbox = tuple(float(v) for v in args.bbox.split(','))
+        if len(bbox) != 4:
+            raise ValueError
+    except ValueError:
+        parser.error("--bbox must be four numbers: south,west,north,east")
+
+    try:
+        dt = datetime.datetime.fromisoformat(args.date)
+    except ValueError:
+        parser.error("--date must be an ISO date and time")
+
+    if args.fixtures:
+        install_fixtures()
+
+    try:
+        manifest = build(bbox, dt, args.slice, args.weather, args.zoom, args.cells, args.out, concurrency=args.concurrency)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+    print(f"Wrote {len(manifest['tiles'])} tiles to {os.path.join(args.out, manifest['slice'])}: "
+          f"{manifest['scored']:,} cells scored, {manifest['failed']:,} without a route, in {manifest['seconds']:.1f} s")
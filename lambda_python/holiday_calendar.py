@@ -0,0 +1,141 @@
+import datetime
+import os
+import threading
+
+import numpy as np
+
+# Holidays
+# Building a pandas holiday calendar and asking it for a year of dates is slow, and is_holiday() used to do
+# it on every call.  The HolidayService works the dates out once for a range of years, keeps them in frozen
+# sets for O(1) membership checks, and also as sorted NumPy arrays for checking many dates at once (e.g.
+# sweeping departure times).  Years outside the range are computed the first time they're asked about.
+#
+# Calendars are pluggable per region (e.g. state holidays).  A calendar is anything with a pandas-style
+# holidays(start=..., end=...) method, such as a pandas AbstractHolidayCalendar subclass, or a plain
+# function taking (start, end) dates and returning an iterable of dates.
+
+DEFAULT_REGION = 'US'
+
+# Years precomputed around the current one
+HOLIDAY_YEARS_BACK = int(os.environ.get('HOLIDAY_YEARS_BACK', '1'))
+HOLIDAY_YEARS_AHEAD = int(os.environ.get('HOLIDAY_YEARS_AHEAD', '2'))
+
+def us_federal_holidays(start: datetime.date, end: datetime.date):
+    from pandas.tseries.holiday import USFederalHolidayCalendar
+
+    return USFederalHolidayCalendar().holidays(start=start, end=end)
+
+def _as_date(value) -> datetime.date:
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    # pandas Timestamp, numpy datetime64, ...
+    return datetime.date.fromisoformat(str(value)[:10])
+
+class HolidayService:
+    """
+    Precomputed holiday dates for one or more regions.
+
+    Args:
+        start_year (int | None): First year to precompute.  Defaults to HOLIDAY_YEARS_BACK before this year.
+        end_year (int | None): Last year to precompute.  Defaults to HOLIDAY_YEARS_AHEAD after this year.
+    """
+
+    def __init__(self, start_year: int | None = None, end_year: int | None = None):
+        this_year = datetime.date.today().year
+        self.start_year = start_year if start_year is not None else this_year - HOLIDAY_YEARS_BACK
+        self.end_year = end_year if end_year is not None else this_year + HOLIDAY_YEARS_AHEAD
+
+        self._calendars = {DEFAULT_REGION: us_federal_holidays}
+        self._dates = {}
+        self._years = {}
+        self._arrays = {}
+        self._lock = threading.Lock()
+
+    def register(self, region: str, calendar) -> None:
+        """
+        Add (or replace) the calendar for a region.  A calendar class (rather than an instance) is only
+        instantiated when the region is first used.
+        """
+        with self._lock:
+            self._calendars[region] = calendar
+            self._dates.pop(region, None)
+            self._years.pop(region, None)
+            self._arrays.pop(region, None)
+
+    @property
+    def regions(self) -> list[str]:
+        return list(self._calendars)
+
+    def _calendar(self, region: str):
+        calendar = self._calendars[region]
+        if isinstance(calendar, type):
+            calendar = self._calendars[region] = calendar()
+        return calendar
+
+    def _compute(self, region: str, first_year: int, last_year: int) -> set:
+        calendar = self._calendar(region)
+        start = datetime.date(first_year, 1, 1)
+        end = datetime.date(last_year, 12, 31)
+        if hasattr(calendar, 'holidays'):
+            found = calendar.holidays(start=start, end=end)
+        else:
+            found = calendar(start, end)
+
+        return {_as_date(d) for d in found}
+
+    def _ensure(self, region: str, year: int) -> None:
+        if year in self._years.get(region, ()):
+            return
+
+        with self._lock:
+            years = self._years.get(region)
+            if years is None:
+                # First use of this region: do the whole configured range in one go.
+                first, last = min(self.start_year, year), max(self.end_year, year)
+                dates = self._compute(region, first, last)
+                years = frozenset(range(first, last + 1))
+            elif year not in years:
+                dates = set(self._dates[region]) | self._compute(region, year, year)
+                years = years | {year}
+            else:
+                return
+
+            self._dates[region] = frozenset(dates)
+            self._arrays[region] = np.array(sorted(dates), dtype='datetime64[D]')
+            self._years[region] = years
+
+    def preload(self, regions=None) -> None:
+        for region in regions or self.regions:
+            self._ensure(region, self.start_year)
+
+    def dates(self, region: str = DEFAULT_REGION) -> frozenset:
+        self._ensure(region, self.start_year)
+
+        return self._dates[region]
+
+    def is_holiday(self, value, region: str = DEFAULT_REGION) -> bool:
+        day = _as_date(value)
+        self._ensure(region, day.year)
+
+        return day in self._dates[region]
+
+    def is_holiday_many(self, values, region: str = DEFAULT_REGION) -> np.ndarray:
+        """
+        Vectorized is_holiday() for an array of dates/datetimes.  Returns a boolean array.
+        """
+        days = np.asarray(values)
+        if days.dtype.kind != 'M':
+            # Calendar dates as seen by each value (also right for timezone-aware datetimes)
+            days = np.array([_as_date(v) for v in days.ravel()], dtype='datetime64[D]').reshape(days.shape)
+        days = days.astype('datetime64[D]')
+        if days.size == 0:
+            return np.zeros(days.shape, dtype=bool)
+
+        for year in np.unique(days.astype('datetime64[Y]').astype(int) + 1970):
+            self._ensure(region, int(year))
+
+        return np.isin(days, self._arrays[region])
+
+holidays = HolidayService()
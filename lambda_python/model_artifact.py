@@ -0,0 +1,189 @@
+import json
+import os
+
+# Model Artifacts
+# The model is exported next to meta.json in LightGBM's native text format (model.txt), which a plain
+# lightgbm.Booster loads directly: no unpickling, and no scikit-learn wrapper to rebuild.  The category lists
+# LightGBM needs for the categorical columns are stored in the same file.  The pickled sklearn model
+# (model.pkl) is still loaded when no native file has been exported.
+#
+# To convert an existing pickle:
+#
+#   python model_artifact.py ml_model/export
+#
+# features.json, also next to meta.json, holds what feature engineering learned from the training data: the
+# curvature bin edges (the quantiles feature_engineer() cut the training frame at) and each categorical
+# column's vocabulary.  With it, curvature is binned the same way for one live row as for a million-row
+# file.  The notebook writes it with the model; for an older export, pass the training data:
+#
+#   python model_artifact.py ml_model/export --training-data data/train.csv
+
+EXPORT_DIR = 'ml_model/export'
+META_FILE = 'meta.json'
+NATIVE_MODEL_FILE = 'model.txt'
+PICKLED_MODEL_FILE = 'model.pkl'
+FEATURES_FILE = 'features.json'
+
+# The quantiles curvature is binned at, and the bin names (as in feature_engineer())
+CURVATURE_BIN_QUANTILES = (0.0, 0.25, 0.75, 1.0)
+CURVATURE_BIN_LABELS = ('low', 'medium', 'high')
+
+def default_num_threads() -> int:
+    # The CPUs this process may actually run on (on Lambda, the vCPUs that come with the memory setting)
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+# Threads LightGBM uses per prediction.  Live requests score a handful of rows, where spinning up more
+# threads than the function has vCPUs only adds overhead.
+LIGHTGBM_NUM_THREADS = int(os.environ.get('LIGHTGBM_NUM_THREADS', '0')) or default_num_threads()
+
+def _major_minor(version: str) -> tuple[int, ...]:
+    return tuple(int(part) for part in version.split('.')[:2] if part.isdigit())
+
+def check_version(meta: dict, installed: str) -> None:
+    """
+    Compares the LightGBM version the model was trained with (meta.json 'lightgbm_version') against the
+    installed one.  A different major version is an error; a different minor version is only reported.
+    """
+    trained = meta.get('lightgbm_version')
+    if not trained:
+        return
+
+    trained_mm, installed_mm = _major_minor(trained), _major_minor(installed)
+    if trained_mm[:1] != installed_mm[:1]:
+        raise RuntimeError(f"The model was trained with LightGBM {trained}, but LightGBM {installed} is installed.")
+    if trained_mm != installed_mm:
+        print(f"Model was trained with LightGBM {trained}; running with LightGBM {installed}.")
+
+def model_path(export_dir: str = EXPORT_DIR, meta: dict | None = None) -> str:
+    """
+    The model file to load: the one meta.json names, otherwise the native export when there is one.
+    """
+    if meta and meta.get('model_file'):
+        return os.path.join(export_dir, meta['model_file'])
+
+    native = os.path.join(export_dir, NATIVE_MODEL_FILE)
+    if os.path.exists(native):
+        return native
+
+    return os.path.join(export_dir, PICKLED_MODEL_FILE)
+
+def load_booster(path: str, model_bytes: bytes | None = None):
+    """
+    Loads a lightgbm.Booster from a native model file, or from a pickled model (sklearn or Booster).
+    """
+    import lightgbm as lgb
+
+    if path.endswith('.pkl'):
+        import io
+        import joblib
+
+        if model_bytes is None:
+            with open(path, 'rb') as f:
+                model_bytes = f.read()
+        model = joblib.load(io.BytesIO(model_bytes))
+
+        return getattr(model, 'booster_', model)
+
+    if model_bytes is not None:
+        return lgb.Booster(model_str=model_bytes.decode('utf-8'))
+
+    return lgb.Booster(model_file=path)
+
+def curvature_edges(curvatures) -> list[float] | None:
+    """
+    The bin edges pd.qcut() finds for these curvatures.  None when safe_quantile_bins() would fall back to
+    putting everything in 'medium'.
+    """
+    import numpy as np
+
+    values = np.asarray(curvatures, dtype=float)
+    finite = values[~np.isnan(values)]
+    if len(values) < 6 or len(np.unique(finite)) < 2:
+        return None
+
+    edges = np.quantile(finite, CURVATURE_BIN_QUANTILES)
+    if len(np.unique(edges)) != len(edges):
+        return None
+
+    return edges.tolist()
+
+def feature_vocabularies(meta: dict, booster) -> dict[str, list]:
+    """
+    The categories the model knows for each categorical column.
+    """
+    columns = [name for name in meta['feature_names'] if name in set(meta['categorical_features'])]
+    categories = booster.pandas_categorical or []
+    if len(columns) != len(categories):
+        raise ValueError("The model's category lists don't match meta.json's categorical_features.")
+
+    return {
+        name: [value.item() if hasattr(value, 'item') else value for value in values]
+        for name, values in zip(columns, categories)
+    }
+
+def write_features(export_dir: str, meta: dict, booster, curvatures) -> str:
+    """
+    Writes features.json from the training curvatures and the model's category lists.  Returns the path.
+    """
+    features = {
+        'curvature_bin': {'edges': curvature_edges(curvatures), 'labels': list(CURVATURE_BIN_LABELS)},
+        'vocabularies': feature_vocabularies(meta, booster),
+    }
+
+    path = os.path.join(export_dir, FEATURES_FILE)
+    with open(path, 'w') as f:
+        json.dump(features, f, indent=2)
+
+    return path
+
+def features_path(export_dir: str = EXPORT_DIR) -> str | None:
+    path = os.path.join(export_dir, FEATURES_FILE)
+
+    return path if os.path.exists(path) else None
+
+def export_native(export_dir: str = EXPORT_DIR) -> str:
+    """
+    Writes the pickled model in export_dir out in LightGBM's native text format, and records the file in
+    meta.json.  Returns the path written.
+    """
+    import lightgbm as lgb
+
+    meta_path = os.path.join(export_dir, META_FILE)
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+
+    booster = load_booster(os.path.join(export_dir, PICKLED_MODEL_FILE))
+    if list(booster.feature_name()) != list(meta['feature_names']):
+        raise ValueError("meta.json feature_names don't match the model's features.")
+
+    path = os.path.join(export_dir, NATIVE_MODEL_FILE)
+    booster.save_model(path)
+
+    meta['model_file'] = NATIVE_MODEL_FILE
+    meta.setdefault('lightgbm_version', lgb.__version__)
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    return path
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert the pickled model to LightGBM's native text format.")
+    parser.add_argument("export_dir", nargs="?", default=EXPORT_DIR)
+    parser.add_argument("--training-data", help="CSV the model was trained on; writes features.json from it.")
+    args = parser.parse_args()
+
+    path = export_native(args.export_dir)
+    print(f"Wrote {path}")
+
+    if args.training_data:
+        import pandas as pd
+
+        with open(os.path.join(args.export_dir, META_FILE), 'r') as f:
+            meta = json.load(f)
+        curvatures = pd.read_csv(args.training_data, usecols=['curvature'])['curvature']
+        print(f"Wrote {write_features(args.export_dir, meta, load_booster(path), curvatures)}")
@@ -0,0 +1,114 @@
+import hashlib
+import math
+import os
+
+import numpy as np
+
+import tracing
+from cache import LRUCache, quantize
+
+# Prediction Cache
+# There are only a handful of categorical inputs and a few numeric ones, so many different trips end up with
+# the same model inputs.  Predictions are memoized on a canonical form of the inputs: numbers rounded to a
+# fixed number of decimal places (inputs that round the same share a prediction), plus the curvature bin,
+# which depends on the rest of the batch.  A hit skips feature engineering and the model call.
+#
+# The cache belongs to one model: it is bound to a signature of the model artifacts (meta.json and the
+# model file), and binding a different signature empties it.
+
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', '4096'))
+PREDICTION_CACHE_PRECISION = int(os.environ.get('PREDICTION_CACHE_PRECISION', '4'))
+
+def artifact_signature(*blobs: bytes) -> str:
+    """
+    A digest of the model artifacts' contents.
+    """
+    digest = hashlib.sha256()
+    for blob in blobs:
+        digest.update(hashlib.sha256(blob).digest())
+
+    return digest.hexdigest()
+
+def _canonical(value, precision: int):
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        value = float(value)
+        return 'nan' if math.isnan(value) else quantize(value, precision)
+
+    return str(value)
+
+class PredictionCache:
+    """
+    An LRU memo of predictions keyed on quantized model inputs.
+
+    Args:
+        maxsize (int): Predictions kept.  0 turns the cache off.
+        precision (int): Decimal places numeric inputs are rounded to for the key.
+    """
+
+    def __init__(self, maxsize: int = PREDICTION_CACHE_SIZE, precision: int = PREDICTION_CACHE_PRECISION):
+        self.precision = precision
+        self.signature = None
+        self.cache = LRUCache(maxsize=maxsize)
+
+    @property
+    def enabled(self) -> bool:
+        return self.cache.maxsize > 0
+
+    def bind(self, signature: str) -> None:
+        """
+        Ties the cache to a model.  A different model's predictions are dropped.
+        """
+        if signature != self.signature:
+            self.cache.clear()
+            self.signature = signature
+
+    def key(self, row: dict, curvature_bin: str) -> tuple:
+        return tuple(_canonical(row[k], self.precision) for k in sorted(row)) + (curvature_bin,)
+
+    def predict(self, rows: list[dict], encoder, predict, bins: list[str] | None = None) -> np.ndarray:
+        """
+        Predictions for rows, calling predict(X) on the encoded rows that aren't cached.  The rows are binned
+        by encoder.bin_curvature() unless their curvature bins are given.
+        """
+        if not self.enabled:
+            with tracing.stage('engineer'):
+                X = encoder.encode_many(rows, bins)
+            return np.asarray(predict(X), dtype=float)
+
+        if bins is None:
+            bins = encoder.bin_curvature(rows)
+        keys = [self.key(row, b) for row, b in zip(rows, bins)]
+
+        predictions = np.empty(len(rows), dtype=float)
+        missing = {}
+        for i, key in enumerate(keys):
+            cached = self.cache.get(key)
+            if cached is None:
+                missing.setdefault(key, []).append(i)
+            else:
+                predictions[i] = cached
+
+        tracing.count('prediction_cache_hits', len(rows) - sum(len(indices) for indices in missing.values()))
+        tracing.count('prediction_cache_misses', sum(len(indices) for indices in missing.values()))
+
+        if missing:
+            # One model call for the misses, each distinct key encoded once
+            first = [indices[0] for indices in missing.values()]
+            with tracing.stage('engineer'):
+                X = encoder.encode_many([rows[i] for i in first], [bins[i] for i in first])
+            for (key, indices), value in zip(missing.items(), predict(X)):
+                predictions[indices] = value
+                self.cache.set(key, float(value))
+
+        return predictions
+
+    def stats(self) -> dict:
+        return {
+            **self.cache.stats.as_dict(),
+            'size': len(self.cache),
+            'maxsize': self.cache.maxsize,
+            'precision': self.precision,
+            'signature': self.signature,
+        }
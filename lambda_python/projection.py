@@ -0,0 +1,50 @@
+import math
+from functools import lru_cache
+
+import numpy as np
+
+# Projection
+# Route geometry comes back from Mapbox as GeoJSON longitude/latitude pairs.  To measure angles without the
+# distortion that comes with latitude, the points are projected into the local Universal Transverse Mercator
+# (UTM) zone.  Transformers are expensive to build, so one is kept per (zone, hemisphere), and the raw
+# coordinate array is projected straight into a NumPy buffer.
+
+def utm_zone(lat: float, lng: float) -> tuple[int, bool]:
+    """
+    Returns the UTM zone number and whether it is in the southern hemisphere.
+    """
+    return math.ceil((lng + 180.0) / 6.0), lat < 0.0
+
+def utm_crs(zone: int, south: bool) -> str:
+    crs = f"+proj=utm +zone={zone}"
+    if south:
+        crs = crs + " +south"
+
+    return crs + " +datum=WGS84 +units=m +no_defs"
+
+@lru_cache(maxsize=None)
+def utm_transformer(zone: int, south: bool):
+    from pyproj import Transformer
+
+    return Transformer.from_crs("EPSG:4326", utm_crs(zone, south), always_xy=True)
+
+def project_to_utm(coords, lat: float, lng: float) -> np.ndarray:
+    """
+    Projects GeoJSON [lng, lat] coordinates into the UTM zone containing (lat, lng).
+
+    Args:
+        coords: An (N, 2+) array-like of longitude/latitude pairs, e.g. a GeoJSON LineString's coordinates.
+        lat (float): Latitude used to choose the zone (normally the route origin).
+        lng (float): Longitude used to choose the zone.
+
+    Returns:
+        np.ndarray: An (N, 2) array of x/y coordinates in meters.
+    """
+    lnglat = np.asarray(coords, dtype=float)
+    if lnglat.ndim != 2 or len(lnglat) == 0:
+        return np.empty((0, 2), dtype=float)
+
+    xy = np.empty((len(lnglat), 2), dtype=float)
+    xy[:, 0], xy[:, 1] = utm_transformer(*utm_zone(lat, lng)).transform(lnglat[:, 0], lnglat[:, 1])
+
+    return xy
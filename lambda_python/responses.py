@@ -0,0 +1,148 @@
+import gzip
+import math
+import os
+
+import numpy as np
+
+# Response Payloads
+# The full Directions response (every step, intersection, instruction and maxspeed annotation) runs to
+# megabytes on long routes, while the front end only draws the route line.  The helpers here shrink what
+# goes back: the line is simplified (Douglas-Peucker, with a tolerance in meters) and can be sent either as
+# GeoJSON or as an encoded polyline, and response bodies are compressed with brotli or gzip when the client
+# accepts it.
+
+# Points closer than this (meters) to the simplified line are dropped
+SIMPLIFY_TOLERANCE = float(os.environ.get('SIMPLIFY_TOLERANCE', '5'))
+
+# Lines shorter than this are sent as they are: simplifying them saves almost nothing
+SIMPLIFY_MIN_POINTS = int(os.environ.get('SIMPLIFY_MIN_POINTS', '64'))
+
+# Decimal places kept in compact coordinates (6 places is about 0.1 m)
+COORDINATE_PRECISION = int(os.environ.get('COORDINATE_PRECISION', '6'))
+
+# Bodies smaller than this aren't worth compressing
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+
+METERS_PER_DEGREE = 111320.0
+
+def _local_xy(lnglat: np.ndarray) -> np.ndarray:
+    # An equirectangular projection about the route's mean latitude: plenty for a tolerance of a few meters.
+    scale = math.cos(math.radians(float(lnglat[:, 1].mean())))
+    return np.c_[lnglat[:, 0] * METERS_PER_DEGREE * scale, lnglat[:, 1] * METERS_PER_DEGREE]
+
+def simplify(coords, tolerance: float = SIMPLIFY_TOLERANCE, min_points: int = SIMPLIFY_MIN_POINTS) -> np.ndarray:
+    """
+    Douglas-Peucker simplification of a [lng, lat] line.  Returns the indices of the points to keep.  Lines
+    with fewer than min_points points are kept whole.
+    """
+    lnglat = np.asarray(coords, dtype=float)[:, :2]
+    n = len(lnglat)
+    if n <= 2 or n < min_points or tolerance <= 0:
+        return np.arange(n)
+
+    xy = _local_xy(lnglat)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+
+    # All of the spans at one depth of the recursion are split together: one vectorized distance calculation
+    # over every point between their ends, and the farthest point of each span from np.maximum.reduceat.
+    # The loop runs once per level instead of once per span.
+    a = np.array([0])
+    b = np.array([n - 1])
+    while len(a):
+        counts = b - a - 1
+        inner = counts > 0
+        a, b, counts = a[inner], b[inner], counts[inner]
+        if not len(a):
+            break
+
+        # Each span's interior points, laid end to end, and the span each one belongs to
+        span = np.repeat(np.arange(len(a)), counts)
+        offsets = np.cumsum(counts) - counts
+        idx = a[span] + 1 + np.arange(len(span)) - offsets[span]
+
+        direction = xy[b] - xy[a]
+        length = np.hypot(direction[:, 0], direction[:, 1])
+        points = xy[idx] - xy[a][span]
+        cross = np.abs(direction[span, 0] * points[:, 1] - direction[span, 1] * points[:, 0])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            distances = np.where(length[span] > 0.0, cross / length[span], np.hypot(points[:, 0], points[:, 1]))
+
+        # The first point at each span's largest distance, as np.argmax() would pick
+        farthest = np.maximum.reduceat(distances, offsets)
+        at_max = np.flatnonzero(distances == farthest[span])
+        first = at_max[np.unique(span[at_max], return_index=True)[1]]
+
+        split = farthest > tolerance
+        points_kept = idx[first[split]]
+        keep[points_kept] = True
+
+        a, b = np.concatenate([a[split], points_kept]), np.concatenate([points_kept, b[split]])
+
+    return np.flatnonzero(keep)
+
+def compact_coordinates(coords, tolerance: float = SIMPLIFY_TOLERANCE, precision: int = COORDINATE_PRECISION) -> list:
+    lnglat = np.asarray(coords, dtype=float)[:, :2]
+    if len(lnglat) == 0:
+        return []
+
+    return np.round(lnglat[simplify(lnglat, tolerance)], precision).tolist()
+
+def encode_polyline(coords, precision: int = 5) -> str:
+    """
+    Encodes [lng, lat] coordinates in the Google/Mapbox encoded polyline format (latitude first).
+    """
+    lnglat = np.asarray(coords, dtype=float)[:, :2]
+    if len(lnglat) == 0:
+        return ""
+
+    # Deltas between rounded, scaled lat/lng pairs, interleaved lat, lng, lat, lng, ...
+    scaled = np.round(lnglat[:, ::-1] * 10 ** precision).astype(np.int64)
+    deltas = np.diff(scaled, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+
+    # Zig-zag encode, then emit 5 bits at a time
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+    chunks = []
+    for value in values.tolist():
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+
+    return "".join(chunks)
+
+def _accepted(accept_encoding: str | None) -> set:
+    accepted = set()
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if name and params.replace(" ", "") not in ("q=0", "q=0.0"):
+            accepted.add(name)
+
+    return accepted
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+def compress(body: bytes, accept_encoding: str | None) -> tuple[bytes, str | None]:
+    """
+    Compresses a response body with the best encoding the client accepts.  Returns the (possibly unchanged)
+    body and the Content-Encoding to send, or None.  brotli is used only when the package is installed.
+    """
+    if len(body) < COMPRESS_MIN_BYTES:
+        return body, None
+
+    accepted = _accepted(accept_encoding)
+    brotli = _brotli() if 'br' in accepted else None
+    if brotli is not None:
+        return brotli.compress(body, quality=BROTLI_QUALITY), 'br'
+
+    if 'gzip' in accepted or '*' in accepted:
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0), 'gzip'
+
+    return body, None
@@ -0,0 +1,83 @@
+# Route Feature Extraction
+# The Mapbox Directions response is walked once (routes -> legs -> steps -> intersections, plus the maxspeed
+# annotations), and everything the model needs from it is collected on the way through.  The per-feature
+# helpers in app.py are thin wrappers around this.
+
+KPH_PER_MPH = 1.60934
+
+# If no max speed is reported, use 10 MPH.
+DEFAULT_MAX_SPEED_KPH = 16.0934
+
+# Street classes that mark a route as a highway.  ("motoway" is kept as-is so existing results don't change.)
+HIGHWAY_CLASSES = frozenset({"primary", "secondary", "motoway"})
+
+# Lane count proxies
+THREE_LANE_CLASSES = frozenset({"motorway"})
+TWO_LANE_CLASSES = frozenset({"primary", "secondary"})
+
+class RouteFeatures:
+    """
+    Collects the route-derived model inputs from a Mapbox Directions response in a single pass.
+
+    Args:
+        mapbox_data (dict): The raw Directions response.
+        route_index (int | None): Only look at this route.  By default all returned routes are walked, which
+            is what the original per-feature functions did.
+    """
+
+    def __init__(self, mapbox_data: dict, route_index: int | None = None):
+        routes = mapbox_data.get("routes", [])
+        if route_index is not None:
+            routes = routes[route_index:route_index + 1]
+
+        self.is_urban = False
+        self.street_classes = set()
+        self.max_speeds = []
+
+        for route in routes:
+            for leg in route.get("legs", []):
+                for ms in leg.get("annotation", {}).get("maxspeed", []):
+                    if isinstance(ms, dict) and "speed" in ms and isinstance(ms["speed"], (int, float)):
+                        self.max_speeds.append(ms["speed"])
+
+                for step in leg.get("steps", []):
+                    for intersection in step.get("intersections", []):
+                        if "is_urban" in intersection:
+                            self.is_urban = True
+                        self.street_classes.add(intersection.get("mapbox_streets_v8", {}).get("class"))
+
+    @property
+    def is_highway(self) -> bool:
+        return not HIGHWAY_CLASSES.isdisjoint(self.street_classes)
+
+    @property
+    def road_type(self) -> str:
+        # Highway trumps urban
+        if self.is_highway:
+            return "highway"
+
+        if self.is_urban:
+            return "urban"
+
+        return "rural"
+
+    @property
+    def has_road_signs(self) -> bool:
+        # 'is_urban' is used as a proxy
+        return self.is_urban
+
+    @property
+    def lane_count(self) -> int:
+        if not THREE_LANE_CLASSES.isdisjoint(self.street_classes):
+            return 3
+
+        if not TWO_LANE_CLASSES.isdisjoint(self.street_classes):
+            return 2
+
+        return 1
+
+    @property
+    def max_speed(self) -> float:
+        # Reported in MPH
+        return max(self.max_speeds, default=DEFAULT_MAX_SPEED_KPH) / KPH_PER_MPH
+
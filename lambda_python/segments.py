@@ -0,0 +1,163 @@
+import numpy as np
+
+import curvature
+from route_features import DEFAULT_MAX_SPEED_KPH, HIGHWAY_CLASSES, KPH_PER_MPH, THREE_LANE_CLASSES, TWO_LANE_CLASSES
+
+# Route Segmentation
+# Scoring a whole trip as one row hides a short curvy stretch inside a long straight interstate.  Here the
+# first route of a Directions response is cut into segments, either one per Mapbox step or at a fixed
+# distance, and each segment gets its own road type, lanes, speed limit, curvature and travel-time offset.
+#
+# Everything is worked out per edge (the line between two neighbouring points of the route geometry) and
+# then reduced over each segment's run of edges with NumPy reduceat, so routes with thousands of steps and
+# tens of thousands of points are handled in a handful of array operations.
+
+SEGMENT_MODES = ('step', 'distance')
+
+# Default length of a fixed-distance segment, in meters
+DEFAULT_SEGMENT_LENGTH = 1000.0
+
+def _step_flags(step: dict) -> tuple[bool, bool, bool, bool]:
+    """
+    The (urban, highway, three lane, two lane) markers for one step, the same way RouteFeatures reads them
+    for a whole route.
+    """
+    urban = False
+    classes = set()
+    for intersection in step.get("intersections", []):
+        if "is_urban" in intersection:
+            urban = True
+        classes.add(intersection.get("mapbox_streets_v8", {}).get("class"))
+
+    return (
+        urban,
+        not HIGHWAY_CLASSES.isdisjoint(classes),
+        not THREE_LANE_CLASSES.isdisjoint(classes),
+        not TWO_LANE_CLASSES.isdisjoint(classes),
+    )
+
+def _any(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    return np.maximum.reduceat(values.astype(np.int8), starts).astype(bool)
+
+class RouteSegments:
+    """
+    Splits the first route of a Directions response into segments.
+
+    Args:
+        mapbox_data (dict): The raw Directions response (requested with steps=true and annotations=maxspeed).
+        route_xy (np.ndarray): The route geometry projected to meters (see directions_route_xy()).
+        mode (str): 'step' for one segment per Mapbox step, or 'distance' for fixed-length segments.
+        segment_length (float): Length of each segment in meters, for the 'distance' mode.
+
+    After construction, each attribute below is an array with one entry per segment:
+        start, end: Indices into the route geometry of each segment's first and last point.
+        distance: Length (meters).
+        offset: Seconds from departure until the segment starts.
+        duration: Seconds spent on the segment.
+        road_type, num_lanes, speed_limit (MPH), road_signs_present, curvature.
+    """
+
+    def __init__(self, mapbox_data: dict, route_xy: np.ndarray, mode: str = 'step',
+                 segment_length: float = DEFAULT_SEGMENT_LENGTH):
+        if mode not in SEGMENT_MODES:
+            raise ValueError(f"Unknown segment mode: {mode!r} (expected one of {', '.join(SEGMENT_MODES)})")
+
+        route = mapbox_data['routes'][0]
+        self.coordinates = route['geometry']['coordinates']
+
+        xy = np.asarray(route_xy, dtype=float)
+        n_edges = len(xy) - 1
+        if n_edges < 1:
+            raise ValueError("The route has no geometry to segment")
+
+        edge_length = curvature.segment_lengths(xy)
+
+        # Speed limit of each edge.  The maxspeed annotations have one entry per edge, leg after leg.
+        edge_speed = np.full(n_edges, np.nan)
+        speeds = [
+            ms["speed"] if isinstance(ms, dict) and isinstance(ms.get("speed"), (int, float)) else np.nan
+            for leg in route.get("legs", [])
+            for ms in leg.get("annotation", {}).get("maxspeed", [])
+        ][:n_edges]
+        edge_speed[:len(speeds)] = speeds
+
+        # Which step each edge belongs to.  Neighbouring steps share their end points, so a step with k points
+        # covers k - 1 edges.  (The final 'arrive' step repeats the last point and is clipped off.)
+        steps = [step for leg in route.get("legs", []) for step in leg.get("steps", [])]
+        step_edges = np.array([max(len(s.get("geometry", {}).get("coordinates", [])) - 1, 0) for s in steps], dtype=int)
+        step_end = np.minimum(np.cumsum(step_edges), n_edges)
+        step_start = np.concatenate(([0], step_end[:-1])).astype(int)[:len(steps)]
+        covered = int(step_end[-1]) if len(steps) else 0
+        if covered < n_edges:
+            # Steps without geometry: treat the rest of the route as one more step.
+            steps.append({"duration": 0.0})
+            step_start = np.append(step_start, covered)
+            step_end = np.append(step_end, n_edges)
+        edge_step = np.repeat(np.arange(len(steps)), step_end - step_start)
+
+        # Spread each step's duration over its edges in proportion to their length.
+        step_length = np.add.reduceat(np.append(edge_length, 0.0), step_start)
+        step_length[step_end == step_start] = 0.0
+        step_duration = np.array([float(s.get("duration", 0.0)) for s in steps])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            seconds_per_meter = np.where(step_length > 0.0, step_duration / step_length, 0.0)
+        edge_duration = edge_length * seconds_per_meter[edge_step]
+
+        flags = np.array([_step_flags(s) for s in steps], dtype=bool).reshape(-1, 4)
+        edge_flags = flags[edge_step]
+
+        # Where each segment starts, as an edge index
+        if mode == 'step':
+            starts = np.unique(step_start[step_end > step_start])
+        else:
+            if segment_length <= 0:
+                raise ValueError("segment_length must be positive")
+            cumulative = np.cumsum(edge_length)
+            cuts = np.arange(segment_length, cumulative[-1], segment_length)
+            starts = np.unique(np.concatenate(([0], np.searchsorted(cumulative, cuts, side='right'))))
+            starts = starts[starts < n_edges]
+
+        self.start = starts
+        self.end = np.append(starts[1:], n_edges)
+        self.distance = np.add.reduceat(edge_length, starts)
+        self.duration = np.add.reduceat(edge_duration, starts)
+        self.offset = np.concatenate(([0.0], np.cumsum(self.duration)[:-1]))
+
+        urban = _any(edge_flags[:, 0], starts)
+        highway = _any(edge_flags[:, 1], starts)
+        three_lane = _any(edge_flags[:, 2], starts)
+        two_lane = _any(edge_flags[:, 3], starts)
+
+        # The same rules as RouteFeatures, applied per segment
+        self.road_type = np.where(highway, 'highway', np.where(urban, 'urban', 'rural'))
+        self.num_lanes = np.where(three_lane, 3, np.where(two_lane, 2, 1))
+        self.road_signs_present = urban
+
+        top_speed = np.maximum.reduceat(np.nan_to_num(edge_speed, nan=-np.inf), starts)
+        self.speed_limit = np.where(np.isfinite(top_speed), top_speed, DEFAULT_MAX_SPEED_KPH) / KPH_PER_MPH
+
+        # curvature.curviness() of each segment's own points: the mean vertex angle with the segment's end
+        # points counted as straight.  The interior angles only depend on points inside the segment, so they
+        # can be taken from the angles of the whole route.
+        angles = curvature.turn_angles(xy)
+        interior = np.add.reduceat(np.append(angles[1:-1], 0.0), starts)
+        # Each sum runs up to and including the segment's last point, which is an end point (counted as
+        # straight below), so take its angle back out.  The last segment's last point is the padding zero.
+        interior[:-1] -= angles[self.end[:-1]]
+        points = self.end - self.start + 1
+        mean_angle = (interior + 2.0 * curvature.ENDPOINT_ANGLE) / points
+        self.curvature = (180.0 - np.maximum(mean_angle, curvature.MAX_CURVY)) / (180.0 - curvature.MAX_CURVY)
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    def segment_coordinates(self, i: int) -> list:
+        return self.coordinates[self.start[i]:self.end[i] + 1]
+
+    def start_points(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        (lats, lngs) of the first point of each segment.
+        """
+        lnglat = np.asarray(self.coordinates, dtype=float)[self.start]
+
+        return lnglat[:, 1], lnglat[:, 0]
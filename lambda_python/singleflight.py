@@ -0,0 +1,76 @@
+import os
+import threading
+
+# Request Coalescing
+# When many clients ask for the same trip at once (everyone leaving the same stadium), each request would
+# otherwise run the whole Mapbox + NWS + model pipeline by itself, and the upstream caches only help once the
+# first one has finished.  A SingleFlight lets the first caller for a key (the leader) do the work while any
+# identical calls that arrive before it finishes wait and get the same result, or the same exception.
+# Nothing is kept once the call finishes; that's the caches' job.
+
+# Set to 0 to turn coalescing off
+SINGLE_FLIGHT = os.environ.get('SINGLE_FLIGHT', '1').lower() in ('1', 'true', 'yes')
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Shares one in-flight call between concurrent callers with the same key.
+
+    Args:
+        enabled (bool): When False, every call runs by itself.
+    """
+
+    def __init__(self, enabled: bool = SINGLE_FLIGHT):
+        self.enabled = enabled
+        self.leaders = 0
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Runs fn(*args, **kwargs), unless a call with the same key is already running, in which case it waits
+        for that one and returns its result.  Returns (result, coalesced).
+        """
+        if not self.enabled:
+            return fn(*args, **kwargs), False
+
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._calls),
+            }
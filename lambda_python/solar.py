@@ -0,0 +1,169 @@
+import datetime
+import os
+import threading
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from cache import LRUCache
+
+# Solar and Timezone Context
+# Lighting ('dim', 'daylight' or 'night') depends on where the sun is at the route's location and time.  Working
+# that out used to build a fresh TimezoneFinder (reloading its polygon data) and run the sunrise/sunset maths
+# twice per call.  The SolarContext keeps a single in-memory TimezoneFinder, memoizes timezone lookups by
+# rounded location, and caches the dim/daylight boundaries per (rounded location, local date), so classifying
+# any time along a route is just a few comparisons.
+
+# Decimal places used for the sunrise/sunset cache (2 places is about 1.1 km, a couple of seconds of sun time)
+SOLAR_PRECISION = int(os.environ.get('SOLAR_PRECISION', '2'))
+
+# Decimal places used along a route (1 place is about 11 km, well under a minute of sun time)
+ROUTE_SOLAR_PRECISION = int(os.environ.get('ROUTE_SOLAR_PRECISION', '1'))
+
+# Decimal places used for the timezone cache (3 places is about 110 m)
+TIMEZONE_PRECISION = int(os.environ.get('TIMEZONE_PRECISION', '3'))
+
+# The dim periods around sunrise and sunset
+DAWN_BEFORE = datetime.timedelta(minutes=30)
+DAWN_AFTER = datetime.timedelta(minutes=60)
+DUSK_BEFORE = datetime.timedelta(minutes=60)
+DUSK_AFTER = datetime.timedelta(minutes=30)
+
+@lru_cache(maxsize=None)
+def zone_info(tzname: str) -> ZoneInfo:
+    return ZoneInfo(tzname)
+
+def classify_lighting(t: float, boundaries: tuple[float, float, float, float]) -> str:
+    """
+    Classifies a POSIX timestamp against a day's (first_light_start, first_light_end, last_light_start,
+    last_light_end) boundaries.
+    """
+    first_light_start, first_light_end, last_light_start, last_light_end = boundaries
+
+    # If the provided time is between either of the dim periods, lighting is dim.
+    if first_light_start < t < first_light_end or last_light_start < t < last_light_end:
+        return 'dim'
+
+    # The time between the dim periods is daylight
+    if first_light_end < t < last_light_start:
+        return 'daylight'
+
+    # It must be night.
+    return 'night'
+
+class SolarContext:
+    """
+    Shared timezone and sunrise/sunset lookups.
+
+    Args:
+        precision (int): Decimal places locations are rounded to for the sunrise/sunset cache.
+        tz_precision (int): Decimal places locations are rounded to for the timezone cache.
+        maxsize (int): Entries kept in each cache.
+    """
+
+    def __init__(self, precision: int = SOLAR_PRECISION, tz_precision: int = TIMEZONE_PRECISION, maxsize: int = 4096):
+        self.precision = precision
+        self.tz_precision = tz_precision
+        self.timezones = LRUCache(maxsize=maxsize)
+        self.sun_times = LRUCache(maxsize=maxsize)
+        self._finder = None
+        self._lock = threading.Lock()
+
+    @property
+    def finder(self):
+        # Built on first use; in-memory mode keeps the polygon data in RAM rather than reading the files per lookup.
+        if self._finder is None:
+            with self._lock:
+                if self._finder is None:
+                    from timezonefinder import TimezoneFinder
+                    self._finder = TimezoneFinder(in_memory=True)
+        return self._finder
+
+    def timezone_name(self, lat: float, lng: float) -> str:
+        key = (round(lat, self.tz_precision), round(lng, self.tz_precision))
+        tzname = self.timezones.get(key)
+        if tzname is None:
+            tzname = self.finder.timezone_at(lat=lat, lng=lng)
+            if tzname is None:
+                # fall back to nearest match (useful near borders or sparse areas)
+                tzname = self.finder.closest_timezone_at(lat=lat, lng=lng) or "UTC"
+            self.timezones.set(key, tzname)
+
+        return tzname
+
+    def localize(self, dt: datetime.datetime, tzname: str) -> datetime.datetime:
+        # The wall-clock time is taken to be local time at the location.
+        return datetime.datetime(dt.year, dt.month, dt.day, hour=dt.hour, minute=dt.minute, second=dt.second,
+                                 tzinfo=zone_info(tzname))
+
+    def boundaries(self, lat: float, lng: float, day: datetime.date, tzname: str,
+                   precision: int | None = None) -> tuple[float, float, float, float]:
+        """
+        The (first_light_start, first_light_end, last_light_start, last_light_end) POSIX timestamps for a local date.
+        """
+        precision = self.precision if precision is None else precision
+        lat_q, lng_q = round(lat, precision), round(lng, precision)
+        key = (lat_q, lng_q, day, tzname)
+        bounds = self.sun_times.get(key)
+        if bounds is None:
+            from suntimes import SunTimes
+
+            sun = SunTimes(longitude=lng_q, latitude=lat_q, altitude=0)
+            date = datetime.datetime(day.year, day.month, day.day)
+            sunrise = sun.risewhere(date, tzname)
+            sunset = sun.setwhere(date, tzname)
+            bounds = (
+                (sunrise - DAWN_BEFORE).timestamp(),
+                (sunrise + DAWN_AFTER).timestamp(),
+                (sunset - DUSK_BEFORE).timestamp(),
+                (sunset + DUSK_AFTER).timestamp(),
+            )
+            self.sun_times.set(key, bounds)
+
+        return bounds
+
+    def lighting(self, lat: float, lng: float, dt: datetime.datetime) -> str:
+        tzname = self.timezone_name(lat, lng)
+        local = self.localize(dt, tzname)
+
+        return classify_lighting(local.timestamp(), self.boundaries(lat, lng, local.date(), tzname))
+
+    def lighting_many(self, lat: float, lng: float, dts) -> np.ndarray:
+        """
+        Vectorized lighting() for many wall-clock times at one location, e.g. a sweep of departure times.
+        """
+        tzname = self.timezone_name(lat, lng)
+        local = [self.localize(dt, tzname) for dt in dts]
+        t = np.array([d.timestamp() for d in local], dtype=float)
+
+        # One sunrise/sunset lookup per local date, not per time
+        days = [d.date() for d in local]
+        by_day = {day: self.boundaries(lat, lng, day, tzname) for day in set(days)}
+        bounds = np.array([by_day[day] for day in days], dtype=float).reshape(-1, 4)
+        dim = ((bounds[:, 0] < t) & (t < bounds[:, 1])) | ((bounds[:, 2] < t) & (t < bounds[:, 3]))
+        daylight = (bounds[:, 1] < t) & (t < bounds[:, 2])
+
+        return np.where(dim, 'dim', np.where(daylight, 'daylight', 'night'))
+
+    def lighting_along(self, lats, lngs, timestamps, tzname: str, precision: int = ROUTE_SOLAR_PRECISION) -> np.ndarray:
+        """
+        Lighting at many (location, POSIX timestamp) pairs, e.g. each segment of a route at the time it is
+        reached.  Locations are rounded more coarsely than for lighting(), so a long route only needs a
+        sunrise/sunset lookup every few kilometers, and dates are taken in the one timezone given.
+        """
+        lats = np.asarray(lats, dtype=float)
+        lngs = np.asarray(lngs, dtype=float)
+        t = np.asarray(timestamps, dtype=float)
+        zone = zone_info(tzname)
+
+        days = [datetime.datetime.fromtimestamp(ts, zone).date() for ts in t]
+        keys = list(zip(np.round(lats, precision).tolist(), np.round(lngs, precision).tolist(), days))
+        by_key = {key: self.boundaries(key[0], key[1], key[2], tzname, precision) for key in set(keys)}
+        bounds = np.array([by_key[key] for key in keys], dtype=float).reshape(-1, 4)
+        dim = ((bounds[:, 0] < t) & (t < bounds[:, 1])) | ((bounds[:, 2] < t) & (t < bounds[:, 3]))
+        daylight = (bounds[:, 1] < t) & (t < bounds[:, 2])
+
+        return np.where(dim, 'dim', np.where(daylight, 'daylight', 'night'))
+
+context = SolarContext()
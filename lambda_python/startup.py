@@ -0,0 +1,137 @@
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+# Startup Timing
+# Cold starts are dominated by importing the heavy dependencies and loading the model, so both are measured.
+# Heavy modules are wrapped in LazyModule: nothing is imported until an attribute is first used, and the
+# import time is recorded when it happens.  Init work (model load, timezone data, ...) is recorded with
+# timed().  report() gives the breakdown, and running this file checks a fresh interpreter against a budget:
+#
+#   python startup.py --role lambda --budget 3.0
+#
+# It exits non-zero when the cold start goes over budget, so it can gate a build.
+
+_process_start = time.perf_counter()
+
+_imports = {}
+_init = {}
+
+def timed_import(name: str):
+    """
+    Import a module, recording how long it took if this is the first time it is imported.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    _imports[name] = time.perf_counter() - start
+
+    return module
+
+class LazyModule:
+    """
+    Stands in for a module until one of its attributes is used, then imports it with timed_import().
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = timed_import(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<LazyModule '{self._name}' ({state})>"
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
+
+@contextmanager
+def timed(label: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _init[label] = _init.get(label, 0.0) + time.perf_counter() - start
+
+def report() -> dict:
+    return {
+        'imports': dict(_imports),
+        'init': dict(_init),
+        'import_total': sum(_imports.values()),
+        'init_total': sum(_init.values()),
+        'since_process_start': time.perf_counter() - _process_start,
+    }
+
+# Run inside a fresh interpreter: import the app the way the given role would, and print the report.
+_PROBE = """
+import json, os, sys, time
+start = time.perf_counter()
+import startup
+import app
+module_import = time.perf_counter() - start
+role = sys.argv[1]
+if role == 'lambda':
+    app._init()
+else:
+    app.app
+    app._init()
+r = startup.report()
+r['app_module_import'] = module_import
+r['cold_start'] = time.perf_counter() - start
+print(json.dumps(r))
+"""
+
+def measure(role: str = 'lambda') -> dict:
+    """
+    Measures a cold start for the role ('lambda' or 'flask') in a fresh interpreter.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE, role],
+        cwd=here, capture_output=True, text=True, check=True
+    )
+
+    # The report is the last line; anything before it is the app's own output.
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def _print_report(r: dict) -> None:
+    print(f"{'dependency':<29}{'seconds':>10}")
+    for name, secs in sorted(r['imports'].items(), key=lambda kv: -kv[1]):
+        print(f"  import {name:<22}{secs:>10.3f}")
+    for name, secs in sorted(r['init'].items(), key=lambda kv: -kv[1]):
+        print(f"  init {name:<24}{secs:>10.3f}")
+    print(f"{'app module import':<29}{r['app_module_import']:>10.3f}")
+    print(f"{'cold start':<29}{r['cold_start']:>10.3f}")
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Report cold-start import/init cost and check it against a budget.")
+    parser.add_argument("--role", choices=("lambda", "flask"), default="lambda")
+    parser.add_argument("--budget", type=float, default=float(os.environ.get('COLD_START_BUDGET', '0')),
+                        help="Seconds allowed for a cold start (0 disables the check).")
+    parser.add_argument("--json", action="store_true", help="Print the raw report as JSON.")
+    args = parser.parse_args()
+
+    r = measure(args.role)
+    if args.json:
+        print(json.dumps(r, indent=2))
+    else:
+        _print_report(r)
+
+    if args.budget and r['cold_start'] > args.budget:
+        print(f"FAIL: cold start {r['cold_start']:.3f}s is over the {args.budget:.3f}s budget")
+        sys.exit(1)
@@ -0,0 +1,59 @@
+import json
+import os
+import sys
+
+import pytest
+
+# The app imports its siblings as top-level modules and finds the model export relative to the working
+# directory, so the tests run from the lambda_python directory.
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, LAMBDA_DIR)
+os.chdir(LAMBDA_DIR)
+
+@pytest.fixture(scope='session')
+def app():
+    """
+    The app with its model loaded.  Skipped when the export has no model in it.
+    """
+    import app
+    import model_artifact
+
+    with open(app.META_PATH, 'r') as f:
+        meta = json.load(f)
+    if not os.path.exists(model_artifact.model_path(app.EXPORT_DIR, meta)):
+        pytest.skip(f"No model in {app.EXPORT_DIR}")
+
+    app._init()
+    return app
+
+@pytest.fixture
+def fixtures(app):
+    """
+    Routes all upstream HTTP to the offline benchmark fixtures, with empty caches.
+    """
+    import benchmark
+    import upstream
+
+    real_client = upstream.client
+    benchmark._clear_caches(app)
+    client = benchmark.install_fixtures()
+    yield client
+    upstream.client = real_client
+    benchmark._clear_caches(app)
+
+@pytest.fixture
+def training_speed_limit(app, monkeypatch, request):
+    """
+    Gives every trip, segment or grid cell the same speed limit from the training data: 45 unless the test
+    parametrizes the fixture indirectly with another.  The model's speed_x_curvature_bin categories only know
+    the training speed limits, so with the limits a live route gets its curvature bin makes no difference, and
+    a test that bins wrongly would still pass.
+    """
+    speed_limit = getattr(request, 'param', 45)
+    combine_model_inputs = app.combine_model_inputs
+
+    def combined(route_inputs, time_inputs):
+        return {**combine_model_inputs(route_inputs, time_inputs), 'speed_limit': speed_limit}
+
+    monkeypatch.setattr(app, 'combine_model_inputs', combined)
+    return speed_limit
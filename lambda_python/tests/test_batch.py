@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+
+import benchmark
+
+DATE = '2025-10-24T16:20:00'
+
+# Every benchmark scenario: more than the 6 rows quantile binning needs, and curvatures from straight to wiggly
+TRIPS = [
+    {'o_lat': spec['o'][0], 'o_lng': spec['o'][1], 'd_lat': spec['d'][0], 'd_lng': spec['d'][1], 'date_str': DATE}
+    for spec in benchmark.SCENARIOS.values()
+] + [
+    {'o_lat': 32.70 + i * 0.05, 'o_lng': -97.30, 'd_lat': 32.95, 'd_lng': -96.95, 'date_str': DATE} for i in range(4)
+]
+
+@pytest.fixture
+def training_curvatures(app, fixtures, training_speed_limit, monkeypatch):
+    """
+    Gives each trip the curvature of a row of the training data.
+    """
+    rows = pd.read_csv('ml_model/original_data/synthetic_road_accidents_10k.csv').iloc[:len(TRIPS)]
+    by_origin = {(trip['o_lat'], trip['o_lng']): row for trip, row in zip(TRIPS, rows.to_dict('records'))}
+
+    trip_model_inputs = app.trip_model_inputs
+
+    def stubbed(o_lat, o_lng, d_lat, d_lng, dt):
+        mapbox_data, model_inputs = trip_model_inputs(o_lat, o_lng, d_lat, d_lng, dt)
+        return mapbox_data, {**model_inputs, 'curvature': by_origin[(o_lat, o_lng)]['curvature']}
+
+    monkeypatch.setattr(app, 'trip_model_inputs', stubbed)
+
+def single(app, trip: dict) -> float:
+    return app.calc_drive_risk(trip['o_lat'], trip['o_lng'], trip['d_lat'], trip['d_lng'], trip['date_str'])['prediction']
+
+def test_batch_scores_match_single_trip_scores(app, training_curvatures):
+    batch = app.calc_drive_risk_batch(TRIPS)
+
+    assert len({r['model_inputs']['curvature'] for r in batch}) > 1
+    for trip, result in zip(TRIPS, batch):
+        assert result['prediction'] == single(app, trip)
+
+def test_a_trips_score_does_not_depend_on_the_rest_of_the_batch(app, training_curvatures):
+    trip = TRIPS[0]
+    alone = app.calc_drive_risk_batch([trip])[0]['prediction']
+
+    for others in (TRIPS[1:], TRIPS[:0:-1], TRIPS[3:] + TRIPS[1:3]):
+        assert app.calc_drive_risk_batch([trip] + others)[0]['prediction'] == alone
+
+def test_failed_trips_get_errors_in_place(app, fixtures):
+    results = app.calc_drive_risk_batch([TRIPS[0], {'o_lat': 1.0}, TRIPS[1]])
+
+    assert 'prediction' in results[0] and 'prediction' in results[2]
+    assert results[1]['error'].startswith('Missing keys')
@@ -0,0 +1,73 @@
+import math
+
+import numpy as np
+import pytest
+
+import curvature
+from app import angle_p1p2p3
+
+# The per-vertex loop calculate_linestring_curvature() and calculate_curviness() used before the curvature
+# module, kept here as the reference.
+def reference_angles(coords) -> list[float]:
+    coords = np.array(coords)
+    if len(coords) < 3:
+        return [180] * len(coords)
+
+    angles = [180]
+    for i in range(1, len(coords) - 1):
+        angles.append(angle_p1p2p3(coords[i - 1], coords[i], coords[i + 1]))
+    angles.append(180)
+
+    return angles
+
+def reference_curviness(coords) -> float:
+    raw_curviness = max(float(np.mean(reference_angles(coords))), curvature.MAX_CURVY)
+    return (180.0 - raw_curviness) / (180.0 - curvature.MAX_CURVY)
+
+def random_route(n: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    heading = np.cumsum(rng.normal(0.0, 0.3, n))
+    step = rng.uniform(5.0, 200.0, n)
+    return np.column_stack([np.cumsum(step * np.cos(heading)), np.cumsum(step * np.sin(heading))]) + 500000.0
+
+ROUTES = {
+    'empty': np.empty((0, 2)),
+    'one_point': [[1.0, 2.0]],
+    'two_points': [[0.0, 0.0], [1.0, 1.0]],
+    'straight': [[0.0, 0.0], [1.0, 0.0], [2.0, 0.0], [3.0, 0.0]],
+    'right_angle': [[0.0, 0.0], [1.0, 0.0], [1.0, 1.0]],
+    'hairpin': [[0.0, 0.0], [1.0, 0.0], [0.0, 0.0]],
+    'repeated_points': [[0.0, 0.0], [1.0, 0.0], [1.0, 0.0], [2.0, 1.0], [2.0, 1.0], [3.0, 1.0]],
+    'with_z': [[0.0, 0.0, 5.0], [1.0, 0.0, 6.0], [1.0, 1.0, 7.0], [2.0, 3.0, 8.0]],
+    'random_short': random_route(50, 1),
+    'random_long': random_route(20000, 2),
+}
+
+@pytest.mark.parametrize('name', ROUTES)
+def test_turn_angles_match_the_per_vertex_loop(name):
+    coords = np.asarray(ROUTES[name], dtype=float)
+    expected = reference_angles(coords[:, :2] if len(coords) else coords)
+
+    np.testing.assert_allclose(curvature.turn_angles(coords), expected, rtol=0, atol=1e-9)
+
+@pytest.mark.parametrize('name', [name for name in ROUTES if name != 'empty'])
+def test_curviness_matches_the_per_vertex_loop(name):
+    coords = np.asarray(ROUTES[name], dtype=float)[:, :2]
+
+    assert curvature.curviness(coords) == pytest.approx(reference_curviness(coords), abs=1e-12)
+
+def test_curviness_of_nothing_is_nan():
+    assert math.isnan(curvature.curviness(np.empty((0, 2))))
+
+def test_distance_weighting_discounts_dense_clusters():
+    # A long straight run with a tight zig-zag squeezed into its last few metres
+    straight = [[float(x), 0.0] for x in range(0, 10000, 1000)]
+    zigzag = [[10000.0 + i, (i % 2) * 1.0] for i in range(1, 40)]
+    coords = np.array(straight + zigzag)
+
+    assert curvature.distance_weighted_curviness(coords) < curvature.curviness(coords)
+
+def test_distance_weighting_without_length_falls_back():
+    coords = np.array([[1.0, 1.0], [1.0, 1.0], [1.0, 1.0]])
+
+    assert curvature.distance_weighted_curviness(coords) == curvature.curviness(coords)
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+TRAINING_DATA = 'ml_model/original_data/synthetic_road_accidents_10k.csv'
+
+def _pandas_predictions(app, df: pd.DataFrame) -> np.ndarray:
+    engineered = app.feature_engineer(df, drop_duplicates=False)
+    return app._booster.predict(engineered[app._meta['feature_names']])
+
+def _encoder_predictions(app, df: pd.DataFrame) -> np.ndarray:
+    rows = df.drop(columns=[app.TARGET]).to_dict('records')
+    return app._booster.predict(app._encoder.encode_many(rows))
+
+@pytest.fixture(scope='module')
+def training_data():
+    return pd.read_csv(TRAINING_DATA)
+
+def test_encoder_matches_feature_engineer_on_the_training_data(app, training_data):
+    np.testing.assert_array_equal(_encoder_predictions(app, training_data), _pandas_predictions(app, training_data))
+
+def test_encoder_bins_curvature_like_feature_engineer(app, training_data):
+    rows = training_data.to_dict('records')
+    engineered = app.feature_engineer(training_data, drop_duplicates=False)
+
+    assert list(app._encoder.bin_curvature(rows)) == engineered['curvature_bin'].astype(str).tolist()
+
+# Single rows and batches on both sides of the 6-row quantile fallback
+@pytest.mark.parametrize('size', [1, 2, 5, 6, 7, 50])
+def test_encoder_matches_feature_engineer_on_small_batches(app, training_data, size):
+    for start in range(0, 10 * size, size):
+        batch = training_data.iloc[start:start + size].reset_index(drop=True)
+        np.testing.assert_array_equal(_encoder_predictions(app, batch), _pandas_predictions(app, batch))
+
+def test_unseen_categories_are_missing_values(app, training_data):
+    row = training_data.drop(columns=[app.TARGET]).iloc[0].to_dict()
+    row['weather'] = 'volcanic ash'
+
+    X = app._encoder.encode(row)
+    assert np.isnan(X[0, app._meta['feature_names'].index('weather')])
+
+def test_bin_curvature_each_bins_rows_as_if_alone(app, training_data):
+    rows = training_data.iloc[:20].to_dict('records')
+
+    assert app._encoder.bin_curvature_each(rows) == [app._encoder.bin_curvature([row])[0] for row in rows]
@@ -0,0 +1,55 @@
+import datetime
+
+import numpy as np
+import pytest
+
+import heatmap
+
+BBOX = (32.70, -97.40, 32.80, -97.25)
+DT = datetime.datetime(2025, 10, 24, 16, 30)
+CELLS = 8
+
+@pytest.fixture
+def grid(app, fixtures, training_speed_limit, monkeypatch):
+    """
+    Offline directions for the grid.  The short synthetic trips are all as curvy as can be measured, so each
+    trip's curvature is spread out by where it starts instead.
+    """
+    heatmap.install_fixtures()
+
+    directions_route_inputs = app.directions_route_inputs
+
+    def spread(mapbox_data, route_xy, weather):
+        lng, lat = mapbox_data['routes'][0]['geometry']['coordinates'][0][:2]
+        curvature = (lat * 37.0 + lng * 91.0) % 1.0
+        return {**directions_route_inputs(mapbox_data, route_xy, weather), 'curvature': curvature}
+
+    monkeypatch.setattr(app, 'directions_route_inputs', spread)
+
+def build(tmp_path, batch_size: int) -> tuple[dict, dict]:
+    out_dir = str(tmp_path / f"batch{batch_size}")
+    manifest = heatmap.build(BBOX, DT, weather='clear', cells=CELLS, out_dir=out_dir, batch_size=batch_size, concurrency=4)
+    tiles = {
+        (x, y): np.load(heatmap.tile_path(out_dir, manifest['slice'], manifest['zoom'], x, y))
+        for x, y in manifest['tiles']
+    }
+    return manifest, tiles
+
+def test_tiles_do_not_depend_on_how_the_grid_is_batched(grid, tmp_path):
+    manifest, one_group = build(tmp_path, batch_size=100000)
+    _, tile_groups = build(tmp_path, batch_size=CELLS * CELLS)
+
+    assert len(manifest['tiles']) >= 4
+    assert manifest['failed'] == 0
+    for tile, risk in one_group.items():
+        np.testing.assert_array_equal(tile_groups[tile], risk)
+
+def test_point_lookup_reads_the_cell_containing_it(grid, tmp_path):
+    manifest, tiles = build(tmp_path, batch_size=100000)
+
+    lat, lng = 32.75, -97.30
+    x, y, row, col = heatmap.cell_index(lat, lng, manifest['zoom'], CELLS)
+    point = heatmap.risk_at(manifest['slice'], lat, lng, out_dir=str(tmp_path / "batch100000"))
+
+    assert point['tile'] == [manifest['zoom'], x, y]
+    assert point['prediction'] == float(tiles[(x, y)][row, col])
@@ -0,0 +1,83 @@
+import gzip
+import math
+
+import numpy as np
+import pytest
+
+import benchmark
+import responses
+
+# One span at a time, as simplify() used to work: the reference for the level-at-a-time version.
+def reference_simplify(coords, tolerance: float) -> np.ndarray:
+    lnglat = np.asarray(coords, dtype=float)[:, :2]
+    n = len(lnglat)
+    if n <= 2 or tolerance <= 0:
+        return np.arange(n)
+
+    xy = responses._local_xy(lnglat)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+
+    spans = [(0, n - 1)]
+    while spans:
+        a, b = spans.pop()
+        if b - a < 2:
+            continue
+
+        start, direction = xy[a], xy[b] - xy[a]
+        points = xy[a + 1:b] - start
+        length = math.hypot(*direction)
+        if length == 0.0:
+            distances = np.hypot(points[:, 0], points[:, 1])
+        else:
+            distances = np.abs(direction[0] * points[:, 1] - direction[1] * points[:, 0]) / length
+
+        i = int(np.argmax(distances))
+        if distances[i] > tolerance:
+            split = a + 1 + i
+            keep[split] = True
+            spans.append((a, split))
+            spans.append((split, b))
+
+    return np.flatnonzero(keep)
+
+def random_line(n: int, seed: int, repeats: bool = False) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    lnglat = np.c_[-97.3 + np.cumsum(rng.normal(0.0, 1e-4, n)), 32.7 + np.cumsum(rng.normal(0.0, 1e-4, n))]
+    if repeats:
+        # Runs of repeated points, and a loop back to the start
+        lnglat = np.repeat(lnglat, rng.integers(1, 4, n), axis=0)
+        lnglat[-1] = lnglat[0]
+    return lnglat
+
+LINES = {
+    'random': random_line(2000, 1),
+    'repeats_and_loop': random_line(2000, 2, repeats=True),
+    'straight': np.c_[np.linspace(-97.0, -96.0, 500), np.full(500, 32.0)],
+    'test_event': benchmark.synthesize_directions(benchmark.SCENARIOS['test_event'])['routes'][0]['geometry']['coordinates'],
+}
+
+@pytest.mark.parametrize('name', LINES)
+@pytest.mark.parametrize('tolerance', [1.0, 5.0, 50.0])
+def test_simplify_matches_span_at_a_time_douglas_peucker(name, tolerance):
+    expected = reference_simplify(LINES[name], tolerance)
+
+    np.testing.assert_array_equal(responses.simplify(LINES[name], tolerance, min_points=0), expected)
+
+def test_short_lines_are_kept_whole():
+    line = random_line(responses.SIMPLIFY_MIN_POINTS - 1, 3)
+
+    np.testing.assert_array_equal(responses.simplify(line), np.arange(len(line)))
+
+def test_encode_polyline_matches_the_reference_example():
+    # The example from the encoded polyline format's documentation
+    coords = [[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]]
+
+    assert responses.encode_polyline(coords) == '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+
+def test_compress_prefers_the_accepted_encoding():
+    body = b'{"prediction": 0.25}' * 200
+
+    compressed, encoding = responses.compress(body, 'gzip, deflate')
+    assert encoding == 'gzip'
+    assert gzip.decompress(compressed) == body
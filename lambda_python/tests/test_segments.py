@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+import benchmark
+
+DATE = '2025-10-24T16:20:00'
+
+@pytest.mark.parametrize('training_speed_limit', [25, 70], indirect=True)
+@pytest.mark.parametrize('scenario', ['test_event', 'long_interstate'])
+def test_segments_are_scored_as_if_each_were_a_whole_route(app, fixtures, training_speed_limit, scenario):
+    spec = benchmark.SCENARIOS[scenario]
+    result = app.calc_drive_risk_segments(*spec['o'], *spec['d'], DATE, segment_by='distance', segment_length=5000.0)
+
+    segments = [feature['properties'] for feature in result['segments']['features']]
+    assert len(segments) >= 6
+    assert len({s['model_inputs']['curvature'] for s in segments}) > 1
+
+    for s in segments:
+        assert s['prediction'] == app.predict_model_inputs([s['model_inputs']])[0]
+
+def test_segment_risk_aggregates_by_distance(app, fixtures):
+    spec = benchmark.SCENARIOS['test_event']
+    result = app.calc_drive_risk_segments(*spec['o'], *spec['d'], DATE)
+
+    segments = [feature['properties'] for feature in result['segments']['features']]
+    predictions = [s['prediction'] for s in segments]
+    expected = np.average(predictions, weights=[s['distance'] for s in segments])
+
+    assert result['aggregate']['prediction'] == pytest.approx(expected)
+    assert result['aggregate']['max_prediction'] == max(predictions)
@@ -0,0 +1,38 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import startup
+
+# Seconds allowed for a cold start (importing app and running _init() in a fresh interpreter), and for
+# importing the app module alone.  The same budget as `python startup.py --budget`.
+COLD_START_BUDGET = float(os.environ.get('COLD_START_BUDGET', '3.0'))
+APP_IMPORT_BUDGET = float(os.environ.get('APP_IMPORT_BUDGET', '1.0'))
+
+# Nothing heavy should load until _init() or the first request needs it.
+HEAVY_MODULES = ('pandas', 'lightgbm', 'sklearn', 'pyproj', 'timezonefinder', 'flask')
+
+@pytest.mark.parametrize('role', ['lambda', 'flask'])
+def test_cold_start_is_within_budget(app, role):
+    r = startup.measure(role)
+
+    assert r['cold_start'] <= COLD_START_BUDGET, (
+        f"{role} cold start took {r['cold_start']:.3f}s (budget {COLD_START_BUDGET:.3f}s): {r['imports']}"
+    )
+    assert r['app_module_import'] <= APP_IMPORT_BUDGET
+
+def test_importing_the_app_loads_no_heavy_modules():
+    probe = f"import json, sys; import app; print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    out = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True)
+
+    assert json.loads(out.stdout.strip().splitlines()[-1]) == []
+
+def test_lazy_module_imports_on_first_use():
+    module = startup.lazy_import('colorsys')
+    assert 'not loaded' in repr(module)
+
+    assert module.rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+    assert 'not loaded' not in repr(module)
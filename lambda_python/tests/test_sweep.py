@@ -0,0 +1,39 @@
+import datetime
+
+import pytest
+
+import app
+
+def test_departures_cover_the_window_inclusively():
+    start = datetime.datetime(2025, 10, 24, 16, 0)
+    departures = app.sweep_departures(start, start + datetime.timedelta(hours=1), 15)
+
+    assert departures == [start + datetime.timedelta(minutes=m) for m in (0, 15, 30, 45, 60)]
+
+@pytest.mark.parametrize('start_str, end_str', [
+    ('2025-10-24T16:00:00-05:00', '2025-10-24T17:00:00'),
+    ('2025-10-24T16:00:00', '2025-10-24T17:00:00+00:00'),
+])
+def test_an_offset_on_one_end_only_is_wall_clock_time(start_str, end_str):
+    departures = app.sweep_departures(app.parse_date_str(start_str), app.parse_date_str(end_str), 30)
+
+    assert [d.isoformat() for d in departures] == ['2025-10-24T16:00:00', '2025-10-24T16:30:00', '2025-10-24T17:00:00']
+
+@pytest.mark.parametrize('start_str, end_str, step_minutes', [
+    ('2025-10-24T17:00:00-05:00', '2025-10-24T16:00:00', 15),
+    ('2025-10-24T17:00:00', '2025-10-24T16:00:00+00:00', 15),
+    ('2025-10-24T16:00:00', '2025-10-24T17:00:00', 0),
+    ('2025-10-01T00:00:00', '2025-10-24T00:00:00-05:00', 1),
+])
+def test_bad_windows_are_value_errors(start_str, end_str, step_minutes):
+    with pytest.raises(ValueError):
+        app.sweep_departures(app.parse_date_str(start_str), app.parse_date_str(end_str), step_minutes)
+
+def test_a_bad_window_is_a_400():
+    client = app.create_app().test_client()
+    response = client.get('/drive-risk/sweep', query_string={
+        'o_lat': 32.7555, 'o_lng': -97.3308, 'd_lat': 32.7357, 'd_lng': -97.3400,
+        'start': '2025-10-24T17:00:00-05:00', 'end': '2025-10-24T16:00:00',
+    })
+
+    assert response.status_code == 400
@@ -0,0 +1,169 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+import upstream
+
+DATE = '2025-10-24T16:20:00'
+
+class SlowUpstreams:
+    """
+    Wraps the fixture client so requests to the given hosts hang until released (or for a fixed delay).
+    """
+
+    def __init__(self, client, hosts: tuple[str, ...], delay: float | None = None):
+        self.client = client
+        self.hosts = hosts
+        self.delay = delay
+        self.release = threading.Event()
+
+    def get(self, url: str, timeout=None, **kwargs):
+        if any(host in url for host in self.hosts):
+            if self.delay is None:
+                self.release.wait()
+            else:
+                time.sleep(self.delay)
+        return self.client.get(url, timeout=timeout, **kwargs)
+
+    def stats(self) -> dict:
+        return self.client.stats()
+
+@pytest.fixture
+def slow_nws(fixtures):
+    slow = upstream.client = SlowUpstreams(fixtures, ('api.weather.gov',))
+    yield slow
+    slow.release.set()
+
+def test_a_stuck_upstream_does_not_starve_the_others():
+    release = threading.Event()
+    stuck = [upstream.submit('stuck', release.wait) for _ in range(2 * upstream.UPSTREAM_MAX_WORKERS)]
+    try:
+        future = upstream.submit('other', lambda: 'done')
+        assert upstream.result('other', future, timeout=2.0) == 'done'
+    finally:
+        release.set()
+    for future in stuck:
+        future.result()
+
+def test_slow_nws_still_lets_mapbox_succeed(app, slow_nws, monkeypatch):
+    monkeypatch.setitem(upstream.UPSTREAM_TIMEOUTS, 'nws', 0.1)
+    monkeypatch.setitem(upstream.UPSTREAM_TIMEOUTS, 'mapbox', 5.0)
+
+    # Two waves of distinct trips, each more than a pool's worth, with every NWS call hanging
+    trips = [(32.70 + i * 0.01, -97.30, 32.90, -96.90) for i in range(3 * upstream.UPSTREAM_MAX_WORKERS)]
+    waves = (trips[:upstream.UPSTREAM_MAX_WORKERS], trips[upstream.UPSTREAM_MAX_WORKERS:])
+
+    for wave in waves:
+        with ThreadPoolExecutor(len(wave)) as pool:
+            results = list(pool.map(lambda trip: app.calc_drive_risk(*trip, DATE), wave))
+
+        for result in results:
+            assert 0.0 <= result['prediction'] <= 1.0
+            assert result['model_inputs']['weather'] == app.DEFAULT_WEATHER
+
+@pytest.fixture
+def hanging_server():
+    """
+    A local HTTP server that takes far longer to answer than any upstream budget.
+    """
+    import http.server
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(5.0)
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/slow"
+    server.shutdown()
+    server.server_close()
+
+def test_budget_cuts_timeouts_and_retries():
+    client = upstream.UpstreamClient(connect_timeout=3.05, read_timeout=10, retries=2, backoff=0.3)
+
+    (connect, read), retries = client.budget(4.0)
+    assert retries == 0
+    assert connect + read == pytest.approx(4.0)
+
+    # Plenty of time: the configured timeouts and retries
+    assert client.budget(100.0) == ((3.05, 10), 2)
+
+    # Every attempt and backoff sleep fits in the budget
+    for remaining in (1.0, 4.0, 9.0, 10.0, 20.0, 40.0):
+        (connect, read), retries = client.budget(remaining)
+        assert (retries + 1) * (connect + read) + 0.3 * (2 ** retries - 1) <= remaining + 1e-9
+
+def test_http_call_stops_within_the_budget(hanging_server, monkeypatch):
+    monkeypatch.setitem(upstream.UPSTREAM_TIMEOUTS, 'budgeted', 1.0)
+    client = upstream.UpstreamClient()
+    monkeypatch.setattr(upstream, 'client', client)
+
+    start = time.perf_counter()
+    future = upstream.submit('budgeted', upstream.get, hanging_server)
+    with pytest.raises(requests.RequestException):
+        # Wait for the call itself, not just the budget: the thread has to be free again too.
+        future.result()
+    assert time.perf_counter() - start < 2.0
+
+    client.close()
+
+def test_status_counters_are_exact_under_contention():
+    s = upstream.UpstreamStatus()
+
+    def bump():
+        for _ in range(10000):
+            s.record_ok()
+            s.record_error('boom')
+
+    threads = [threading.Thread(target=bump) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert s.as_dict()['ok'] == 80000
+    assert s.as_dict()['errors'] == 80000
+
+def test_health_reports_upstreams(app, fixtures):
+    app.calc_drive_risk(32.7555, -97.3308, 32.7357, -97.3400, DATE)
+
+    status = app.service_status()
+    assert status['upstreams']['mapbox']['ok'] >= 1
+    assert status['upstreams']['nws']['ok'] >= 1
+    assert status['connections'] == fixtures.stats()
+
+# Upstreams that answer, but only after much longer than their budgets.  Requests have to give up on them
+# within the budget (plus a second for the rest of the request), not wait for the response.
+SLOW_RESPONSE = 3.0
+
+def test_slow_nws_fails_over_to_the_default_weather_within_its_budget(app, fixtures, monkeypatch):
+    monkeypatch.setitem(upstream.UPSTREAM_TIMEOUTS, 'nws', 0.3)
+    monkeypatch.setattr(upstream, 'client', SlowUpstreams(fixtures, ('api.weather.gov',), delay=SLOW_RESPONSE))
+
+    start = time.perf_counter()
+    result = app.calc_drive_risk(32.7555, -97.3308, 32.7357, -97.3400, DATE)
+    elapsed = time.perf_counter() - start
+
+    assert result['model_inputs']['weather'] == app.DEFAULT_WEATHER
+    assert elapsed < 0.3 + 1.0
+
+def test_slow_mapbox_fails_within_its_budget(app, fixtures, monkeypatch):
+    monkeypatch.setitem(upstream.UPSTREAM_TIMEOUTS, 'mapbox', 0.3)
+    monkeypatch.setattr(upstream, 'client', SlowUpstreams(fixtures, ('api.mapbox.com',), delay=SLOW_RESPONSE))
+
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        app.calc_drive_risk(32.7555, -97.3308, 32.7357, -97.3400, DATE)
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.3 + 1.0
+    assert upstream.stats()['mapbox']['timeouts'] >= 1
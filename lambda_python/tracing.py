@@ -0,0 +1,162 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Request Tracing
+# Each request gets a Trace: wall-clock time per stage (directions, projection, curvature, weather, predict,
+# ...), counters for cache hits and misses, and how each upstream call ended.  The trace lives in a context
+# variable, so the app's functions record into whichever request they're running for, including on the
+# upstream worker threads (work submitted through submit() below carries the context along).  With no
+# trace active, recording does nothing.
+#
+# When the request finishes, the trace is written out as a single JSON log line in CloudWatch Embedded
+# Metric Format, so the numbers show up as metrics without any extra calls.  The same timings can be sent
+# back to the client in a Server-Timing header.
+
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'RoadRiskPlayground')
+
+# Add a Server-Timing header to responses
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0').lower() in ('1', 'true', 'yes')
+
+# Per-request detail (model inputs, predictions, ...) is only printed at DEBUG.
+DEBUG = os.environ.get('LOG_LEVEL', 'INFO').upper() == 'DEBUG'
+
+class Trace:
+    """
+    What happened during one request.
+
+    Args:
+        operation (str): What kind of request this is (used as the metrics dimension).
+    """
+
+    def __init__(self, operation: str = 'drive-risk'):
+        self.operation = operation
+        self.started = time.perf_counter()
+        self.timestamp = time.time()
+        self.total = None
+        self.stages = {}
+        self.counts = {}
+        self.properties = {}
+        self._lock = threading.Lock()
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def finish(self) -> "Trace":
+        if self.total is None:
+            self.total = time.perf_counter() - self.started
+        return self
+
+    def server_timing(self) -> str:
+        """
+        The stage timings as a Server-Timing header value.
+        """
+        entries = [f"{stage};dur={seconds * 1000.0:.1f}" for stage, seconds in self.stages.items()]
+        if self.total is not None:
+            entries.append(f"total;dur={self.total * 1000.0:.1f}")
+
+        return ", ".join(entries)
+
+    def emf(self) -> dict:
+        """
+        The trace as a CloudWatch Embedded Metric Format record.
+        """
+        timings = {f"{stage}_ms": seconds * 1000.0 for stage, seconds in self.stages.items()}
+        if self.total is not None:
+            timings['total_ms'] = self.total * 1000.0
+
+        metrics = [{'Name': name, 'Unit': 'Milliseconds'} for name in timings]
+        metrics += [{'Name': name, 'Unit': 'Count'} for name in self.counts]
+
+        return {
+            '_aws': {
+                'Timestamp': int(self.timestamp * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': METRICS_NAMESPACE,
+                    'Dimensions': [['Operation']],
+                    'Metrics': metrics,
+                }],
+            },
+            'Operation': self.operation,
+            **timings,
+            **self.counts,
+            **self.properties,
+        }
+
+_current = contextvars.ContextVar('trace', default=None)
+
+def current() -> Trace | None:
+    return _current.get()
+
+def start(operation: str = 'drive-risk') -> Trace:
+    trace = Trace(operation)
+    _current.set(trace)
+    return trace
+
+def finish(emit: bool = True) -> Trace | None:
+    """
+    Ends the current request's trace and, by default, logs it.
+    """
+    trace = _current.get()
+    if trace is None:
+        return None
+
+    trace.finish()
+    _current.set(None)
+    if emit:
+        print(json.dumps(trace.emf()))
+
+    return trace
+
+def set_operation(operation: str) -> None:
+    trace = _current.get()
+    if trace is not None:
+        trace.operation = operation
+
+def annotate(name: str, value) -> None:
+    """
+    Adds a (non-metric) property to the log line, such as how an upstream call ended.
+    """
+    trace = _current.get()
+    if trace is not None:
+        with trace._lock:
+            trace.properties[name] = value
+
+def count(name: str, n: int = 1) -> None:
+    trace = _current.get()
+    if trace is not None:
+        trace.count(name, n)
+
+def cache_lookup(cache_name: str, hit: bool) -> None:
+    count(f"{cache_name}_cache_{'hits' if hit else 'misses'}")
+
+@contextmanager
+def stage(name: str):
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_time(name, time.perf_counter() - began)
+
+def submit(executor, fn, *args, **kwargs):
+    """
+    executor.submit(), with the current trace carried over to the worker thread.
+    """
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+def debug(message: str) -> None:
+    if DEBUG:
+        print(message)
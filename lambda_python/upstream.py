@@ -0,0 +1,310 @@
+import contextvars
+import os
+import threading
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import tracing
+
+# Upstream I/O
+# The Mapbox and NWS lookups for a request don't depend on each other, so they are run concurrently.  Each
+# upstream gets its own bounded thread pool, its own timeout and its own success/failure/timeout counters, so
+# a slow NWS response can be cut off (and the request answered with a fallback) without holding up the rest.
+# A call that times out keeps its thread until it finishes; with separate pools, a backlog of slow NWS calls
+# can only starve further NWS calls, never the Mapbox ones.
+
+# Threads per upstream
+UPSTREAM_MAX_WORKERS = int(os.environ.get('UPSTREAM_MAX_WORKERS', '8'))
+
+# Seconds to wait on each upstream before giving up on it
+UPSTREAM_TIMEOUTS = {
+    'mapbox': float(os.environ.get('MAPBOX_TIMEOUT', '10')),
+    'nws': float(os.environ.get('NWS_TIMEOUT', '4')),
+}
+DEFAULT_TIMEOUT = 10.0
+
+_RAISE = object()
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+def executor(name: str) -> ThreadPoolExecutor:
+    """
+    The thread pool for one upstream, created on first use.
+    """
+    with _executors_lock:
+        pool = _executors.get(name)
+        if pool is None:
+            pool = _executors[name] = ThreadPoolExecutor(max_workers=UPSTREAM_MAX_WORKERS, thread_name_prefix=f"upstream-{name}")
+        return pool
+
+class UpstreamStatus:
+    """
+    Counters for one upstream.  They're updated from the pool threads and the request threads, so every
+    change goes through the lock.
+    """
+
+    def __init__(self):
+        self.ok = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.last_latency = None
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    def record_ok(self) -> None:
+        with self._lock:
+            self.ok += 1
+
+    def record_error(self, error: str) -> None:
+        with self._lock:
+            self.errors += 1
+            self.last_error = error
+
+    def record_timeout(self, error: str) -> None:
+        with self._lock:
+            self.timeouts += 1
+            self.last_error = error
+
+    def record_latency(self, seconds: float) -> None:
+        with self._lock:
+            self.last_latency = seconds
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                'ok': self.ok,
+                'errors': self.errors,
+                'timeouts': self.timeouts,
+                'last_latency': self.last_latency,
+                'last_error': self.last_error,
+            }
+
+_status = {}
+_status_lock = threading.Lock()
+
+def status(name: str) -> UpstreamStatus:
+    with _status_lock:
+        return _status.setdefault(name, UpstreamStatus())
+
+def stats() -> dict:
+    with _status_lock:
+        statuses = dict(_status)
+
+    return {name: s.as_dict() for name, s in statuses.items()}
+
+# When the call running in this context has to be finished by (perf_counter() seconds).  The HTTP client
+# reads it to fit its timeouts and retries into what's left of the budget.
+_deadline = contextvars.ContextVar('upstream_deadline', default=None)
+
+def remaining() -> float | None:
+    """
+    Seconds left of the current upstream call's budget, or None outside of one.
+    """
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.perf_counter()
+
+def _timed(name: str, deadline: float, fn, args, kwargs):
+    _deadline.set(deadline)
+    start = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        status(name).record_latency(time.perf_counter() - start)
+
+def submit(name: str, fn, *args, **kwargs):
+    """
+    Start an upstream call on that upstream's pool and return its Future.  The call's HTTP requests have to
+    fit in the upstream's configured timeout, counted from now.
+    """
+    submitted_at = time.perf_counter()
+    deadline = submitted_at + UPSTREAM_TIMEOUTS.get(name, DEFAULT_TIMEOUT)
+
+    future = tracing.submit(executor(name), _timed, name, deadline, fn, args, kwargs)
+    future.submitted_at = submitted_at
+
+    return future
+
+def result(name: str, future, timeout: float | None = None, default=_RAISE):
+    """
+    Wait for an upstream call started with submit().
+
+    Args:
+        name (str): The upstream, used for its timeout and counters.
+        future: The Future returned by submit().
+        timeout (float | None): Seconds allowed since the call was submitted.  Defaults to the upstream's
+            configured timeout.
+        default: Returned if the call fails or times out.  If not given, the error is raised instead.
+    """
+    if timeout is None:
+        timeout = UPSTREAM_TIMEOUTS.get(name, DEFAULT_TIMEOUT)
+
+    # The budget runs from when the call started, not from when we got around to waiting on it.
+    remaining = max(timeout - (time.perf_counter() - future.submitted_at), 0.0)
+
+    s = status(name)
+    try:
+        value = future.result(timeout=remaining)
+    except FutureTimeoutError:
+        # A call still queued behind busy threads is dropped.  One that started keeps running in the
+        # background, so whatever it fetches still lands in the caches.
+        future.cancel()
+        s.record_timeout(f"timed out after {timeout}s")
+        tracing.annotate(f"upstream_{name}", 'timeout')
+        print(f"Upstream '{name}' timed out after {timeout}s")
+        if default is _RAISE:
+            raise TimeoutError(f"Upstream '{name}' timed out after {timeout}s")
+        return default
+    except Exception as e:
+        s.record_error(repr(e))
+        tracing.annotate(f"upstream_{name}", 'error')
+        print(f"Upstream '{name}' failed: {e!r}")
+        if default is _RAISE:
+            raise
+        return default
+
+    s.record_ok()
+    tracing.annotate(f"upstream_{name}", 'ok')
+    return value
+
+# HTTP Client
+# All upstream HTTP goes through one module-level client.  It keeps a keep-alive Session per host, so warm
+# Lambda invocations and Flask requests reuse open TCP/TLS connections instead of handshaking every time.
+# Every call gets connect/read timeouts, and idempotent GETs are retried a bounded number of times with
+# exponential backoff on connection errors and 429/5xx responses.
+#
+# Inside a call started with submit(), the timeouts and retries are cut to fit what's left of the upstream's
+# budget: retries are dropped until each attempt gets at least UPSTREAM_MIN_ATTEMPT seconds, and each
+# attempt's connect/read timeouts are scaled down to its share.  A 4 s NWS budget gets one attempt with
+# timeouts adding up to 4 s, rather than three attempts of 3.05 + 10 s.  Retry-After isn't honoured there,
+# since it could ask for a longer wait than the budget has left.
+
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', '3.05'))
+UPSTREAM_READ_TIMEOUT = float(os.environ.get('UPSTREAM_READ_TIMEOUT', '10'))
+UPSTREAM_RETRIES = int(os.environ.get('UPSTREAM_RETRIES', '2'))
+UPSTREAM_BACKOFF = float(os.environ.get('UPSTREAM_BACKOFF', '0.3'))
+UPSTREAM_MIN_ATTEMPT = float(os.environ.get('UPSTREAM_MIN_ATTEMPT', '4'))
+UPSTREAM_POOL_SIZE = int(os.environ.get('UPSTREAM_POOL_SIZE', str(UPSTREAM_MAX_WORKERS)))
+
+# NWS asks every client to identify itself.
+USER_AGENT = os.environ.get('UPSTREAM_USER_AGENT', 'road-risk-playground')
+
+class UpstreamClient:
+    """
+    Pooled, keep-alive HTTP sessions, one per host (and retry count).
+
+    Args:
+        connect_timeout (float): Seconds allowed to open a connection.
+        read_timeout (float): Seconds allowed between bytes of the response.
+        retries (int): Retries for connection errors and retryable statuses on GET.
+        backoff (float): Backoff factor between retries (0.3 -> 0.3s, 0.6s, 1.2s, ...).
+        pool_size (int): Connections kept open per host.
+    """
+
+    def __init__(self, connect_timeout: float = UPSTREAM_CONNECT_TIMEOUT, read_timeout: float = UPSTREAM_READ_TIMEOUT,
+                 retries: int = UPSTREAM_RETRIES, backoff: float = UPSTREAM_BACKOFF, pool_size: int = UPSTREAM_POOL_SIZE):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _new_session(self, retries: int | None = None) -> requests.Session:
+        retry = Retry(
+            total=self.retries if retries is None else retries,
+            backoff_factor=self.backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({'GET'}),
+            respect_retry_after_header=retries is None,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['User-Agent'] = USER_AGENT
+
+        return session
+
+    def session(self, host: str, retries: int | None = None) -> requests.Session:
+        """
+        The session for a host.  With retries, one that retries that many times (for budgeted calls).
+        """
+        with self._lock:
+            session = self._sessions.get((host, retries))
+            if session is None:
+                session = self._sessions[(host, retries)] = self._new_session(retries)
+            return session
+
+    def budget(self, remaining: float) -> tuple[tuple[float, float], int]:
+        """
+        The (connect, read) timeouts and retry count for a call that has to finish within remaining seconds,
+        counting the backoff sleeps between attempts.
+        """
+        for retries in range(self.retries, -1, -1):
+            share = (remaining - self.backoff * (2 ** retries - 1)) / (retries + 1)
+            if share >= UPSTREAM_MIN_ATTEMPT:
+                break
+
+        connect, read = self.timeout
+        scale = min(max(share, 0.0) / (connect + read), 1.0)
+
+        return (connect * scale, read * scale), retries
+
+    def get(self, url: str, timeout=None, **kwargs) -> requests.Response:
+        host = urlsplit(url).netloc
+
+        retries = None
+        left = remaining()
+        if timeout is None and left is not None:
+            if left <= 0.0:
+                raise requests.Timeout(f"No time left in the budget to call {host}")
+            timeout, retries = self.budget(left)
+
+        return self.session(host, retries).get(url, timeout=timeout or self.timeout, **kwargs)
+
+    def stats(self) -> dict:
+        """
+        Connection reuse per host: how many requests went out, and how many new connections that took.
+        """
+        report = {}
+        with self._lock:
+            sessions = dict(self._sessions)
+
+        counts = {}
+        for (host, _), session in sessions.items():
+            pools = session.get_adapter('https://').poolmanager.pools
+            num_requests, num_connections = counts.get(host, (0, 0))
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    num_requests += pool.num_requests
+                    num_connections += pool.num_connections
+            counts[host] = (num_requests, num_connections)
+
+        for host, (num_requests, num_connections) in counts.items():
+            report[host] = {
+                'requests': num_requests,
+                'connections': num_connections,
+                'reused': max(num_requests - num_connections, 0),
+                'reuse_rate': 1.0 - num_connections / num_requests if num_requests else 0.0,
+            }
+
+        return report
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+client = UpstreamClient()
+
+def get(url: str, **kwargs) -> requests.Response:
+    return client.get(url, **kwargs)
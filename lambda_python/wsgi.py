@@ -0,0 +1,17 @@
+import gc
+
+import app as service
+
+# WSGI Entry Point
+# For a pre-fork server (gunicorn.conf.py sets preload_app), this module is imported once in the master
+# process: the model, the timezone data and the holiday tables are loaded there, and every worker forked
+# afterwards shares those pages copy-on-write instead of loading its own copy.
+#
+#   gunicorn -c gunicorn.conf.py wsgi:application
+
+service._init()
+application = service.create_app()
+
+# Everything loaded so far lives for the life of the process.  Moving it out of the garbage collector's
+# generations keeps collections in the workers from writing to (and so copying) the shared pages.
+gc.freeze()
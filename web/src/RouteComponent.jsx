@@ -72,7 +72,7 @@ export default function RouteComponent({ origin, destination, travelDateTime, se
         console.log("data: ", data);
         setModelInputs(data.model_inputs);
         setPrediction(data.prediction);
-        setRouteData(data.mapbox_data.routes[0].geometry);
+        setRouteData(data.geometry ?? data.mapbox_data.routes[0].geometry);
       } catch (error) {
         console.error("Error calling prediction model:", error);
       }